@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Benchmark JPEG encode time per backend, input format, quality and resolution.
+
+Usage:
+    python3 benchmarks/bench_encoders.py [--repeat 50] [--qualities 50,70,85,95] [--subsampling 420]
+                                         [--frames video.mp4] [--json out.json]
+"""
+import argparse
+
+import cv2
+
+from common import RESOLUTIONS, synthetic_frame, recorded_frames, timed, write_json
+from raspi_tank.streaming.encoders import BACKENDS, available_backends
+
+QUALITIES = [50, 70, 85, 95]
+
+def bench_encoder(encoder, frame, repeat, quality=None):
+    stats, data = timed(lambda: encoder.encode(frame, quality), repeat)
+    stats['bytes'] = len(data)
+    return stats
+
+def run(repeat=50, qualities=QUALITIES, subsampling='420', resolutions=RESOLUTIONS, source=None):
+    """Return one result dict per (backend, format, quality, resolution).
+    source: a recorded frame to scale to each resolution instead of the synthetic one.
+    """
+    results = []
+    for width, height in resolutions:
+        if source is not None:
+            bgr = cv2.resize(source, (width, height), interpolation=cv2.INTER_AREA)
+        else:
+            bgr = synthetic_frame(width, height)
+        i420 = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)
+        for name in available_backends():
+            encoder = BACKENDS[name](qualities[0], subsampling)
+            for fmt, frame in (('BGR', bgr), ('YUV420', i420)):
+                for quality in qualities:
+                    r = bench_encoder(encoder, frame, repeat, quality)
+                    r.update({'backend': name, 'format': fmt, 'quality': quality,
+                              'resolution': '%dx%d' % (width, height)})
+                    results.append(r)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--qualities', default=','.join(map(str, QUALITIES)), help='comma-separated JPEG qualities')
+    parser.add_argument('--subsampling', default='420', choices=['420', '422', '444'])
+    parser.add_argument('--frames', help='video file or image directory to take the test frame from')
+    parser.add_argument('--json', help='write the results here')
+    args = parser.parse_args()
+
+    source = recorded_frames(args.frames, 1)[0] if args.frames else None
+    results = run(args.repeat, [int(q) for q in args.qualities.split(',')], args.subsampling, source=source)
+    print('%-10s %-7s %-10s %4s %9s %9s %9s %8s' % ('backend', 'format', 'resolution', 'q', 'mean ms', 'p50 ms', 'min ms', 'KiB'))
+    for r in results:
+        print('%-10s %-7s %-10s %4d %9.2f %9.2f %9.2f %8.1f' % (
+            r['backend'], r['format'], r['resolution'], r['quality'], r['mean_ms'], r['p50_ms'], r['min_ms'],
+            r['bytes'] / 1024.0))
+    if args.json:
+        write_json(args.json, {'encoders': results})
+
+if __name__ == '__main__':
+    main()
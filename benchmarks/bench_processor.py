@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""Benchmark FrameProcessor.analyze as a whole and per sub-step, per resolution and input format.
+
+The sub-steps are the ones analyze() itself times (raspitank_analyze_seconds): grayscale, qr
+(the configured mode; fast mode amortizes its decimated search over frames), overlay (text and
+QR outline), canny and thumbnail (edge thumbnail blend); qr_full is the qr step in full-frame
+(detectAndDecode) mode.
+
+Usage:
+    python3 benchmarks/bench_processor.py [--repeat 50] [--frames video.mp4] [--json out.json]
+"""
+import argparse
+
+import cv2
+
+from common import RESOLUTIONS, synthetic_frame, recorded_frames, timed, summarize, write_json
+from raspi_tank.sensors.snapshot import EMPTY_SNAPSHOT
+from raspi_tank.vision.processor import FrameProcessor, _STEPS
+
+SNAPSHOT = EMPTY_SNAPSHOT._replace(seq=1, front=32.5)  # below the threshold: the obstacle overlay is drawn
+
+def _cycle(frames, repeat):
+    """repeat frames, cycling through the given ones."""
+    return [frames[i % len(frames)] for i in range(repeat)]
+
+def _step_sums():
+    return {name: h.sum for name, h in _STEPS.items()}
+
+def bench_steps(frames, repeat):
+    """Per-step timings of real analyze() calls on copies of frames (BGR or I420), read from the
+    sub-step histograms it observes (raspitank_analyze_seconds): each call adds its own duration
+    to every step's sum. qr_full is the qr step of a processor in full-frame mode.
+    """
+    processor, full = FrameProcessor(), FrameProcessor()
+    full.qr_mode = 'full'
+    steps = {name: [] for name in ('grayscale', 'qr', 'qr_full', 'overlay', 'canny', 'thumbnail')}
+    for frame in _cycle(frames, repeat):
+        for p in (processor, full):
+            before = _step_sums()
+            p.analyze(frame.copy(), SNAPSHOT)
+            after = _step_sums()
+            if p is full:
+                steps['qr_full'].append(after['qr'] - before['qr'])
+                continue
+            for name in _STEPS:
+                steps[name].append(after[name] - before[name])
+    return {name: summarize(times) for name, times in steps.items()}
+
+def bench_analyze(frames, repeat):
+    """Whole analyze() calls; frames are copied outside the timed region (analyze draws in place)."""
+    processor = FrameProcessor()
+    copies = [f.copy() for f in _cycle(frames, repeat + 1)]
+    it = iter(copies)
+    stats, _ = timed(lambda: processor.analyze(next(it), SNAPSHOT), repeat)
+    return stats
+
+def run(repeat=50, resolutions=RESOLUTIONS, sources=None):
+    """One result per (resolution, format) with 'analyze' and per-step timings.
+    sources: recorded BGR frames, scaled to each resolution, instead of the synthetic one.
+    """
+    results = []
+    for width, height in resolutions:
+        if sources:
+            bgr = [cv2.resize(f, (width, height), interpolation=cv2.INTER_AREA) for f in sources]
+        else:
+            bgr = [synthetic_frame(width, height, qr='RaspiTank')]
+        i420 = [cv2.cvtColor(f, cv2.COLOR_BGR2YUV_I420) for f in bgr]
+        for fmt, frames in (('BGR', bgr), ('YUV420', i420)):
+            r = {'resolution': '%dx%d' % (width, height), 'format': fmt,
+                 'analyze': bench_analyze(frames, repeat), 'steps': bench_steps(frames, repeat)}
+            results.append(r)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--frames', help='video file or image directory to use instead of the synthetic frame')
+    parser.add_argument('--json', help='write the results here')
+    args = parser.parse_args()
+
+    sources = recorded_frames(args.frames) if args.frames else None
+    results = run(args.repeat, sources=sources)
+    steps = list(results[0]['steps'])
+    print('%-10s %-7s %9s ' % ('resolution', 'format', 'analyze') + ' '.join('%9s' % s for s in steps) + '   (p50 ms)')
+    for r in results:
+        print('%-10s %-7s %9.2f ' % (r['resolution'], r['format'], r['analyze']['p50_ms']) +
+              ' '.join('%9.2f' % r['steps'][s]['p50_ms'] for s in steps))
+    if args.json:
+        write_json(args.json, {'processor': results})
+
+if __name__ == '__main__':
+    main()
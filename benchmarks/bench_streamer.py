@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Benchmark end-to-end MJPEGStreamer throughput with 1, 4 and 16 concurrent local clients.
+
+A real CameraWorker replays synthetic (or recorded) frames in a loop at --fps through the
+normal capture/analyze pipeline; the streamer serves them on a local port and every client
+reads /video_feed for --duration seconds. Reported per client count: frames/s and MB/s per
+client, the encoder's rate, the process CPU time per delivered frame and the capture-to-receive
+latency (from each part's X-Capture-Timestamp header to its arrival at the client).
+
+Usage:
+    python3 benchmarks/bench_streamer.py [--clients 1,4,16] [--duration 5] [--fps 30]
+                                         [--server flask|asyncio] [--frames video.mp4] [--json out.json]
+"""
+import argparse
+import logging
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+
+import cv2
+
+from common import synthetic_frame, recorded_frames, write_json
+from raspi_tank.config import camera as camera_conf
+from raspi_tank.recorder.replay import ReplayClock, ReplayFrames
+from raspi_tank.streaming import MJPEGStreamer
+from raspi_tank.vision.camera import CameraWorker
+
+BOUNDARY = b'--frame\r\n'
+STAMP = re.compile(rb'X-Frame-Seq: (\d+)\r\nX-Capture-Timestamp: ([\d.]+)\r\n')
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def _wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError('streamer did not start on port %d' % port)
+
+class _Client(threading.Thread):
+    """Reads /video_feed until the deadline, counting multipart parts and bytes."""
+    def __init__(self, port, query, warmup_until, deadline):
+        super().__init__(daemon=True)
+        self.port = port
+        self.query = query
+        self.warmup_until = warmup_until
+        self.deadline = deadline
+        self.frames = 0
+        self.bytes = 0
+        self.latencies = []  # capture-to-receive, ms
+        self.error = None
+
+    def run(self):
+        try:
+            sock = socket.create_connection(('127.0.0.1', self.port), 5.0)
+            sock.sendall(b'GET /video_feed%s HTTP/1.1\r\nHost: localhost\r\n\r\n' % self.query.encode())
+            tail = stamp_tail = b''
+            last_seq = 0
+            while True:
+                now = time.monotonic()
+                if now >= self.deadline:
+                    break
+                chunk = sock.recv(262144)
+                if not chunk:
+                    break
+                if now < self.warmup_until:
+                    continue
+                received = time.time()
+                data = tail + chunk
+                self.frames += data.count(BOUNDARY)
+                self.bytes += len(chunk)
+                tail = data[-(len(BOUNDARY) - 1):]
+                # a header split across reads is matched on the next one; seq skips the ones seen already
+                stamped = stamp_tail + chunk
+                for seq, stamp in STAMP.findall(stamped):
+                    if int(seq) > last_seq:
+                        last_seq = int(seq)
+                        self.latencies.append((received - float(stamp)) * 1000.0)
+                stamp_tail = stamped[-80:]
+            sock.close()
+        except Exception as e:
+            self.error = str(e)
+
+def bench_clients(streamer, port, clients, duration, query='', warmup=1.0):
+    start = time.monotonic()
+    warmup_until = start + warmup
+    deadline = warmup_until + duration
+    encoded0 = streamer.broadcaster.encoded_count
+    threads = [_Client(port, query, warmup_until, deadline) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(max(0.0, warmup_until - time.monotonic()))
+    cpu0 = time.process_time()
+    encoded1 = streamer.broadcaster.encoded_count
+    for t in threads:
+        t.join(duration + 10.0)
+    cpu = time.process_time() - cpu0
+    encoded = streamer.broadcaster.encoded_count - encoded1
+    fps = [t.frames / duration for t in threads]
+    delivered = sum(t.frames for t in threads)
+    latencies = sorted(ms for t in threads for ms in t.latencies)
+    return {
+        'clients': clients,
+        'fps_mean': round(sum(fps) / len(fps), 2),
+        'fps_min': round(min(fps), 2),
+        'mbps_per_client': round(sum(t.bytes for t in threads) / len(threads) / duration / 1e6, 3),
+        'total_frames_per_s': round(delivered / duration, 1),
+        'encodes_per_s': round(encoded / duration, 1),
+        'cpu_ms_per_frame': round(cpu / delivered * 1000, 3) if delivered else None,
+        'latency_p50_ms': round(latencies[len(latencies) // 2], 2) if latencies else None,
+        'latency_p95_ms': round(latencies[int(len(latencies) * 0.95)], 2) if latencies else None,
+        'errors': [t.error for t in threads if t.error],
+        'warmup_encodes': encoded1 - encoded0
+    }
+
+def run(client_counts=(1, 4, 16), duration=5.0, fps=30, server='flask', sources=None, query=''):
+    camera_conf['stream_server'] = server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # no access log line per client
+    with tempfile.TemporaryDirectory() as tmp:
+        width, height = camera_conf['resolution']
+        frames = sources or [synthetic_frame(width, height, seed=i, qr='RaspiTank') for i in range(8)]
+        for i, frame in enumerate(frames):
+            cv2.imwrite(os.path.join(tmp, '%04d.png' % i), frame)
+        camera = CameraWorker(replay=ReplayFrames(tmp, ReplayClock(1.0), fps=fps, loop=True))
+        cam_thread = threading.Thread(name='CameraThread', target=camera.start, daemon=True)
+        cam_thread.start()
+        port = _free_port()
+        streamer = MJPEGStreamer(camera, host='127.0.0.1', port=port)
+        streamer.start()
+        _wait_for_port(port)
+        results = []
+        try:
+            for clients in client_counts:
+                r = bench_clients(streamer, port, clients, duration, query)
+                r.update({'server': server, 'source_fps': fps, 'resolution': '%dx%d' % (width, height)})
+                results.append(r)
+                time.sleep(0.5)  # let the previous clients' handlers finish
+        finally:
+            streamer.stop()
+            camera.stop()
+            cam_thread.join(5.0)
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', default='1,4,16', help='comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds measured per client count')
+    parser.add_argument('--fps', type=float, default=30, help='replayed camera frame rate')
+    parser.add_argument('--server', default='flask', choices=['flask', 'asyncio'])
+    parser.add_argument('--query', default='', help="video_feed query string, e.g. '?width=320&q=60'")
+    parser.add_argument('--frames', help='video file or image directory to replay instead of synthetic frames')
+    parser.add_argument('--json', help='write the results here')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    sources = recorded_frames(args.frames, 30) if args.frames else None
+    results = run([int(c) for c in args.clients.split(',')], args.duration, args.fps, args.server, sources, args.query)
+    print('%-8s %7s %9s %8s %10s %9s %10s %10s %10s' % ('server', 'clients', 'fps/cli', 'min fps', 'MB/s/cli',
+          'encode/s', 'cpu ms/fr', 'lat p50', 'lat p95'))
+    for r in results:
+        print('%-8s %7d %9.1f %8.1f %10.2f %9.1f %10s %10s %10s' % (r['server'], r['clients'], r['fps_mean'], r['fps_min'],
+              r['mbps_per_client'], r['encodes_per_s'], r['cpu_ms_per_frame'], r['latency_p50_ms'], r['latency_p95_ms']))
+    if args.json:
+        write_json(args.json, {'streamer': results})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""Shared helpers for the benchmarks: test frames, timing statistics and JSON results."""
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720)]
+
+def synthetic_frame(width, height, seed=0, qr=None):
+    """Camera-like BGR test frame: smooth gradients, a few shapes, text and mild sensor noise.
+    qr: text of a QR code to place in the frame (so the decoder has something to find).
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[..., 0] = (x * 0.6 + y * 0.4).astype(np.uint8)
+    frame[..., 1] = (255 - x * 0.5).astype(np.uint8)
+    frame[..., 2] = (y * 0.8).astype(np.uint8)
+    for i in range(8):
+        c = tuple(int(v) for v in rng.integers(0, 255, 3))
+        p = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(frame, p, int(rng.integers(10, height // 4)), c, -1)
+    cv2.putText(frame, 'RaspiTank 12.3 cm', (10, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    if qr:
+        code = cv2.QRCodeEncoder.create().encode(qr)
+        side = height // 3
+        code = cv2.resize(code, (side, side), interpolation=cv2.INTER_NEAREST)
+        pad = side // 8
+        x0, y0 = width - side - 2 * pad, height - side - 2 * pad
+        frame[y0:y0 + side + 2 * pad, x0:x0 + side + 2 * pad] = 255  # quiet zone
+        frame[y0 + pad:y0 + pad + side, x0 + pad:x0 + pad + side] = code[..., None]
+    noise = rng.integers(-6, 7, frame.shape, dtype=np.int16)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+def recorded_frames(path, limit=100):
+    """Up to limit BGR frames of a video file or an image directory (see raspi_tank.recorder.replay)."""
+    from raspi_tank.recorder.replay import ReplayClock, ReplayFrames
+    source = ReplayFrames(path, ReplayClock(0))
+    frames = []
+    while len(frames) < limit:
+        frame, _ = source.read()
+        if frame is None:
+            break
+        frames.append(frame)
+    source.close()
+    if not frames:
+        raise ValueError('%s: no frames' % path)
+    return frames
+
+def summarize(times):
+    """Timing statistics in milliseconds for a list of durations in seconds."""
+    times = sorted(times)
+    n = len(times)
+    return {
+        'mean_ms': round(sum(times) / n * 1000, 3),
+        'p50_ms': round(times[n // 2] * 1000, 3),
+        'p95_ms': round(times[min(n - 1, int(n * 0.95))] * 1000, 3),
+        'min_ms': round(times[0] * 1000, 3)
+    }
+
+def timed(fn, repeat, warmup=1):
+    """Call fn() warmup + repeat times; returns the summary of the timed calls and the last result."""
+    for _ in range(warmup):
+        out = fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        times.append(time.perf_counter() - t0)
+    return summarize(times), out
+
+def environment():
+    """What the numbers depend on: commit, interpreter, OpenCV build, machine."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+def write_json(path, suites):
+    """Write {'environment': ..., 'suites': {name: [results]}} to path."""
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'suites': suites}, f, indent=2)
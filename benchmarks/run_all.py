@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Run every benchmark suite headless and write one JSON file; optionally compare with a baseline.
+
+Usage:
+    python3 benchmarks/run_all.py --json results/HEAD.json [--quick] [--frames video.mp4]
+    python3 benchmarks/run_all.py --json new.json --baseline old.json [--threshold 0.15]
+    python3 benchmarks/run_all.py --compare old.json new.json
+
+With a baseline, every timing that got slower (or rate that got lower) by more than the
+threshold is listed and the exit status is 1, so the script can gate a commit.
+"""
+import argparse
+import json
+import logging
+import sys
+
+from common import recorded_frames, write_json
+import bench_encoders
+import bench_processor
+import bench_streamer
+
+# result fields that identify a row rather than measure it
+KEY_FIELDS = ('backend', 'format', 'quality', 'resolution', 'server', 'clients', 'source_fps')
+
+def run(quick=False, frames=None, server='flask'):
+    sources = recorded_frames(frames) if frames else None
+    repeat = 10 if quick else 50
+    return {
+        'processor': bench_processor.run(repeat, sources=sources),
+        'encoders': bench_encoders.run(repeat, source=sources[0] if sources else None),
+        'streamer': bench_streamer.run((1, 4, 16), 2.0 if quick else 5.0, server=server, sources=sources)
+    }
+
+def _metrics(suites):
+    """{(suite, row key, metric path): value} for every number that measures something."""
+    out = {}
+    for suite, rows in suites.items():
+        for row in rows:
+            key = tuple('%s=%s' % (f, row[f]) for f in KEY_FIELDS if f in row)
+            stack = [((), row)]
+            while stack:
+                path, node = stack.pop()
+                for name, value in node.items():
+                    if name in KEY_FIELDS and not path:
+                        continue
+                    if isinstance(value, dict):
+                        stack.append((path + (name,), value))
+                    elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                        out[(suite, key, '.'.join(path + (name,)))] = value
+    return out
+
+def _lower_is_better(metric):
+    return metric.endswith('_ms') or metric.endswith('cpu_ms_per_frame')
+
+def _higher_is_better(metric):
+    return metric.startswith('fps') or metric.endswith('per_s') or metric.startswith('mbps')
+
+def compare(baseline, current, threshold=0.15):
+    """Regressions beyond threshold (relative), as (suite, key, metric, old, new, change) tuples."""
+    old, new = _metrics(baseline['suites']), _metrics(current['suites'])
+    regressions = []
+    for k in sorted(set(old) & set(new)):
+        a, b = old[k], new[k]
+        if not a:
+            continue
+        change = (b - a) / abs(a)
+        metric = k[2]
+        if metric.endswith('min_ms'):
+            continue  # too noisy to gate on
+        if (_lower_is_better(metric) and change > threshold) or (_higher_is_better(metric) and change < -threshold):
+            regressions.append(k + (a, b, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--json', help='write the results here')
+    parser.add_argument('--quick', action='store_true', help='fewer repetitions and shorter streaming runs')
+    parser.add_argument('--frames', help='video file or image directory to use instead of synthetic frames')
+    parser.add_argument('--server', default='flask', choices=['flask', 'asyncio'])
+    parser.add_argument('--baseline', help='results JSON to compare the new run with')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='only compare two results files')
+    parser.add_argument('--threshold', type=float, default=0.15, help='relative change that counts as a regression')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            baseline = json.load(f)
+        with open(args.compare[1]) as f:
+            current = json.load(f)
+    else:
+        suites = run(args.quick, args.frames, args.server)
+        if args.json:
+            write_json(args.json, suites)
+            with open(args.json) as f:
+                current = json.load(f)
+        else:
+            current = {'suites': suites}
+            print(json.dumps(suites, indent=2))
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+    if baseline is None:
+        return 0
+
+    regressions = compare(baseline, current, args.threshold)
+    print('Compared with %s: %d regression(s) beyond %d%%' % (
+        baseline.get('environment', {}).get('commit'), len(regressions), args.threshold * 100))
+    for suite, key, metric, a, b, change in regressions:
+        print('  %-10s %-55s %-22s %10.3f -> %10.3f (%+.0f%%)' % (suite, ' '.join(key), metric, a, b, change * 100))
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,27 +4,40 @@ import threading
 import logging
 from time import sleep
 
-from raspi_tank.motors import Motor
+from raspi_tank.motors import Motor, MotorArbiter
 from raspi_tank.sensors.i2c_multiplexer import I2CMultiplexer
 from raspi_tank.vision.camera import CameraWorker
 from raspi_tank.streaming import MJPEGStreamer
 from raspi_tank.controller import Watchdog
-from raspi_tank.config import camera as camera_conf
+from raspi_tank.recorder import FlightRecorder
+from raspi_tank.recorder.replay import from_config as replay_sources
+from raspi_tank.config import camera as camera_conf, recorder as recorder_conf
 
 logging.basicConfig(level=logging.INFO, format='%(levelname)s | %(threadName)s | %(message)s')
 
 if __name__ == '__main__':
     logging.info('Starting RaspiTank Controller')
 
-    motor = Motor()
+    # one thread owns the motor: operator commands are queued and coalesced, watchdog stops go first
+    motor = MotorArbiter(Motor())
+
+    # Replay sources (recorded video and sensor logs instead of the hardware)
+    replay_frames, replay_sensors = replay_sources()
+
+    # Flight recorder (sensor samples, commands, watchdog stops, frame metadata);
+    # off while replaying sensors, so a replay never rotates away the recording it reads
+    recorder = None
+    if recorder_conf.get('enabled', False) and replay_sensors is None:
+        recorder = FlightRecorder()
+        recorder.start()
 
     # Start I2C sensors (multiplexer handles sensors internally)
-    i2c_mux = I2CMultiplexer()
+    i2c_mux = I2CMultiplexer(recorder=recorder, replay=replay_sensors)
     i2c_thread = threading.Thread(name='I2CThread', target=i2c_mux.start, daemon=True)
     i2c_thread.start()
 
     # Camera + processing
-    camera = CameraWorker(i2c_mux)
+    camera = CameraWorker(i2c_mux, recorder=recorder, replay=replay_frames)
     cam_thread = threading.Thread(name='CameraThread', target=camera.start, daemon=True)
     cam_thread.start()
 
@@ -36,13 +49,14 @@ if __name__ == '__main__':
             sensors=i2c_mux,
             motor=motor,
             host=camera_conf.get('stream_host', '0.0.0.0'),
-            port=camera_conf.get('stream_port', 5000)
+            port=camera_conf.get('stream_port', 5000),
+            recorder=recorder
         )
         streamer.start()
         logging.info('MJPEG stream available at http://<raspberry-pi-ip>:%d', camera_conf['stream_port'])
 
     # Watchdog thread to enforce safety
-    watchdog = Watchdog(motor, i2c_mux, camera)
+    watchdog = Watchdog(motor, i2c_mux, camera, recorder=recorder)
     wd_thread = threading.Thread(name='Watchdog', target=watchdog.run, daemon=True)
     wd_thread.start()
 
@@ -53,8 +67,10 @@ if __name__ == '__main__':
         logging.info('Stopping...')
         camera.stop()
         i2c_mux.stop()
-        motor.stop()
+        motor.close()
         if streamer:
             streamer.stop()
+        if recorder:
+            recorder.stop()
         sleep(0.5)
         logging.info('Exited')
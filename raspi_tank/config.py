@@ -3,21 +3,122 @@
 camera = {
     'resolution': (640, 480),
     'framerate': 30,
+    'frame_slots': 3,  # preallocated frame buffers shared copy-free between capture and readers
+    'pipeline_queue_size': 2,  # frames buffered between the capture and analyze stages
+    'pipeline_overflow': 'drop_oldest',  # 'drop_oldest', 'latest_only' or 'drop_newest'
+    'analysis_workers': 0,  # >0 runs FrameProcessor.analyze in that many processes (shared-memory frames)
     'show_window': False,  # uses cv2.imshow -> requires X11/XQuartz forwarding to mac, set False for headless
     'enable_mjpeg_stream': True,  # enable Flask MJPEG streaming on port 5000
     'stream_host': '0.0.0.0',
-    'stream_port': 5000
+    'stream_port': 5000,
+    'stream_server': 'flask',  # 'flask' (thread per client) or 'asyncio' (one event loop serves every client)
+    'jpeg_quality': 85,  # encoded once per frame and shared by all /video_feed viewers; upper quality bound
+    'stream_quality_min': 40,  # per-client adaptive quality lower bound
+    'stream_quality_step': 10,  # quality change per adaptation step (fewer distinct qualities = more sharing)
+    'stream_fps_min': 5,  # per-client adaptive frame rate bounds
+    'stream_fps_max': 30,
+    'stream_max_frame_age_s': 0.5,  # frames older than this are dropped instead of sent
+    'stream_socket_sndbuf': 65536,  # per-client kernel send buffer: keeps backpressure visible
+    'stream_min_width': 160,  # smallest width a client may request with /video_feed?width=...
+    'stream_variant_linger_s': 5.0,  # unwatched stream variants are evicted after this long
+    'telemetry_max_hz': 20,  # max rate of dashboard sensor pushes (/api/telemetry), sampled once for all viewers
+    'telemetry_keepalive_s': 15.0,  # SSE comment sent after this long without changes
+    'latency_window': 300,  # latency samples kept per video client for the /api/latency percentiles
+    'latency_buckets_s': (0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0),  # glass-to-glass histogram
+    'jpeg_backend': 'opencv',  # 'opencv', 'turbojpeg' (PyTurboJPEG) or 'simplejpeg'
+    'jpeg_subsampling': '420',  # chroma subsampling: '420', '422' or '444'
+    'pixel_format': 'BGR'  # 'YUV420': capture planar I420 and encode it without colour conversion
+}
+
+vision = {
+    'qr_mode': 'fast',  # 'full': colour full-res detection every frame, 'fast': grayscale, downscaled, decimated, ROI-tracked
+    'qr_downscale': 0.5,  # scale factor of the full-frame QR search in fast mode
+    'qr_every_n_frames': 3,  # full-frame QR search period in fast mode (while no code is tracked)
+    'qr_roi_padding': 0.5,  # ROI padding around the last corners, as a fraction of the code size
+    'qr_roi_max_misses': 2,  # consecutive ROI misses before the code is considered lost
+    'qr_ttl_s': 2.0  # last_qr_data expires this long after the code was last decoded
 }
 
 laser = {
     'front_threshold_cm': 40,  # if object closer than this, consider obstacle
+    # per sensor: distance_mode 1 (short, up to 1.3 m) or 2 (long), timing_budget_ms (15, 20, 33, 50,
+    # 100, 200 or 500; longer is less noisy) and inter_measurement_ms (>= timing budget: 1 / sample rate)
+    'sensors': {
+        'front': {'distance_mode': 1, 'timing_budget_ms': 20, 'inter_measurement_ms': 20},
+        'left': {'distance_mode': 1, 'timing_budget_ms': 50, 'inter_measurement_ms': 100},
+        'right': {'distance_mode': 1, 'timing_budget_ms': 50, 'inter_measurement_ms': 100}
+    },
+    'read_mode': 'data_ready'  # 'data_ready': read once per measurement, when it is due; 'poll': at the i2c schedule rate
+}
+
+imu = {
+    'mode': 'fifo',  # 'fifo': the MPU6050 samples into its FIFO, each read fuses the whole burst; 'single': one sample per read
+    'sample_rate_hz': 200,  # on-chip sample rate in fifo mode (1000 / n Hz)
+    'dlpf_cfg': 3,  # digital low-pass filter setting 1-6 (3 = 44 Hz bandwidth)
+    'filter_alpha': 0.98,  # complementary filter: per-sample weight of the gyro over the accelerometer (0-1, 0 = accel only)
+    'calibration_s': 2.0  # gyro bias is averaged over this long at startup (keep the robot still)
+}
+
+i2c = {
+    # per-device read rate (Hz) and priority (higher is read first when several reads are due)
+    'schedule': {
+        'front': {'rate_hz': 50, 'priority': 3},  # safety-critical
+        'imu': {'rate_hz': 100, 'priority': 2},  # accelerometer + gyroscope
+        'left': {'rate_hz': 10, 'priority': 1},
+        'right': {'rate_hz': 10, 'priority': 1},
+        'temperature': {'rate_hz': 1, 'priority': 0}
+    },
+    'stats_window_s': 2.0,  # window over which achieved rates and bus utilisation are measured
+    'history_size': 60000  # snapshots kept in memory for /api/history (~70 bytes each, minutes at 150/s)
 }
 
 motor = {
     'left_pins': {'en':13, 'in_1':26, 'in_2':19},
-    'right_pins': {'en':21, 'in_1':16, 'in_2':20}
+    'right_pins': {'en':21, 'in_1':16, 'in_2':20},
+    'pwm_hz': 1000,  # PWM frequency on the enable pins (duty cycle = track speed)
+    'speed': 1.0,  # track speed (0-1) of the forward/backward commands
+    'turn_speed': 0.7,  # track speed (0-1) when turning on the spot
+    'accel_per_s': 4.0,  # max speed increase per second (1.0 = stopped to full in 1 s); 0 = no ramp
+    'decel_per_s': 8.0,  # max speed decrease per second while driving (stop() is always immediate); 0 = no ramp
+    'ramp_hz': 50  # ramp update rate
+}
+
+recorder = {
+    'enabled': False,  # flight recorder (preallocated segments: keep off on an SD card unless needed): sensor samples, /api/control commands, watchdog stops, frame metadata
+    'directory': 'recordings',  # segment files (read them with python3 -m raspi_tank.recorder.reader)
+    'segment_mb': 16,  # size of each preallocated, memory-mapped segment (88-byte records)
+    'max_total_mb': 512,  # oldest segments are deleted beyond this
+    'queue_size': 50000,  # records waiting for the writer thread; the oldest are dropped beyond this
+    'flush_interval_s': 0.2,  # writer thread wake-up period
+    'sync_interval_s': 5.0  # msync period (records reach the page cache immediately anyway)
+}
+
+replay = {
+    'enabled': False,  # feed recorded data to the camera pipeline and the sensor snapshot (no Pi, camera or I2C needed)
+    'video': None,  # video file, or directory of images played in name order; None keeps the camera
+    'sensors': None,  # flight recorder directory or segment, or a reader --npy sensor table; None keeps the I2C sensors
+    'speed': 1.0,  # 1.0 real time, 2.0 twice as fast, 0 as fast as possible (deterministic: frames drive the sensors)
+    'fps': 30,  # frame rate of an image directory (video files carry their own)
+    'loop': False,
+    'sensor_offset_s': 0.0  # where the first sensor sample falls on the video's timeline
+}
+
+metrics = {
+    # histogram bucket upper bounds (s) for every stage timer on /metrics
+    'latency_buckets_s': (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+}
+
+control = {
+    # WebSocket control channel (/api/control/ws)
+    'heartbeat_interval_s': 0.1,  # clients resend their current command (or a heartbeat) this often
+    'heartbeat_timeout_s': 0.35,  # dead-man: a moving tank that hears nothing acceptable for this long is stopped
+    'max_command_delay_s': 0.2,  # commands queued longer than this (above the best recent delay) are discarded
+    'delay_window_s': 5.0  # the best delay is the minimum over the last one or two windows (absorbs clock drift)
 }
 
 safety = {
-    'sensor_timeout_s': 2.5
+    'sensor_timeout_s': 0.5,  # hard deadline: no new front range measurement for this long stops the motors
+    'reaction_deadline_s': 0.05,  # sample-to-stop reactions slower than this are logged and counted on /metrics
+    'reassert_interval_s': 0.3,  # while a safety stop holds, stop() is repeated this often
+    'lockout_s': 1.0  # operator drive commands are refused this long after the last safety stop (obstacle: forward only; stop is always accepted)
 }
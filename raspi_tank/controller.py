@@ -2,42 +2,153 @@
 import logging
 import time
 
+from raspi_tank.metrics import REGISTRY
 from raspi_tank.config import safety, laser as laser_conf
 
 log = logging.getLogger('Controller')
 
+_REACTION_HELP = ('Watchdog sample-to-stop time: from the front range measurement (obstacle) '
+                  'or the missed sensor deadline (sensor_timeout) to the arbiter applying the stop.')
+_REACTION = {reason: REGISTRY.histogram('raspitank_watchdog_reaction_seconds', _REACTION_HELP, reason=reason)
+             for reason in ('obstacle', 'sensor_timeout')}
+_WAKE = REGISTRY.histogram('raspitank_watchdog_wake_seconds',
+                           'Time from a sensor snapshot being published to the watchdog checking it.')
+
 class Watchdog:
-    def __init__(self, motor, sensors, camera):
+    """Stops the motors on an obstacle ahead or when the sensors go quiet.
+
+    Woken by every published sensor snapshot (no polling), and all ages are taken on the
+    monotonic clock. The deadline applies to the front range itself (snap.front_at), not to
+    the snapshot: the IMU keeps publishing while a stalled front laser does not. If no
+    front measurement is newer than safety['sensor_timeout_s'] the motors are stopped; a
+    front laser that never measured counts from the watchdog's start. When no snapshot
+    arrives at all, the wait times out right at that deadline. motor is a MotorArbiter:
+    its safety_stop() goes ahead of queued operator commands and locks them out for
+    safety['lockout_s'] (only forward drives for an obstacle). While a safety stop holds it
+    is repeated every safety['reassert_interval_s'], which keeps the lockout going. The time from the
+    triggering sample to the stop being applied is recorded per reason; reactions slower
+    than safety['reaction_deadline_s'] are logged and counted.
+    """
+    def __init__(self, motor, sensors, camera, recorder=None):
         self.motor = motor
         self.sensors = sensors
         self.camera = camera
+        self.recorder = recorder  # optional FlightRecorder, gets every stop
+        self.sensor_timeout = safety.get('sensor_timeout_s', 0.5)
+        self.reaction_deadline = safety.get('reaction_deadline_s', 0.05)
+        self.reassert_interval = safety.get('reassert_interval_s', 0.3)
+        self.stops = 0
+        self.deadline_misses = 0
+        self.max_reaction = 0.0
+        self._obstacle = False
+        self._timed_out = False
+        self._last_stop = 0.0
         self._stopped = False
+        self._started = time.monotonic()
+        REGISTRY.gauge('raspitank_watchdog_reaction_max_seconds', 'Slowest watchdog sample-to-stop time so far.',
+                       lambda: self.max_reaction)
+        REGISTRY.gauge('raspitank_watchdog_deadline_misses', 'Watchdog stops slower than the reaction deadline.',
+                       lambda: self.deadline_misses)
 
     def run(self):
-        log.info('Watchdog started')
+        log.info('Watchdog started (sensor deadline %.0f ms, reaction deadline %.0f ms)',
+                 self.sensor_timeout * 1000, self.reaction_deadline * 1000)
+        seq = -1
+        self._started = time.monotonic()
         while not self._stopped:
             try:
-                # check sensors freshness
-                last = self.sensors.last_update_time() if self.sensors else 0
-                age = time.time() - last
-                if age > safety['sensor_timeout_s']:
-                    log.error('Sensor timeout (%.1fs) - stopping motors', age)
-                    self.motor.stop()
-
-                # check front distance
-                front_dist = None
-                try:
-                    front_dist = self.sensors.front.distance
-                except Exception:
-                    pass
-                if front_dist is not None and front_dist < laser_conf['front_threshold_cm']:
-                    log.warning('Obstacle detected at %.1f cm - stopping motors', front_dist)
-                    self.motor.stop()
-
-                time.sleep(0.3)
+                # one consistent snapshot per check, no I2C access from this thread
+                snap = self._wait_for_sample(seq)
+                if self._stopped:
+                    break
+                now = time.monotonic()
+                if snap is None or now - self._front_time(snap) > self.sensor_timeout:
+                    self._on_timeout(snap, now)
+                    if snap is not None:
+                        seq = snap.seq  # the IMU keeps publishing: wait for the next one, do not spin
+                    continue
+                if snap.seq != seq:
+                    _WAKE.observe(now - snap.monotonic)
+                    seq = snap.seq
+                if self._timed_out:
+                    self._timed_out = False
+                    log.info('Sensor data resumed')
+                self._check_obstacle(snap, now)
             except Exception as e:
                 log.exception('Watchdog error: %s', e)
                 time.sleep(1.0)
 
+    def _front_time(self, snap):
+        """When the front range in snap was measured (the watchdog's start if it never was)."""
+        return snap.front_at if snap.front_at is not None else self._started
+
+    def _wait_for_sample(self, last_seq):
+        """The first snapshot newer than last_seq, or the current one once the front range deadline passes."""
+        if self.sensors is None:
+            time.sleep(self.sensor_timeout)
+            return None
+        snap = self.sensors.snapshot()
+        if snap.seq != last_seq:
+            return snap
+        # wake up exactly at the deadline; once missed, re-check once per reassert interval
+        remaining = self._front_time(snap) + self.sensor_timeout - time.monotonic()
+        if remaining <= 0:
+            remaining = self.reassert_interval
+        return self.sensors.wait_for_snapshot(last_seq, remaining)
+
+    def _on_timeout(self, snap, now):
+        measured_at = self._front_time(snap) if snap is not None else None
+        age = now - measured_at if measured_at is not None else float('inf')
+        if self._timed_out:
+            self._reassert('sensor_timeout', now)
+            return
+        self._timed_out = True
+        self._stop_motors('sensor_timeout')
+        # how late after the deadline the motors actually stopped
+        reaction = time.monotonic() - measured_at - self.sensor_timeout if measured_at is not None else 0.0
+        self._observe('sensor_timeout', reaction)
+        log.error('No front range for %.2fs - stopping motors', age)
+        if self.recorder is not None:
+            self.recorder.record_stop('sensor_timeout', snap, age)
+
+    def _check_obstacle(self, snap, now):
+        front_dist = snap.front
+        if front_dist is None or front_dist >= laser_conf['front_threshold_cm']:
+            if self._obstacle:
+                self._obstacle = False
+                log.info('Obstacle cleared (%s cm)', front_dist)
+            return
+        if self._obstacle:
+            self._reassert('obstacle', now)
+            return
+        self._obstacle = True
+        self._stop_motors('obstacle')
+        stopped_at = time.monotonic()
+        # from the moment the range was measured, so the I2C read and publish are included
+        sampled_at = snap.front_at if snap.front_at is not None else snap.monotonic
+        self._observe('obstacle', stopped_at - sampled_at)
+        log.warning('Obstacle detected at %.1f cm - stopping motors (%.1f ms after the sample)',
+                    front_dist, (stopped_at - sampled_at) * 1000)
+        if self.recorder is not None:
+            self.recorder.record_stop('obstacle', snap, stopped_at - sampled_at)
+
+    def _stop_motors(self, reason):
+        # an obstacle ahead only rules out forward motion: backing away stays possible
+        self.motor.safety_stop(reason, forward_only=reason == 'obstacle')
+        self.stops += 1
+        self._last_stop = time.monotonic()
+
+    def _reassert(self, reason, now):
+        if now - self._last_stop >= self.reassert_interval:
+            self._stop_motors(reason)
+
+    def _observe(self, reason, seconds):
+        _REACTION[reason].observe(seconds)
+        self.max_reaction = max(self.max_reaction, seconds)
+        if seconds > self.reaction_deadline:
+            self.deadline_misses += 1
+            log.warning('Watchdog %s reaction took %.1f ms (deadline %.0f ms)',
+                        reason, seconds * 1000, self.reaction_deadline * 1000)
+
     def stop(self):
         self._stopped = True
@@ -0,0 +1,197 @@
+"""Low-overhead stage timers: fixed-bucket histograms and rate gauges, rendered in Prometheus text format."""
+import bisect
+import threading
+import time
+
+from raspi_tank.config import metrics as metrics_conf
+
+# upper bounds in seconds; +Inf is implicit
+DEFAULT_BUCKETS = tuple(metrics_conf.get('latency_buckets_s', (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)))
+
+def _labels(labels, extra=None):
+    items = sorted(labels.items())
+    if extra:
+        items.append(extra)
+    if not items:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Histogram:
+    """Fixed buckets, no lock: observe() is a bisect and two additions, safe with a single
+    writer thread. Metrics written from several threads use SharedHistogram, since += on the
+    counters can lose updates when two threads interleave.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def _snapshot(self):
+        return list(self.counts), self.sum
+
+    def _samples(self, name, labels):
+        counts, total = self._snapshot()
+        cumulative = 0
+        for bound, n in zip(self.bounds + (float('inf'),), counts):
+            cumulative += n
+            yield '%s_bucket%s %d' % (name, _labels(labels, ('le', _number(bound))), cumulative)
+        yield '%s_sum%s %r' % (name, _labels(labels), total)
+        yield '%s_count%s %d' % (name, _labels(labels), cumulative)
+
+class SharedHistogram(Histogram):
+    """A Histogram written from several threads (e.g. one per viewer): observe() takes a lock."""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        Histogram.__init__(self, buckets)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            Histogram.observe(self, seconds)
+
+    def _snapshot(self):
+        with self._lock:
+            return Histogram._snapshot(self)
+
+class LoopRate:
+    """Iterations per second of a loop; tick() once per iteration. The interval between ticks is
+    exponentially smoothed (not its inverse, which bursts of close ticks would blow up).
+    """
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+        self.interval = None
+        self.total = 0
+        self._last = None
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._last is not None:
+            dt = now - self._last
+            self.interval = dt if self.interval is None else (1.0 - self.smoothing) * self.interval + self.smoothing * dt
+        self._last = now
+        self.total += 1
+
+    def value(self):
+        if not self.interval:
+            return 0.0
+        # a loop that stopped ticking is not still running at its last rate
+        if time.perf_counter() - self._last > max(1.0, 5.0 * self.interval):
+            return 0.0
+        return 1.0 / self.interval
+
+class SharedLoopRate(LoopRate):
+    """A LoopRate ticked from several threads (all viewers together): tick() takes a lock."""
+    def __init__(self, smoothing=0.1):
+        LoopRate.__init__(self, smoothing)
+        self._lock = threading.Lock()
+
+    def tick(self):
+        with self._lock:
+            LoopRate.tick(self)
+
+class Registry:
+    """Named metric families with label sets; get-or-create, so modules just ask for what they time."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}  # name -> [type, help, {label tuple: metric or callable}]
+        self._observe_cost = None
+        self.render_s = 0.0
+
+    def _get(self, kind, name, help, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, [kind, help, {}])
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS, shared=False, **labels):
+        """shared: observed from more than one thread."""
+        return self._get('histogram', name, help, labels,
+                         lambda: (SharedHistogram if shared else Histogram)(buckets))
+
+    def loop_rate(self, name, help, shared=False, **labels):
+        """shared: ticked from more than one thread."""
+        return self._get('gauge', name, help, labels, SharedLoopRate if shared else LoopRate)
+
+    def gauge(self, name, help, fn, **labels):
+        """A gauge read from fn() at scrape time (replaces an earlier fn with the same labels)."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, ['gauge', help, {}])
+            family[2][key] = fn
+
+    def observe_cost(self):
+        """Seconds one timed observation costs (two perf_counter() calls and observe()), measured once."""
+        if self._observe_cost is None:
+            h = Histogram()
+            clock = time.perf_counter
+            n = 20000
+            t0 = clock()
+            for _ in range(n):
+                s = clock()
+                h.observe(clock() - s)
+            self._observe_cost = (clock() - t0) / n
+        return self._observe_cost
+
+    def observations(self):
+        """Histogram observations and loop ticks recorded so far."""
+        with self._lock:
+            metrics = [m for f in self._families.values() for m in f[2].values()]
+        return (sum(m.count for m in metrics if isinstance(m, Histogram)) +
+                sum(m.total for m in metrics if isinstance(m, LoopRate)))
+
+    def render(self):
+        """Every metric in Prometheus text exposition format (version 0.0.4)."""
+        t0 = time.perf_counter()
+        with self._lock:
+            families = sorted((name, f[0], f[1], list(f[2].items())) for name, f in self._families.items())
+        lines = []
+        for name, kind, help, metrics in families:
+            lines.append('# HELP %s %s' % (name, help))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for key, metric in metrics:
+                labels = dict(key)
+                if isinstance(metric, Histogram):
+                    lines.extend(metric._samples(name, labels))
+                    continue
+                try:
+                    value = metric.value() if isinstance(metric, LoopRate) else metric()
+                except Exception:
+                    continue  # the object behind this gauge is gone or broken: skip the sample
+                if value is not None:
+                    lines.append('%s%s %s' % (name, _labels(labels), _number(value)))
+
+        cost = self.observe_cost()
+        observations = self.observations()
+        lines += [
+            '# HELP raspitank_metrics_observe_seconds Measured cost of one timed observation.',
+            '# TYPE raspitank_metrics_observe_seconds gauge',
+            'raspitank_metrics_observe_seconds %r' % cost,
+            '# HELP raspitank_metrics_overhead_seconds_total Estimated time spent timing and recording (observations x cost).',
+            '# TYPE raspitank_metrics_overhead_seconds_total counter',
+            'raspitank_metrics_overhead_seconds_total %r' % (observations * cost),
+            '# HELP raspitank_metrics_render_seconds Time the previous /metrics scrape took to render.',
+            '# TYPE raspitank_metrics_render_seconds gauge',
+            'raspitank_metrics_render_seconds %r' % self.render_s,
+        ]
+        self.render_s = time.perf_counter() - t0
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
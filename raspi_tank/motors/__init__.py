@@ -1,4 +1,6 @@
 """Motor control package."""
 from .motor import Motor
+from .arbiter import MotorArbiter
+from .gpio import RPiGPIO, StubGPIO
 
-__all__ = ['Motor']
+__all__ = ['Motor', 'MotorArbiter', 'RPiGPIO', 'StubGPIO']
@@ -0,0 +1,202 @@
+"""MotorArbiter: the single owner of the Motor. HTTP handlers, the control channel and the
+watchdog submit commands; one thread applies them in priority order.
+"""
+import collections
+import logging
+import threading
+import time
+
+from raspi_tank.metrics import REGISTRY
+from raspi_tank.config import safety
+
+log = logging.getLogger('Arbiter')
+
+OPERATOR, SAFETY = 'operator', 'safety'
+
+_QUEUE = {source: REGISTRY.histogram('raspitank_motor_queue_seconds',
+                                     'Time from a motor command being submitted to the arbiter applying it.',
+                                     source=source)
+          for source in (OPERATOR, SAFETY)}
+
+class MotorArbiter:
+    """Every Motor call goes through one thread ('MotorArbiter'), so commands from many
+    threads are applied one at a time and in a defined order.
+
+    Operator commands (drive, move_*, stop) are queued and return at once. A burst queued
+    while the thread was busy collapses to its latest command (latest wins); the ones
+    replaced are counted as coalesced. safety_stop() jumps the queue and locks operator drive
+    commands out for safety['lockout_s']: they are refused (the method returns False), and
+    ones queued before the safety stop are dropped. Operator stops are always accepted.
+    A forward_only stop (an obstacle ahead) only stops and locks out forward motion
+    (left + right > 0), so the tank can still back away or turn on the spot.
+    Has the Motor's command interface, so it takes the Motor's place for the streamer.
+    """
+    def __init__(self, motor):
+        self.motor = motor
+        self.lockout = safety.get('lockout_s', 1.0)
+        self.stop_timeout = safety.get('reaction_deadline_s', 0.05)
+        self._cond = threading.Condition()
+        self._queue = collections.deque()  # (method name, args, submitted at)
+        self._safety_requested = 0  # safety stop tickets: requested / applied
+        self._safety_applied = 0
+        self._safety_at = 0.0
+        self._safety_forward_only = False  # every pending safety stop is forward_only
+        self._locked_until = 0.0  # every drive refused until then
+        self._forward_locked_until = 0.0  # forward drives refused until then
+        self.applied = 0
+        self.coalesced = 0
+        self.refused = 0
+        self.safety_stops = 0
+        self.max_queue_latency = 0.0
+        self._closed = False
+        self._thread = threading.Thread(name='MotorArbiter', target=self._run, daemon=True)
+        self._thread.start()
+        REGISTRY.gauge('raspitank_motor_coalesced_commands',
+                       'Operator motor commands replaced by a newer one before being applied.',
+                       lambda: self.coalesced)
+        REGISTRY.gauge('raspitank_motor_refused_commands',
+                       'Operator drive commands refused or dropped during a safety lockout.',
+                       lambda: self.refused)
+        log.info('Motor arbiter started (lockout %.1f s after a safety stop)', self.lockout)
+
+    # operator commands: queued, True if accepted
+
+    def drive(self, left, right):
+        return self._submit('drive', left, right)
+
+    def move_forward(self):
+        return self._submit('move_forward')
+
+    def move_backward(self):
+        return self._submit('move_backward')
+
+    def move_left(self):
+        return self._submit('move_left')
+
+    def move_right(self):
+        return self._submit('move_right')
+
+    def stop(self):
+        return self._submit('stop')
+
+    def _submit(self, name, *args):
+        now = time.monotonic()
+        with self._cond:
+            if self._locked_out(name, args, now):
+                self.refused += 1
+                return False
+            self._queue.append((name, args, now))
+            self._cond.notify()
+        return True
+
+    # safety
+
+    def _locked_out(self, name, args, now):
+        """Whether an operator command is refused by the current lockout (called with the condition held)."""
+        if name == 'stop':
+            return False
+        if now < self._locked_until:
+            return True
+        return now < self._forward_locked_until and _forward(name, args)
+
+    def safety_stop(self, reason, forward_only=False):
+        """Stop ahead of every queued operator command and (re)start the lockout.
+        With forward_only, a tank that is not heading forward is left alone and only forward
+        drives are locked out. Blocks until the stop is applied; if the arbiter thread has not
+        applied it within safety['reaction_deadline_s'], the Motor is stopped from the calling
+        thread. Returns True if the arbiter applied it.
+        """
+        now = time.monotonic()
+        with self._cond:
+            if forward_only:
+                self._forward_locked_until = max(self._forward_locked_until, now + self.lockout)
+            else:
+                self._locked_until = max(self._locked_until, now + self.lockout)
+            pending = self._safety_applied < self._safety_requested
+            self._safety_forward_only = forward_only and (self._safety_forward_only or not pending)
+            self._safety_requested += 1
+            ticket = self._safety_requested
+            self._safety_at = now
+            self._cond.notify_all()
+            applied = self._cond.wait_for(lambda: self._safety_applied >= ticket or self._closed,
+                                          self.stop_timeout)
+        if not applied:
+            log.error('Arbiter did not apply the %s stop within %.0f ms - stopping the motor directly',
+                      reason, self.stop_timeout * 1000)
+            if not forward_only or sum(self.motor.target()) > 0:
+                self.motor.stop()
+        return applied
+
+    # arbiter thread
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._closed or self._queue or self._safety_applied < self._safety_requested):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                if self._safety_applied < self._safety_requested:
+                    ticket = self._safety_requested
+                    name, args, submitted, source = 'stop', (), self._safety_at, SAFETY
+                    forward_only = self._safety_forward_only
+                else:
+                    ticket = None
+                    name, args, submitted = self._queue.pop()
+                    source = OPERATOR
+                    self.coalesced += len(self._queue)
+                    self._queue.clear()
+                    if self._locked_out(name, args, time.monotonic()):
+                        self.refused += 1  # queued before the safety stop
+                        continue
+            try:
+                if ticket is None or not forward_only or sum(self.motor.target()) > 0:
+                    getattr(self.motor, name)(*args)
+            except Exception as e:
+                log.exception('Motor %s failed: %s', name, e)
+            latency = time.monotonic() - submitted
+            _QUEUE[source].observe(latency)
+            with self._cond:
+                self.applied += 1
+                self.max_queue_latency = max(self.max_queue_latency, latency)
+                if ticket is not None:
+                    self._safety_applied = ticket
+                    self.safety_stops += 1
+                    self._cond.notify_all()
+
+    # Motor passthrough
+
+    def speeds(self):
+        return self.motor.speeds()
+
+    def target(self):
+        return self.motor.target()
+
+    def stats(self):
+        with self._cond:
+            stats = {
+                'queued': len(self._queue),
+                'applied': self.applied,
+                'coalesced': self.coalesced,
+                'refused': self.refused,
+                'safety_stops': self.safety_stops,
+                'lockout_remaining_s': round(max(0.0, self._locked_until - time.monotonic()), 3),
+                'forward_lockout_remaining_s': round(max(0.0, self._forward_locked_until - time.monotonic()), 3),
+                'max_queue_latency_ms': round(self.max_queue_latency * 1000, 3)
+            }
+        stats['motor'] = self.motor.stats()
+        return stats
+
+    def close(self):
+        """Stop the arbiter thread, then stop and release the Motor."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(1.0)
+        self.motor.close()
+
+def _forward(name, args):
+    """Whether an operator command moves the tank forward (left + right > 0)."""
+    if name == 'drive':
+        return args[0] + args[1] > 0
+    return name == 'move_forward'
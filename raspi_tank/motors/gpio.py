@@ -0,0 +1,81 @@
+"""GPIO backends for Motor: RPi.GPIO on the Pi, a recording stub everywhere else."""
+import collections
+import logging
+import time
+
+try:
+    import RPi.GPIO as GPIO
+    HAS_GPIO = True
+except Exception:
+    HAS_GPIO = False
+
+log = logging.getLogger('GPIO')
+
+# one pin write: monotonic time, BCM pin, 'out' (level 0/1) or 'duty' (PWM duty cycle 0-100), value
+PinWrite = collections.namedtuple('PinWrite', ['t', 'pin', 'kind', 'value'])
+
+class RPiGPIO:
+    """RPi.GPIO with BCM numbering; enable pins get software PWM."""
+    name = 'RPi.GPIO'
+
+    def __init__(self):
+        GPIO.setmode(GPIO.BCM)
+        self._pwm = {}
+
+    def setup_output(self, pin):
+        GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
+
+    def setup_pwm(self, pin, frequency):
+        GPIO.setup(pin, GPIO.OUT, initial=GPIO.LOW)
+        pwm = self._pwm[pin] = GPIO.PWM(pin, frequency)
+        pwm.start(0)
+
+    def output(self, pin, value):
+        GPIO.output(pin, GPIO.HIGH if value else GPIO.LOW)
+
+    def duty(self, pin, duty):
+        self._pwm[pin].ChangeDutyCycle(duty)
+
+    def cleanup(self):
+        for pwm in self._pwm.values():
+            pwm.stop()
+        self._pwm.clear()
+        GPIO.cleanup()
+
+class StubGPIO:
+    """Records every write instead of driving pins, so Motor can be exercised off-Pi.
+
+    writes holds the last max_writes PinWrites, pins the current level or duty of every pin.
+    """
+    name = 'stub'
+
+    def __init__(self, max_writes=10000):
+        self.writes = collections.deque(maxlen=max_writes)
+        self.pins = {}
+        self.pwm = {}  # pin -> frequency
+
+    def setup_output(self, pin):
+        self.pins[pin] = 0
+
+    def setup_pwm(self, pin, frequency):
+        self.pins[pin] = 0.0
+        self.pwm[pin] = frequency
+
+    def output(self, pin, value):
+        self._write(pin, 'out', 1 if value else 0)
+
+    def duty(self, pin, duty):
+        self._write(pin, 'duty', duty)
+
+    def _write(self, pin, kind, value):
+        self.pins[pin] = value
+        self.writes.append(PinWrite(time.monotonic(), pin, kind, value))
+        log.debug('pin %d %s %s', pin, kind, value)
+
+    def cleanup(self):
+        self.pins.clear()
+        self.pwm.clear()
+
+def default_backend():
+    """RPi.GPIO when it is importable, otherwise the stub."""
+    return RPiGPIO() if HAS_GPIO else StubGPIO()
@@ -1,75 +1,190 @@
-"""Motor control (hardware-optional). If RPi.GPIO is available it will use real pins, otherwise it will log actions."""
+"""Motor control (hardware-optional): PWM speed and differential steering of the two tracks.
+If RPi.GPIO is available it drives real pins, otherwise a stub backend records the writes.
+"""
 import logging
+import threading
+import time
 
-try:
-    import RPi.GPIO as GPIO
-    HAS_GPIO = True
-except Exception:
-    HAS_GPIO = False
-
+from raspi_tank.motors.gpio import default_backend
+from raspi_tank.metrics import REGISTRY
 from raspi_tank.config import motor as motor_conf
 
 log = logging.getLogger('Motor')
 
+TRACKS = ('left', 'right')
+
 class Motor:
-    def __init__(self):
-        global HAS_GPIO
-        if HAS_GPIO:
-            GPIO.setmode(GPIO.BCM)
-            for p in motor_conf['left_pins'].values():
-                GPIO.setup(p, GPIO.OUT)
-            for p in motor_conf['right_pins'].values():
-                GPIO.setup(p, GPIO.OUT)
-        log.info('Motor initialized (GPIO=%s)', HAS_GPIO)
+    """Two tracks, each an H-bridge channel: in_1/in_2 set the direction, a PWM duty cycle
+    on en sets the speed.
 
-    def move_forward(self):
-        log.info('move_forward')
-        if HAS_GPIO:
-            GPIO.output(motor_conf['left_pins']['en'], GPIO.HIGH)
-            GPIO.output(motor_conf['left_pins']['in_1'], GPIO.HIGH)
-            GPIO.output(motor_conf['left_pins']['in_2'], GPIO.LOW)
+    drive(left, right) takes signed speeds in [-1, 1] (positive = in_1 HIGH, forward).
+    Speeds move towards the target at most motor['accel_per_s'] faster and
+    motor['decel_per_s'] slower per second, stepped by a ramp thread at motor['ramp_hz'];
+    a reversal slows down to zero before the direction pins flip. stop() is never ramped.
+    Every pin level and duty cycle is cached and a write that would not change it is skipped,
+    so repeated commands (key repeat, watchdog re-stops) cost no GPIO traffic.
+    """
+    def __init__(self, backend=None):
+        self.gpio = backend if backend is not None else default_backend()
+        self.pins = {'left': motor_conf['left_pins'], 'right': motor_conf['right_pins']}
+        self.pwm_hz = motor_conf.get('pwm_hz', 1000)
+        self.accel = motor_conf.get('accel_per_s', 0.0)
+        self.decel = motor_conf.get('decel_per_s', 0.0)
+        self.ramp_period = 1.0 / motor_conf.get('ramp_hz', 50)
+        self._cond = threading.Condition()
+        self._state = {}  # pin -> last level or duty written
+        self._target = {'left': 0.0, 'right': 0.0}
+        self._speed = {'left': 0.0, 'right': 0.0}
+        self.writes = 0
+        self.skipped_writes = 0
+        self._closed = False
+        for track in TRACKS:
+            pins = self.pins[track]
+            self.gpio.setup_pwm(pins['en'], self.pwm_hz)
+            self.gpio.setup_output(pins['in_1'])
+            self.gpio.setup_output(pins['in_2'])
+            self._state[pins['en']] = 0.0
+            self._state[pins['in_1']] = 0
+            self._state[pins['in_2']] = 0
+        self._thread = None
+        if self.accel > 0 or self.decel > 0:
+            self._thread = threading.Thread(name='MotorRamp', target=self._run, daemon=True)
+            self._thread.start()
+        REGISTRY.gauge('raspitank_motor_gpio_writes', 'GPIO writes issued by Motor.', lambda: self.writes)
+        REGISTRY.gauge('raspitank_motor_gpio_skipped_writes', 'GPIO writes skipped because the pin already had that value.',
+                       lambda: self.skipped_writes)
+        log.info('Motor initialized (GPIO=%s, PWM %d Hz, ramps +%.1f/-%.1f per s)',
+                 self.gpio.name, self.pwm_hz, self.accel, self.decel)
 
-            GPIO.output(motor_conf['right_pins']['en'], GPIO.HIGH)
-            GPIO.output(motor_conf['right_pins']['in_1'], GPIO.HIGH)
-            GPIO.output(motor_conf['right_pins']['in_2'], GPIO.LOW)
+    def drive(self, left, right):
+        """Set the target speed of each track, -1.0 (full reverse) to 1.0 (full forward).
+        Returns True: like MotorArbiter's, but a Motor never refuses a command.
+        """
+        target = {'left': _clamp(left), 'right': _clamp(right)}
+        with self._cond:
+            if target == self._target:
+                return True
+            self._target = target
+            log.info('drive left=%.2f right=%.2f', target['left'], target['right'])
+            if self._thread is None:
+                for track in TRACKS:
+                    self._apply(track, target[track])
+            else:
+                self._cond.notify()
+        return True
 
-    def move_backward(self):
-        log.info('move_backward')
-        if HAS_GPIO:
-            GPIO.output(motor_conf['left_pins']['en'], GPIO.HIGH)
-            GPIO.output(motor_conf['left_pins']['in_1'], GPIO.LOW)
-            GPIO.output(motor_conf['left_pins']['in_2'], GPIO.HIGH)
+    def move_forward(self):
+        speed = motor_conf.get('speed', 1.0)
+        return self.drive(speed, speed)
 
-            GPIO.output(motor_conf['right_pins']['en'], GPIO.HIGH)
-            GPIO.output(motor_conf['right_pins']['in_1'], GPIO.LOW)
-            GPIO.output(motor_conf['right_pins']['in_2'], GPIO.HIGH)
+    def move_backward(self):
+        speed = motor_conf.get('speed', 1.0)
+        return self.drive(-speed, -speed)
 
     def move_left(self):
-        log.info('move_left')
-        if HAS_GPIO:
-            # Left motor backward, right motor forward = turn left
-            GPIO.output(motor_conf['left_pins']['en'], GPIO.HIGH)
-            GPIO.output(motor_conf['left_pins']['in_1'], GPIO.HIGH)
-            GPIO.output(motor_conf['left_pins']['in_2'], GPIO.LOW)
-
-            GPIO.output(motor_conf['right_pins']['en'], GPIO.HIGH)
-            GPIO.output(motor_conf['right_pins']['in_1'], GPIO.LOW)
-            GPIO.output(motor_conf['right_pins']['in_2'], GPIO.HIGH)
+        # same pin pattern as the original on/off control: left in_1 HIGH, right in_2 HIGH
+        speed = motor_conf.get('turn_speed', 1.0)
+        return self.drive(speed, -speed)
 
     def move_right(self):
-        log.info('move_right')
-        if HAS_GPIO:
-            # Left motor forward, right motor backward = turn right
-            GPIO.output(motor_conf['left_pins']['en'], GPIO.HIGH)
-            GPIO.output(motor_conf['left_pins']['in_1'], GPIO.LOW)
-            GPIO.output(motor_conf['left_pins']['in_2'], GPIO.HIGH)
-
-            GPIO.output(motor_conf['right_pins']['en'], GPIO.HIGH)
-            GPIO.output(motor_conf['right_pins']['in_1'], GPIO.HIGH)
-            GPIO.output(motor_conf['right_pins']['in_2'], GPIO.LOW)
+        speed = motor_conf.get('turn_speed', 1.0)
+        return self.drive(-speed, speed)
 
     def stop(self):
-        log.info('stop')
-        if HAS_GPIO:
-            GPIO.output(motor_conf['left_pins']['en'], GPIO.LOW)
-            GPIO.output(motor_conf['right_pins']['en'], GPIO.LOW)
+        """Both tracks to zero at once, bypassing the ramps."""
+        with self._cond:
+            if self._target != {'left': 0.0, 'right': 0.0}:
+                log.info('stop')
+            self._target = {'left': 0.0, 'right': 0.0}
+            for track in TRACKS:
+                self._apply(track, 0.0)
+        return True
+
+    def speeds(self):
+        """Current (left, right) speeds; they lag the drive() targets while ramping."""
+        with self._cond:
+            return self._speed['left'], self._speed['right']
+
+    def target(self):
+        """(left, right) speeds the tracks are heading to: the last drive(), or zero after stop()."""
+        with self._cond:
+            return self._target['left'], self._target['right']
+
+    def stats(self):
+        with self._cond:
+            return {
+                'backend': self.gpio.name,
+                'target': dict(self._target),
+                'speed': dict(self._speed),
+                'writes': self.writes,
+                'skipped_writes': self.skipped_writes
+            }
+
+    def _run(self):
+        last = time.monotonic()
+        with self._cond:
+            while not self._closed:
+                if self._speed == self._target:
+                    self._cond.wait()  # idle until the next drive()
+                    last = time.monotonic()
+                    continue
+                self._cond.wait(self.ramp_period)
+                now = time.monotonic()
+                dt, last = now - last, now
+                for track in TRACKS:
+                    self._apply(track, self._step(self._speed[track], self._target[track], dt))
+
+    def _step(self, speed, target, dt):
+        """One ramp step from speed towards target; a reversal stops at zero first."""
+        if speed != 0.0 and (target == 0.0 or (target > 0) != (speed > 0)):
+            goal, rate = 0.0, self.decel
+        elif abs(target) > abs(speed):
+            goal, rate = target, self.accel
+        else:
+            goal, rate = target, self.decel
+        if rate <= 0:
+            return goal
+        step = rate * dt
+        if abs(goal - speed) <= step:
+            return goal
+        return speed + step if goal > speed else speed - step
+
+    def _apply(self, track, speed):
+        """Write a track's pins for this speed (called with the condition held)."""
+        pins = self.pins[track]
+        self._speed[track] = speed
+        if speed == 0.0:
+            self._write(pins['en'], 0.0, duty=True)
+            return
+        forward = speed > 0
+        if self._state[pins['en']]:
+            # still turning the other way: cut the power before flipping the bridge
+            if (self._state[pins['in_1']] == 1) != forward:
+                self._write(pins['en'], 0.0, duty=True)
+        self._write(pins['in_1'], 1 if forward else 0)
+        self._write(pins['in_2'], 0 if forward else 1)
+        self._write(pins['en'], round(abs(speed) * 100.0, 1), duty=True)
+
+    def _write(self, pin, value, duty=False):
+        if self._state.get(pin) == value:
+            self.skipped_writes += 1
+            return
+        self._state[pin] = value
+        self.writes += 1
+        if duty:
+            self.gpio.duty(pin, value)
+        else:
+            self.gpio.output(pin, value)
+
+    def close(self):
+        """Stop the tracks and release the GPIO pins."""
+        self.stop()
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(1.0)
+        self.gpio.cleanup()
+
+def _clamp(speed):
+    return max(-1.0, min(1.0, float(speed)))
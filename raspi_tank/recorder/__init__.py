@@ -0,0 +1,4 @@
+"""Flight recorder: durable binary log of sensors, commands, watchdog stops and frames."""
+from .flight_recorder import FlightRecorder, RECORD_DTYPE
+
+__all__ = ['FlightRecorder', 'RECORD_DTYPE']
@@ -0,0 +1,275 @@
+"""Flight recorder: append-only binary log of sensor samples, motor commands, watchdog stops and frames."""
+import collections
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import numpy as np
+
+from raspi_tank.config import recorder as recorder_conf
+
+log = logging.getLogger('Recorder')
+
+# record kinds
+SENSOR, COMMAND, STOP, FRAME = 1, 2, 3, 4
+KINDS = {'sensor': SENSOR, 'command': COMMAND, 'stop': STOP, 'frame': FRAME}
+
+COMMANDS = ('forward', 'backward', 'left', 'right', 'stop', 'drive')  # command code = index + 1, 0 = unknown
+STOP_REASONS = ('sensor_timeout', 'obstacle', 'heartbeat')  # stop reason code = index + 1
+
+# every record is 88 bytes; what code, flags and the value slots mean depends on kind
+RECORD_DTYPE = np.dtype([
+    ('t', 'f8'),  # time.time()
+    ('mono', 'f8'),  # time.monotonic()
+    ('kind', 'u1'),
+    ('code', 'u1'),  # command or stop reason
+    ('flags', 'u2'),  # command: HTTP status
+    ('seq', 'u4'),  # sensor snapshot seq (sensor, stop), control channel seq (command) or frame seq (frame)
+    ('v', 'f4', (16,))  # values, NaN where unavailable
+])
+
+# names of the value slots of each kind, and of code/flags where they are used
+VALUES = {
+    SENSOR: ('front', 'left', 'right', 'pitch', 'roll', 'yaw', 'temperature',
+             'ax', 'ay', 'az', 'gx', 'gy', 'gz',
+             'front_age', 'left_age', 'right_age'),  # s between each range measurement and the snapshot
+    COMMAND: ('left', 'right'),
+    STOP: ('front', 'age'),
+    FRAME: ('capture_seq', 'height', 'width')
+}
+CODES = {COMMAND: ('command', 'status'), STOP: ('reason', None)}
+
+# segment header: magic, format version, record size, record count, creation time
+MAGIC = b'RTFLIGHT'
+VERSION = 2  # 2: 16 value slots, sensor range ages
+HEADER = struct.Struct('<8sHHIQd')
+HEADER_SIZE = 64  # records start here
+_COUNT_OFFSET = 16
+
+_NAN16 = (np.nan,) * 16
+
+def _values(*values):
+    """Pad to the 16 value slots, None as NaN."""
+    return tuple(np.nan if v is None else v for v in values) + _NAN16[len(values):]
+
+def _age(snap, measured_at):
+    """Seconds between a range measurement and the snapshot holding it, None if never measured."""
+    return None if measured_at is None else snap.monotonic - measured_at
+
+class _Segment:
+    """One preallocated, memory-mapped segment file."""
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.count = 0
+        size = HEADER_SIZE + capacity * RECORD_DTYPE.itemsize
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.ftruncate(self._fd, size)
+        self._mm = mmap.mmap(self._fd, size)
+        self._mm[:HEADER.size] = HEADER.pack(MAGIC, VERSION, RECORD_DTYPE.itemsize, 0, 0, time.time())
+        self.records = np.frombuffer(self._mm, RECORD_DTYPE, capacity, HEADER_SIZE)
+
+    @property
+    def free(self):
+        return self.capacity - self.count
+
+    def write(self, batch):
+        n = len(batch)
+        self.records[self.count:self.count + n] = batch
+        self.count += n
+        # the count is updated after the records, so a reader never sees a half-written one
+        struct.pack_into('<Q', self._mm, _COUNT_OFFSET, self.count)
+
+    def sync(self):
+        self._mm.flush()
+
+    def close(self):
+        """Flush and shrink the file to the records actually written."""
+        self.records = None  # release the buffer export before closing the map
+        self._mm.flush()
+        self._mm.close()
+        os.ftruncate(self._fd, HEADER_SIZE + self.count * RECORD_DTYPE.itemsize)
+        os.close(self._fd)
+
+class FlightRecorder:
+    """Durable log for incident analysis.
+
+    Producers (I2C poller, camera, HTTP handlers, watchdog) only append a tuple to a bounded
+    deque, so recording never blocks them; if the writer falls behind the oldest pending
+    records are dropped and counted. A writer thread converts pending records in batches into
+    fixed-width RECORD_DTYPE rows and copies them into preallocated memory-mapped segment
+    files, rotating to a new segment when one is full and deleting the oldest segments when
+    the directory would exceed max_total_mb. Read segments back with raspi_tank.recorder.reader.
+    """
+    def __init__(self, directory=None, segment_mb=None, max_total_mb=None, queue_size=None,
+                 flush_interval_s=None, sync_interval_s=None):
+        conf = recorder_conf
+        self.directory = directory or conf.get('directory', 'recordings')
+        self.segment_records = max(1, int((segment_mb or conf.get('segment_mb', 16)) * 1024 * 1024
+                                          - HEADER_SIZE) // RECORD_DTYPE.itemsize)
+        self.max_total_bytes = int((max_total_mb or conf.get('max_total_mb', 512)) * 1024 * 1024)
+        self.flush_interval_s = flush_interval_s or conf.get('flush_interval_s', 0.2)
+        self.sync_interval_s = sync_interval_s or conf.get('sync_interval_s', 5.0)
+        self._pending = collections.deque(maxlen=queue_size or conf.get('queue_size', 50000))
+        self._segment = None
+        self._segment_index = 0
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.invalid = 0  # records that could not be converted, skipped
+        self.segments = 0
+        self.deleted = 0
+        self._write_s = 0.0
+
+    # producers: any thread, O(1), never blocks
+
+    def _put(self, item):
+        if len(self._pending) == self._pending.maxlen:
+            self.dropped += 1  # the deque discards the oldest pending record
+        self._pending.append(item)
+
+    def record_sensor(self, snap):
+        """A published SensorSnapshot."""
+        self._put((SENSOR, snap))
+
+    def record_command(self, command, status, left=None, right=None, seq=0):
+        """A motor command and the HTTP status it got; control channel commands add their
+        track speeds and sequence number (discarded ones get 408 stale / 409 out of order).
+        """
+        self._put((COMMAND, time.time(), time.monotonic(), command, status, left, right, seq))
+
+    def record_stop(self, reason, snap, age):
+        """A watchdog stop: reason is one of STOP_REASONS, snap the snapshot it was based on."""
+        self._put((STOP, time.time(), time.monotonic(), reason, snap, age))
+
+    def record_frame(self, frame_seq, capture_seq, shape):
+        """An annotated frame published by the camera."""
+        self._put((FRAME, time.time(), time.monotonic(), frame_seq, capture_seq, shape))
+
+    # writer thread
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(name='Recorder', target=self._run, daemon=True)
+        self._thread.start()
+        log.info('Flight recorder writing to %s (%d records per segment, cap %d MB)', self.directory,
+                 self.segment_records, self.max_total_bytes // (1024 * 1024))
+        return self._thread
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while not self._stopped:
+            self._wake.wait(self.flush_interval_s)
+            self._wake.clear()
+            try:
+                self._drain()
+                now = time.monotonic()
+                if self._segment is not None and now - last_sync >= self.sync_interval_s:
+                    self._segment.sync()
+                    last_sync = now
+            except Exception as e:
+                log.exception('Flight recorder write error: %s', e)
+                time.sleep(1.0)
+        self._drain()
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _drain(self):
+        """Write everything pending, in batches that fit the current segment."""
+        while self._pending:
+            if self._segment is None or self._segment.free == 0:
+                self._rotate()
+            rows = []
+            pending = self._pending
+            for _ in range(self._segment.free):
+                if not pending:
+                    break
+                item = pending.popleft()
+                try:
+                    rows.append(self._row(item))
+                except Exception as e:
+                    # one bad record must not take the rest of the batch with it
+                    self.invalid += 1
+                    if self.invalid == 1 or self.invalid % 100 == 0:
+                        log.warning('Flight recorder: skipped invalid record %r (%d so far): %s',
+                                    item[:4], self.invalid, e)
+            if not rows:
+                continue
+            t0 = time.perf_counter()
+            self._segment.write(np.array(rows, dtype=RECORD_DTYPE))
+            self._write_s += time.perf_counter() - t0
+            self.written += len(rows)
+
+    def _row(self, item):
+        kind = item[0]
+        if kind == SENSOR:
+            s = item[1]
+            accel = s.accel or (None, None, None)
+            gyro = s.gyro or (None, None, None)
+            return (s.timestamp, s.monotonic, SENSOR, 0, 0, s.seq,
+                    _values(s.front, s.left, s.right, s.pitch, s.roll, s.yaw, s.temperature,
+                            accel[0], accel[1], accel[2], gyro[0], gyro[1], gyro[2],
+                            _age(s, s.front_at), _age(s, s.left_at), _age(s, s.right_at)))
+        if kind == COMMAND:
+            _, t, mono, command, status, left, right, seq = item
+            code = COMMANDS.index(command) + 1 if command in COMMANDS else 0
+            return (t, mono, COMMAND, code, status, seq, _values(left, right))
+        if kind == STOP:
+            _, t, mono, reason, snap, age = item
+            return (t, mono, STOP, STOP_REASONS.index(reason) + 1, 0, snap.seq if snap else 0,
+                    _values(snap.front if snap else None, age))
+        _, t, mono, frame_seq, capture_seq, shape = item
+        return (t, mono, FRAME, 0, 0, frame_seq, _values(capture_seq, shape[0], shape[1]))
+
+    def _rotate(self):
+        if self._segment is not None:
+            self._segment.close()
+        self._segment_index += 1
+        name = 'flight-%s-%04d.rec' % (time.strftime('%Y%m%d-%H%M%S'), self._segment_index)
+        self._segment = _Segment(os.path.join(self.directory, name), self.segment_records)
+        self.segments += 1
+        log.debug('Flight recorder segment %s', name)
+        self._enforce_cap()
+
+    def _enforce_cap(self):
+        """Delete the oldest segments (never the current one) until the directory fits the cap."""
+        paths = sorted(glob.glob(os.path.join(self.directory, '*.rec')), key=os.path.getmtime)
+        sizes = {p: os.path.getsize(p) for p in paths}
+        total = sum(sizes.values())
+        for path in paths:
+            if total <= self.max_total_bytes:
+                break
+            if path == self._segment.path:
+                continue
+            try:
+                os.remove(path)
+                self.deleted += 1
+                log.info('Flight recorder: deleted old segment %s', os.path.basename(path))
+            except OSError as e:
+                log.warning('Cannot delete %s: %s', path, e)
+            total -= sizes[path]
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'invalid': self.invalid,
+            'pending': len(self._pending),
+            'segments': self.segments,
+            'deleted_segments': self.deleted,
+            'segment': os.path.basename(self._segment.path) if self._segment is not None else None,
+            'write_us_per_record': round(self._write_s / self.written * 1e6, 3) if self.written else None
+        }
+
+    def stop(self):
+        """Write what is pending, close the current segment and stop the writer."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
@@ -0,0 +1,109 @@
+"""Read flight recorder segments back as NumPy arrays, or convert them to CSV.
+
+Usage:
+    python3 -m raspi_tank.recorder.reader recordings/ --kind sensor --csv sensors.csv
+    python3 -m raspi_tank.recorder.reader recordings/flight-20250101-120000-0001.rec --kind stop
+    python3 -m raspi_tank.recorder.reader recordings/ --kind command --npy commands.npy
+"""
+import argparse
+import glob
+import os
+import sys
+import numpy as np
+
+from raspi_tank.recorder.flight_recorder import (RECORD_DTYPE, HEADER, HEADER_SIZE, MAGIC, KINDS,
+                                                 VALUES, CODES, COMMANDS, STOP_REASONS)
+
+def segment_paths(path):
+    """A segment file, or every segment in a directory in recording order."""
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '*.rec')))
+    return [path]
+
+def read_segment(path):
+    """All complete records of one segment as a RECORD_DTYPE array (memory-mapped, read-only)."""
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size:
+        raise ValueError('%s: truncated header' % path)
+    magic, version, record_size, _, count, _ = HEADER.unpack(header)
+    if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError('%s: not a flight recorder segment (or an incompatible version %d)' % (path, version))
+    # the header count only covers fully written records; a file cut short has fewer
+    count = min(count, (os.path.getsize(path) - HEADER_SIZE) // record_size)
+    if count == 0:
+        return np.empty(0, RECORD_DTYPE)
+    return np.memmap(path, RECORD_DTYPE, 'r', HEADER_SIZE, (count,))
+
+def read_records(path, kind=None):
+    """Records of every segment under path, optionally only one kind ('sensor', 'command', ...)."""
+    parts = []
+    for p in segment_paths(path):
+        records = read_segment(p)
+        if kind is not None:
+            records = records[records['kind'] == KINDS[kind]]
+        parts.append(np.asarray(records))
+    return np.concatenate(parts) if parts else np.empty(0, RECORD_DTYPE)
+
+def table(records, kind):
+    """Records of one kind as a structured array with named columns (t, mono, seq and the kind's own)."""
+    k = KINDS[kind]
+    records = records[records['kind'] == k]
+    code_name, flags_name = CODES.get(k, (None, None))
+    columns = [('t', 'f8'), ('mono', 'f8'), ('seq', 'u4')]
+    if code_name:
+        columns.append((code_name, 'u1'))
+    if flags_name:
+        columns.append((flags_name, 'u2'))
+    columns += [(name, 'f4') for name in VALUES[k]]
+    out = np.empty(len(records), np.dtype(columns))
+    out['t'] = records['t']
+    out['mono'] = records['mono']
+    out['seq'] = records['seq']
+    if code_name:
+        out[code_name] = records['code']
+    if flags_name:
+        out[flags_name] = records['flags']
+    for i, name in enumerate(VALUES[k]):
+        out[name] = records['v'][:, i]
+    return out
+
+def write_csv(rows, out):
+    """Write a table() result as CSV (NaN left empty)."""
+    names = rows.dtype.names
+    fmt = ['%.6f' if rows.dtype[n].kind == 'f' and n in ('t', 'mono') else
+           '%.4g' if rows.dtype[n].kind == 'f' else '%d' for n in names]
+    out.write(','.join(names) + '\n')
+    if len(rows):
+        columns = [np.char.mod(f, rows[n]) for f, n in zip(fmt, names)]
+        for column, n in zip(columns, names):
+            if rows.dtype[n].kind == 'f':
+                column[np.isnan(rows[n])] = ''
+        out.write('\n'.join(','.join(line) for line in zip(*[c.tolist() for c in columns])) + '\n')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert flight recorder segments to NumPy or CSV.')
+    parser.add_argument('path', help='segment file or recordings directory')
+    parser.add_argument('--kind', choices=sorted(KINDS), default='sensor')
+    parser.add_argument('--csv', help="write CSV here ('-' for stdout)")
+    parser.add_argument('--npy', help='write the named-column array here (.npy)')
+    args = parser.parse_args(argv)
+
+    rows = table(read_records(args.path, args.kind), args.kind)
+    if args.npy:
+        np.save(args.npy, rows)
+    if args.csv == '-':
+        write_csv(rows, sys.stdout)
+    elif args.csv:
+        with open(args.csv, 'w') as f:
+            write_csv(rows, f)
+    if args.csv != '-':
+        span = rows['t'][-1] - rows['t'][0] if len(rows) else 0.0
+        print('%d %s records over %.1f s' % (len(rows), args.kind, span), file=sys.stderr)
+        if args.kind == 'command':
+            print('command codes: ' + ', '.join('%d=%s' % (i + 1, c) for i, c in enumerate(COMMANDS)), file=sys.stderr)
+        elif args.kind == 'stop':
+            print('reason codes: ' + ', '.join('%d=%s' % (i + 1, r) for i, r in enumerate(STOP_REASONS)), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+"""Replay recorded frames and sensor samples in place of the camera and the I2C sensors.
+
+No Pi, camera or I2C bus needed: CameraWorker(replay=ReplayFrames(...)) and
+I2CMultiplexer(replay=ReplaySensors(...)) run their normal pipelines on recorded data.
+"""
+import logging
+import math
+import os
+import threading
+import time
+import cv2
+import numpy as np
+
+from raspi_tank.recorder.reader import read_records, table
+from raspi_tank.sensors.laser import LaserReading
+from raspi_tank.config import replay as replay_conf
+
+log = logging.getLogger('Replay')
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+# sample and frame times are computed in floating point; closer than this counts as the same instant
+_TIME_EPSILON_S = 1e-6
+
+class ReplayClock:
+    """Replay timeline shared by the frame and sensor sources, in seconds since the replay started.
+
+    speed > 0 follows the wall clock scaled by speed (1.0 = real time). speed 0 runs as fast as
+    possible: time only moves when the frame source advances it, and the sensor source follows
+    synchronously, so every frame is analyzed with the sensor state recorded at its time and
+    two runs over the same data give the same results.
+    """
+    def __init__(self, speed=1.0):
+        self.speed = speed
+        self.driven = False  # a frame source advances the clock (as-fast-as-possible mode)
+        self.t = -math.inf  # latest time the frame source advanced to
+        self._start = None
+        self._followers = []
+        self._lock = threading.Lock()
+
+    @property
+    def realtime(self):
+        return self.speed > 0
+
+    def start(self):
+        """Start the timeline; the first source to call this starts it for all of them."""
+        with self._lock:
+            if self._start is None:
+                self._start = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self._start) * self.speed if self._start is not None else 0.0
+
+    def wait_until(self, t, stopped):
+        """Real time: sleep until the timeline reaches t (short steps, so stopped() is honoured)."""
+        while not stopped():
+            delay = (t - self.now()) / self.speed
+            if delay <= 0:
+                return
+            time.sleep(min(delay, 0.1))
+
+    def follow(self, advance_to):
+        """As fast as possible: call advance_to(t) whenever the frame source moves the timeline."""
+        self._followers.append(advance_to)
+
+    def advance(self, t):
+        self.t = t
+        for advance_to in self._followers:
+            advance_to(t)
+
+class ReplayFrames:
+    """Frames of a video file, or of a directory of images in name order, on the replay timeline
+    (frame n at n / fps; loop restarts from the first frame and time keeps increasing).
+    """
+    def __init__(self, path, clock, fps=None, loop=False):
+        self.path = path
+        self.clock = clock
+        self.loop = loop
+        self.index = 0  # frames delivered
+        self._files = None
+        self._cap = None
+        if os.path.isdir(path):
+            self._files = sorted(os.path.join(path, f) for f in os.listdir(path)
+                                 if f.lower().endswith(IMAGE_EXTENSIONS))
+            if not self._files:
+                raise ValueError('%s: no image files' % path)
+            self.fps = fps or 30.0
+        else:
+            self._cap = cv2.VideoCapture(path)
+            if not self._cap.isOpened():
+                raise ValueError('%s: cannot open video' % path)
+            self.fps = self._cap.get(cv2.CAP_PROP_FPS) or fps or 30.0
+        if not clock.realtime:
+            clock.driven = True
+        log.info('Replaying frames from %s at %g fps', path, self.fps)
+
+    def _next_frame(self):
+        if self._files is not None:
+            if self.index >= len(self._files) and not self.loop:
+                return None
+            return cv2.imread(self._files[self.index % len(self._files)], cv2.IMREAD_COLOR)
+        ret, frame = self._cap.read()
+        if not ret and self.loop and self.index > 0:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self._cap.read()
+        return frame if ret else None
+
+    def read(self):
+        """Next (BGR frame, time on the replay timeline), or (None, None) at the end."""
+        frame = self._next_frame()
+        if frame is None:
+            return None, None
+        t = self.index / self.fps
+        self.index += 1
+        return frame, t
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+
+class ReplaySensors:
+    """Recorded sensor samples: flight recorder segments (a directory or one .rec file), or a
+    sensor table saved by the reader with --npy. Sample times keep their recorded spacing,
+    shifted so the first sample is at offset_s on the replay timeline.
+    """
+    def __init__(self, path, clock, loop=False, offset_s=0.0):
+        self.path = path
+        self.clock = clock
+        self.loop = loop
+        if path.endswith('.npy'):
+            self.rows = np.load(path)
+        else:
+            self.rows = table(read_records(path, 'sensor'), 'sensor')
+        if len(self.rows) == 0:
+            raise ValueError('%s: no sensor records' % path)
+        mono = self.rows['mono']
+        self.times = mono - mono[0] + offset_s
+        step = float(np.median(np.diff(mono))) if len(mono) > 1 else 0.01
+        self.duration = float(self.times[-1] - offset_s) + step  # one pass, for looping
+        self.published = 0
+        self._measured_at = {'front': None, 'left': None, 'right': None}  # last recorded range of each laser
+        self._lock = threading.Lock()
+        log.info('Replaying %d sensor samples (%.1f s) from %s', len(self.rows), self.duration, path)
+
+    def _time(self, i):
+        n = len(self.rows)
+        return self.times[i % n] + (i // n) * self.duration
+
+    def _done(self):
+        return not self.loop and self.published >= len(self.rows)
+
+    def _publish_next(self, publish):
+        """Publish sample number self.published through publish(), I2CMultiplexer._publish's signature."""
+        row = self.rows[self.published % len(self.rows)]
+        now = time.monotonic()
+        value = {name: (None if math.isnan(row[name]) else float(row[name])) for name in row.dtype.names[3:]}
+        front, left, right = (self._laser(n, value[n], value.get(n + '_age'), now) for n in ('front', 'left', 'right'))
+        accel = (value['ax'], value['ay'], value['az']) if value['ax'] is not None else None
+        gyro = (value['gx'], value['gy'], value['gz']) if value['gx'] is not None else None
+        publish(front, left, right, accel, gyro, value['temperature'], value['pitch'], value['roll'], value['yaw'])
+        self.published += 1
+
+    def _laser(self, name, distance, age, now):
+        """A recorded range as a LaserReading; a missing one (NaN) is a failed read, as on the bus:
+        not fresh. The measurement time is restored from the recorded age (scaled like the
+        timeline in real time); recordings without ages use now, or the last recorded range's time.
+        """
+        if age is not None:
+            self._measured_at[name] = now - (age / self.clock.speed if self.clock.realtime else age)
+        elif distance is not None:
+            self._measured_at[name] = now
+        return LaserReading(distance, self._measured_at[name], distance is not None)
+
+    def advance_to(self, t, publish):
+        """Publish every sample recorded up to time t (within _TIME_EPSILON_S, so a sample
+        recorded at exactly a frame's time is not pushed to the next frame by float rounding).
+        """
+        with self._lock:
+            while not self._done() and self._time(self.published) <= t + _TIME_EPSILON_S:
+                self._publish_next(publish)
+
+    def run(self, publish, stopped):
+        """Real time: publish each sample when the timeline reaches it, on the calling thread.
+        As fast as possible: follow the frame source, or publish everything now if there is none.
+        """
+        if not self.clock.realtime:
+            if self.clock.driven:
+                self.clock.follow(lambda t: self.advance_to(t, publish))
+                self.advance_to(self.clock.t, publish)  # frames that came before we followed
+            else:
+                self.advance_to(math.inf if not self.loop else self.duration, publish)
+            return
+        self.clock.start()
+        while not stopped() and not self._done():
+            self.clock.wait_until(self._time(self.published), stopped)
+            if not stopped():
+                self._publish_next(publish)
+        log.info('Sensor replay finished (%d samples)', self.published)
+
+def from_config():
+    """(ReplayFrames or None, ReplaySensors or None) as set up in config.replay."""
+    if not replay_conf.get('enabled', False):
+        return None, None
+    clock = ReplayClock(replay_conf.get('speed', 1.0))
+    loop = replay_conf.get('loop', False)
+    frames = sensors = None
+    if replay_conf.get('video'):
+        frames = ReplayFrames(replay_conf['video'], clock, replay_conf.get('fps'), loop)
+    if replay_conf.get('sensors'):
+        sensors = ReplaySensors(replay_conf['sensors'], clock, loop, replay_conf.get('sensor_offset_s', 0.0))
+    return frames, sensors
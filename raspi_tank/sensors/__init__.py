@@ -1,5 +1,8 @@
 from .laser import Laser
 from .accgyro import AccelerometerGyroscope
 from .i2c_multiplexer import I2CMultiplexer
+from .snapshot import SensorSnapshot
+from .scheduler import BusScheduler
+from .history import SensorHistory
 
-__all__ = ['Laser','AccelerometerGyroscope','I2CMultiplexer']
+__all__ = ['Laser','AccelerometerGyroscope','I2CMultiplexer','SensorSnapshot','BusScheduler','SensorHistory']
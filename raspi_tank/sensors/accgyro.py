@@ -1,9 +1,29 @@
 """MPU6050 wrapper - hardware-optional."""
 import logging
 import math
+import struct
+import time
+import numpy as np
+
+from raspi_tank.sensors.snapshot import pitch_roll
 
 log = logging.getLogger('AccGyro')
 
+# MPU6050 registers used by the FIFO mode
+_SMPLRT_DIV = 0x19
+_CONFIG = 0x1A
+_GYRO_CONFIG = 0x1B
+_ACCEL_CONFIG = 0x1C
+_FIFO_EN = 0x23
+_USER_CTRL = 0x6A
+_FIFO_COUNTH = 0x72
+_FIFO_R_W = 0x74
+
+_FIFO_SIZE = 1024
+_FIFO_SAMPLE = 12  # accel xyz + gyro xyz, big-endian int16
+_ACCEL_SCALE = 9.80665 / 16384.0  # +-2 g range, LSB -> m/s^2
+_GYRO_SCALE = 1.0 / 131.0  # +-250 dps range, LSB -> deg/s
+
 try:
     import adafruit_mpu6050
     HAS_MPU = True
@@ -36,6 +56,75 @@ class AccelerometerGyroscope:
             return self.mpu.gyro
         return (0.0, 0.0, 0.0)
 
+    def start_fifo(self, sample_rate_hz=200, dlpf_cfg=3):
+        """Sample accel + gyro on the chip at sample_rate_hz into its 1 KiB FIFO (about 85 samples).
+        dlpf_cfg 1-6 enables the digital low-pass filter, which fixes the gyro output rate at 1 kHz.
+        Returns the actual sample rate.
+        """
+        if not 1 <= dlpf_cfg <= 6:
+            raise ValueError('dlpf_cfg must be 1-6 (got %r)' % dlpf_cfg)
+        div = max(0, min(255, int(round(1000.0 / sample_rate_hz)) - 1))
+        self.fifo_rate = 1000.0 / (1 + div)
+        self.fifo_overflows = 0
+        if HAS_MPU and self.mpu is not None:
+            self._write(_CONFIG, dlpf_cfg)
+            self._write(_SMPLRT_DIV, div)
+            self._write(_GYRO_CONFIG, 0x00)  # +-250 dps
+            self._write(_ACCEL_CONFIG, 0x00)  # +-2 g
+            self._reset_fifo()
+            log.info('MPU6050 FIFO started at %.0f Hz', self.fifo_rate)
+        else:
+            self._stub_last = time.monotonic()
+        return self.fifo_rate
+
+    def _reset_fifo(self):
+        self._write(_FIFO_EN, 0x00)
+        self._write(_USER_CTRL, 0x04)  # FIFO_RESET
+        self._write(_USER_CTRL, 0x40)  # FIFO_EN
+        self._write(_FIFO_EN, 0x78)  # XG, YG, ZG, ACCEL
+
+    def read_fifo(self):
+        """Burst-read every complete sample in the FIFO in one transfer.
+        Returns (accel, gyro) float arrays of shape (n, 3) in m/s^2 and deg/s; n may be 0.
+        """
+        if HAS_MPU and self.mpu is not None:
+            count = struct.unpack('>H', self._read(_FIFO_COUNTH, 2))[0]
+            if count >= _FIFO_SIZE:
+                # overflowed: the oldest samples are lost and the stream may be misaligned
+                self.fifo_overflows += 1
+                log.warning('MPU6050 FIFO overflow (%d so far), resetting', self.fifo_overflows)
+                self._reset_fifo()
+                return np.empty((0, 3)), np.empty((0, 3))
+            n = count // _FIFO_SAMPLE
+            if n == 0:
+                return np.empty((0, 3)), np.empty((0, 3))
+            raw = np.frombuffer(bytes(self._read(_FIFO_R_W, n * _FIFO_SAMPLE)), dtype='>i2').reshape(n, 6)
+        else:
+            raw = self._stub_fifo()
+        data = raw.astype(np.float64)
+        return data[:, :3] * _ACCEL_SCALE, data[:, 3:] * _GYRO_SCALE
+
+    def _stub_fifo(self):
+        """Samples produced since the last read: level and still, with noise and a small gyro bias."""
+        now = time.monotonic()
+        n = min(int((now - self._stub_last) * self.fifo_rate), _FIFO_SIZE // _FIFO_SAMPLE)
+        self._stub_last += n / self.fifo_rate
+        rng = np.random.default_rng()
+        raw = np.empty((n, 6))
+        raw[:, :3] = rng.normal((0.0, 0.0, 16384.0), 40.0, (n, 3))
+        raw[:, 3:] = rng.normal((40.0, -25.0, 60.0), 15.0, (n, 3))
+        return raw.astype('>i2')
+
+    def _write(self, register, value):
+        with self.mpu.i2c_device as i2c:
+            i2c.write(bytes([register, value]))
+
+    def _read(self, register, length):
+        buf = bytearray(length)
+        with self.mpu.i2c_device as i2c:
+            i2c.write_then_readinto(bytes([register]), buf)
+        return buf
+
     def getTemperature(self):
         if HAS_MPU and self.mpu is not None:
             try:
@@ -58,16 +147,10 @@ class AccelerometerGyroscope:
     def getYawPitchRoll(self):
         """Calculate yaw, pitch, roll from accelerometer data.
         Note: Yaw cannot be determined from accelerometer alone (needs gyro/magnetometer).
-        Returns angles in degrees.
+        Returns angles in degrees. Fused pitch/roll and integrated yaw are in I2CMultiplexer.snapshot().
         """
-        x, y, z = self.getAccelerometerMeasurements()
-        
-        # Pitch: rotation around Y axis (forward/backward tilt)
-        pitch = math.atan2(x, math.sqrt(y*y + z*z)) * 180.0 / math.pi if (y*y + z*z) != 0 else 0
-        
-        # Roll: rotation around X axis (left/right tilt)
-        roll = math.atan2(y, math.sqrt(x*x + z*z)) * 180.0 / math.pi if (x*x + z*z) != 0 else 0
-        
+        pitch, roll = pitch_roll(self.getAccelerometerMeasurements())
+
         # Yaw: rotation around Z axis (cannot be computed from accelerometer alone)
         # Would need gyroscope integration or magnetometer
         yaw = 0.0
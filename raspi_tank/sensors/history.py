@@ -0,0 +1,162 @@
+"""Fixed-size history of sensor snapshots in a NumPy structured-array ring."""
+import threading
+import time
+import numpy as np
+
+# one record per published snapshot; NaN where a value was unavailable
+HISTORY_DTYPE = np.dtype([
+    ('t', 'f8'),  # time.time()
+    ('mono', 'f8'),  # time.monotonic(), what queries search on (never jumps)
+    ('front', 'f4'),
+    ('left', 'f4'),
+    ('right', 'f4'),
+    ('pitch', 'f4'),
+    ('roll', 'f4'),
+    ('yaw', 'f4'),
+    ('temperature', 'f4'),
+    ('ax', 'f4'), ('ay', 'f4'), ('az', 'f4'),
+    ('gx', 'f4'), ('gy', 'f4'), ('gz', 'f4')
+])
+
+FIELDS = HISTORY_DTYPE.names[2:]
+
+def _nan(value):
+    return np.nan if value is None else value
+
+class SensorHistory:
+    """Bounded history: capacity records, preallocated once; the oldest are overwritten.
+
+    A single writer (the I2C thread) appends; readers never lock it out for the length of a
+    query. query() reduces the requested time range in place with ufunc.reduceat on the
+    ring's physical segments, so only per-bucket results are allocated, never a copy of
+    the buffer. Buckets the writer may have overwritten meanwhile are dropped.
+    """
+    def __init__(self, capacity=60000):
+        self.capacity = capacity
+        self._data = np.full(capacity, np.nan, dtype=HISTORY_DTYPE)
+        self._count = 0  # records ever appended; the next one goes to _count % capacity
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, snap):
+        """Record a SensorSnapshot."""
+        accel = snap.accel or (None, None, None)
+        gyro = snap.gyro or (None, None, None)
+        row = (snap.timestamp, snap.monotonic, _nan(snap.front), _nan(snap.left), _nan(snap.right),
+               _nan(snap.pitch), _nan(snap.roll), _nan(snap.yaw), _nan(snap.temperature),
+               _nan(accel[0]), _nan(accel[1]), _nan(accel[2]), _nan(gyro[0]), _nan(gyro[1]), _nan(gyro[2]))
+        with self._lock:
+            self._data[self._count % self.capacity] = row
+            self._count += 1
+
+    def _locate(self, mono, count):
+        """Absolute index of the first record at or after monotonic time mono."""
+        first = max(0, count - self.capacity)
+        if count == first:
+            return count
+        start = first % self.capacity
+        column = self._data['mono']
+        # the ring in logical order is [start:end] followed by [:start]
+        if start == 0:
+            return first + int(np.searchsorted(column[:count - first], mono))
+        if mono <= column[-1]:
+            return first + int(np.searchsorted(column[start:], mono))
+        return first + (self.capacity - start) + int(np.searchsorted(column[:start], mono))
+
+    def query(self, since=None, max_points=300, fields=FIELDS):
+        """Records with time.time() >= since (or the last -since seconds if since < 0; all if None),
+        reduced to at most max_points buckets of consecutive records.
+
+        Returns {'t': bucket mean times, 'count': records per bucket,
+        'fields': {name: {'min': [...], 'max': [...], 'mean': [...]}}} with NaN as None.
+        """
+        now_wall, now_mono = time.time(), time.monotonic()
+        with self._lock:
+            count = self._count
+        if since is None:
+            start = max(0, count - self.capacity)
+        else:
+            wall = since if since >= 0 else now_wall + since
+            start = self._locate(now_mono - (now_wall - wall), count)
+        n = count - start
+        result = {'t': [], 'count': [], 'fields': {f: {'min': [], 'max': [], 'mean': []} for f in fields}}
+        if n <= 0:
+            return result
+
+        buckets = min(max(1, max_points), n)
+        edges = start + (np.arange(buckets + 1) * n) // buckets  # absolute indices, edges[-1] == count
+        parts = [self._reduce(edges, lo, hi, fields) for lo, hi in self._segments(start, count)]
+        merged = _merge(parts, buckets)
+
+        # drop buckets the writer may have overwritten while we were reading
+        with self._lock:
+            oldest = self._count - self.capacity
+        keep = edges[:-1] >= oldest
+        result['t'] = _jsonable(merged['t'][keep], 3)
+        result['count'] = merged['n'][keep].tolist()
+        for f in fields:
+            for stat in ('min', 'max', 'mean'):
+                result['fields'][f][stat] = _jsonable(merged[f][stat][keep], 2)
+        return result
+
+    def _segments(self, start, count):
+        """Split absolute range [start, count) at the physical wrap point."""
+        wrap = (start // self.capacity + 1) * self.capacity
+        if count <= wrap:
+            return [(start, count)]
+        return [(start, wrap), (wrap, count)]
+
+    def _reduce(self, edges, lo, hi, fields):
+        """Per-bucket partial reductions of the physical slice holding absolute records [lo, hi)."""
+        # bucket boundaries inside this segment, plus the segment start
+        inner = edges[(edges > lo) & (edges < hi)]
+        starts = np.concatenate(([lo], inner)) - lo
+        bucket = np.searchsorted(edges, lo, side='right') - 1  # bucket index of the first record
+        base = lo % self.capacity
+        view = self._data[base:base + (hi - lo)]
+        lengths = np.diff(np.append(starts, hi - lo))
+        part = {'bucket': bucket + np.arange(len(starts)), 'n': lengths}
+        t = view['t']
+        part['t_sum'] = np.add.reduceat(t, starts)
+        for f in fields:
+            column = view[f]
+            valid = ~np.isnan(column)
+            part[f] = {
+                'min': np.fmin.reduceat(column, starts),
+                'max': np.fmax.reduceat(column, starts),
+                'sum': np.add.reduceat(np.where(valid, column, 0.0), starts, dtype=np.float64),
+                'valid': np.add.reduceat(valid, starts, dtype=np.int64)
+            }
+        return part
+
+def _merge(parts, buckets):
+    """Combine segment partials; a bucket split by the wrap point appears in both segments."""
+    n = np.zeros(buckets, np.int64)
+    t_sum = np.zeros(buckets)
+    out = {}
+    for part in parts:
+        np.add.at(n, part['bucket'], part['n'])
+        np.add.at(t_sum, part['bucket'], part['t_sum'])
+    for name in (k for k in parts[0] if isinstance(parts[0][k], dict)):
+        lo = np.full(buckets, np.nan)
+        hi = np.full(buckets, np.nan)
+        total = np.zeros(buckets)
+        valid = np.zeros(buckets, np.int64)
+        for part in parts:
+            b = part['bucket']
+            lo[b] = np.fmin(lo[b], part[name]['min'])
+            hi[b] = np.fmax(hi[b], part[name]['max'])
+            np.add.at(total, b, part[name]['sum'])
+            np.add.at(valid, b, part[name]['valid'])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(valid > 0, total / np.maximum(valid, 1), np.nan)
+        out[name] = {'min': lo, 'max': hi, 'mean': mean}
+    out['n'] = n
+    out['t'] = t_sum / np.maximum(n, 1)
+    return out
+
+def _jsonable(values, decimals):
+    values = np.round(values.astype(np.float64), decimals)
+    return [None if v != v else v for v in values.tolist()]
@@ -1,6 +1,8 @@
 """I2C multiplexer manager: creates sensor instances and regularly polls them in a thread."""
 import logging
+import threading
 import time
+import numpy as np
 
 log = logging.getLogger('I2CMux')
 
@@ -8,19 +10,48 @@ try:
     import board
     import adafruit_tca9548a
     HAS_TCA = True
+
+    class _Channel(adafruit_tca9548a.TCA9548A_Channel):
+        """Mux channel that writes the TCA9548A select register only when the channel changes,
+        and leaves it selected on unlock, so back-to-back reads on one channel cost no switch.
+        """
+        def try_lock(self):
+            while not self.tca.i2c.try_lock():
+                time.sleep(0)
+            if getattr(self.tca, '_selected', None) != self.channel_switch[0]:
+                self.tca.i2c.writeto(self.tca.address, self.channel_switch)
+                self.tca._selected = self.channel_switch[0]
+            return True
+
+        def unlock(self):
+            return self.tca.i2c.unlock()
 except Exception:
     HAS_TCA = False
 
-from raspi_tank.sensors.laser import Laser
+from raspi_tank.sensors.laser import Laser, LaserReading
 from raspi_tank.sensors.accgyro import AccelerometerGyroscope
-from raspi_tank.config import laser as laser_conf
+from raspi_tank.sensors.snapshot import EMPTY_SNAPSHOT
+from raspi_tank.sensors.scheduler import BusScheduler
+from raspi_tank.sensors.imu_filter import ComplementaryFilter, Orientation
+from raspi_tank.sensors.history import SensorHistory
+from raspi_tank.config import laser as laser_conf, i2c as i2c_conf, imu as imu_conf
+
+# TCA9548A channel of each device
+CHANNELS = {'imu': 3, 'right': 4, 'front': 5, 'left': 6}
+
+NO_READING = LaserReading(None, None, False)
 
 class I2CMultiplexer:
-    def __init__(self):
+    def __init__(self, recorder=None, replay=None):
         # ensure assignments refer to module-level HAS_TCA
         global HAS_TCA
         self._stopped = False
-        self._last_update = time.time()
+        # readers get this reference and nothing else; the poller replaces it, never mutates it.
+        # Timestamped at creation so the watchdog's freshness check starts counting from here.
+        self._snapshot = EMPTY_SNAPSHOT._replace(timestamp=time.time(), monotonic=time.monotonic())
+        self._snapshot_cond = threading.Condition()  # notified on every publish (wait_for_snapshot)
+        self.history = SensorHistory(i2c_conf.get('history_size', 60000))
+        self.recorder = recorder  # optional FlightRecorder, gets every published snapshot
 
         # sensor objects
         self.front = None
@@ -28,15 +59,21 @@ class I2CMultiplexer:
         self.right = None
         self.mpu = None
 
+        self.replay = replay  # optional ReplaySensors: publish recorded samples, no I2C at all
+        if replay is not None:
+            log.info('Replaying recorded sensor samples instead of the I2C sensors')
+            self.scheduler = None
+            return
+
         if HAS_TCA:
             i2c = board.I2C()
             tca = adafruit_tca9548a.TCA9548A(i2c)
             # create laser sensors on configured mux channels if present
             try:
-                self.right = Laser(tca[4], name='right')
-                self.front = Laser(tca[5], name='front')
-                self.left = Laser(tca[6], name='left')
-                self.mpu = AccelerometerGyroscope(tca[3])
+                self.right = Laser(_Channel(tca, CHANNELS['right']), name='right')
+                self.front = Laser(_Channel(tca, CHANNELS['front']), name='front')
+                self.left = Laser(_Channel(tca, CHANNELS['left']), name='left')
+                self.mpu = AccelerometerGyroscope(_Channel(tca, CHANNELS['imu']))
                 log.info('I2C multiplexer and sensors initialized')
             except Exception as e:
                 log.exception('Error initializing sensors via TCA: %s', e)
@@ -44,35 +81,125 @@ class I2CMultiplexer:
 
         if not HAS_TCA:
             # fallback: create stub sensors (they will return simulated values)
-            self.front = Laser(None, name='front-stub')
-            self.left = Laser(None, name='left-stub')
-            self.right = Laser(None, name='right-stub')
+            sensors_conf = laser_conf.get('sensors', {})
+            self.front = Laser(None, name='front-stub', conf=sensors_conf.get('front'))
+            self.left = Laser(None, name='left-stub', conf=sensors_conf.get('left'))
+            self.right = Laser(None, name='right-stub', conf=sensors_conf.get('right'))
             self.mpu = AccelerometerGyroscope(None)
             log.info('Using stub sensors')
 
-    def start(self):
-        log.info('Starting I2C polling loop')
-        while not self._stopped:
+        self._setup_imu()
+        self.scheduler = self._build_scheduler()
+
+    def _setup_imu(self):
+        self.imu_mode = imu_conf.get('mode', 'single')
+        rate = imu_conf.get('sample_rate_hz', 200)
+        if self.imu_mode == 'fifo':
             try:
-                f = self.front.getMeasurement()
-                l = self.left.getMeasurement()
-                r = self.right.getMeasurement()
-                acc = self.mpu.getAccelerometerMeasurements()
-                gyro = self.mpu.getGyroscopeMeasurements()
-
-                self._last_update = time.time()
-                # simple console log; real app would push values to shared state
-                log.debug('Front: %s cm | Left: %s cm | Right: %s cm', f, l, r)
-                time.sleep(0.5)
+                rate = self.mpu.start_fifo(rate, imu_conf.get('dlpf_cfg', 3))
             except Exception as e:
-                log.exception('I2C polling error: %s', e)
-                time.sleep(1.0)
+                log.exception('Cannot start the MPU6050 FIFO, falling back to single reads: %s', e)
+                self.imu_mode = 'single'
+        if self.imu_mode != 'fifo':
+            rate = i2c_conf['schedule']['imu']['rate_hz']
+        self.imu_filter = ComplementaryFilter(imu_conf.get('filter_alpha', 0.98),
+                                              int(imu_conf.get('calibration_s', 2.0) * rate))
+        self._imu = Orientation(None, None, None, None, None, 0, False)
+        self._imu_last = None
+
+    def _read_imu(self):
+        """IMU task: fuse the new samples (the FIFO burst, or one register read) into an Orientation."""
+        if self.imu_mode == 'fifo':
+            accel, gyro = self.mpu.read_fifo()
+            dt = 1.0 / self.mpu.fifo_rate
+        else:
+            now = time.monotonic()
+            accel = np.array([self.mpu.getAccelerometerMeasurements()], dtype=np.float64)
+            gyro = np.degrees(np.array([self.mpu.getGyroscopeMeasurements()], dtype=np.float64))
+            dt = now - self._imu_last if self._imu_last is not None else 0.0
+            self._imu_last = now
+        if len(accel) == 0:
+            self._imu = self._imu._replace(samples=0, fresh=False)
+            return self._imu
+        pitch, roll, yaw = self.imu_filter.update(accel, gyro, dt)
+        self._imu = Orientation(tuple(accel[-1].tolist()), tuple(np.radians(gyro[-1]).tolist()),
+                                float(pitch[-1]), float(roll[-1]), float(yaw[-1]), len(accel), True)
+        return self._imu
+
+    def _build_scheduler(self):
+        schedule = i2c_conf['schedule']
+        scheduler = BusScheduler(on_tick=self._on_tick, window_s=i2c_conf.get('stats_window_s', 2.0))
+        lasers = {'front': self.front, 'left': self.left, 'right': self.right}
+        data_ready = laser_conf.get('read_mode', 'poll') == 'data_ready'
+        for name, laser in lasers.items():
+            conf = schedule[name]
+            if data_ready:
+                # read once per measurement, when the sensor says it is due
+                scheduler.add(name, CHANNELS[name], laser.rate_hz, conf.get('priority', 0),
+                              laser.read, next_due=laser.next_read_time)
+            else:
+                scheduler.add(name, CHANNELS[name], conf['rate_hz'], conf.get('priority', 0), laser.read)
+        reads = {
+            'imu': self._read_imu,
+            'temperature': self.mpu.getTemperature
+        }
+        for name, read in reads.items():
+            conf = schedule[name]
+            channel = CHANNELS['imu'] if name == 'temperature' else CHANNELS[name]
+            scheduler.add(name, channel, conf['rate_hz'], conf.get('priority', 0), read)
+        return scheduler
+
+    def start(self):
+        if self.replay is not None:
+            self.replay.run(self._publish, lambda: self._stopped)
+            return
+        log.info('Starting I2C scheduler')
+        self.scheduler.run(lambda: self._stopped)
+
+    def _on_tick(self, values):
+        """Scheduler thread: publish a snapshot with the latest value of every device."""
+        imu = values.get('imu', self._imu)
+        self._publish(values.get('front', NO_READING), values.get('left', NO_READING),
+                      values.get('right', NO_READING), imu.accel, imu.gyro, values.get('temperature'),
+                      imu.pitch, imu.roll, imu.yaw)
+
+    def bus_stats(self):
+        """Target vs achieved read rates per device, bus utilisation and mux switches."""
+        return self.scheduler.stats() if self.scheduler is not None else {}
+
+    def _publish(self, front, left, right, accel, gyro, temperature, pitch, roll, yaw):
+        """front/left/right are LaserReadings."""
+        prev = self._snapshot
+        # a single reference assignment: readers see the old or the new snapshot, never a mix
+        self._snapshot = prev._replace(
+            seq=prev.seq + 1, timestamp=time.time(), monotonic=time.monotonic(),
+            front=front.distance, left=left.distance, right=right.distance,
+            front_at=front.timestamp, left_at=left.timestamp, right_at=right.timestamp,
+            accel=accel, gyro=gyro,
+            temperature=temperature, pitch=pitch, roll=roll, yaw=yaw)
+        with self._snapshot_cond:
+            self._snapshot_cond.notify_all()
+        self.history.append(self._snapshot)
+        if self.recorder is not None:
+            self.recorder.record_sensor(self._snapshot)
+
+    def snapshot(self):
+        """Latest SensorSnapshot. Safe from any thread and never touches the I2C bus."""
+        return self._snapshot
+
+    def wait_for_snapshot(self, last_seq, timeout=1.0):
+        """Block until a snapshot newer than last_seq is published (or timeout/stop); returns the latest one."""
+        with self._snapshot_cond:
+            self._snapshot_cond.wait_for(lambda: self._stopped or self._snapshot.seq > last_seq, timeout)
+        return self._snapshot
 
     def last_update_time(self):
-        return self._last_update
+        return self._snapshot.timestamp
 
     def stop(self):
-        self._stopped = True
+        with self._snapshot_cond:
+            self._stopped = True
+            self._snapshot_cond.notify_all()
         try:
             if self.front:
                 self.front.stop()
@@ -0,0 +1,78 @@
+"""Vectorized complementary filter: fuses batches of accelerometer and gyroscope samples."""
+import math
+from collections import namedtuple
+import numpy as np
+
+# latest accel (m/s^2) and gyro (rad/s) vectors, fused angles in degrees,
+# number of samples fused by this read and whether there were any
+Orientation = namedtuple('Orientation', 'accel gyro pitch roll yaw samples fresh')
+
+def _complementary(a0, delta, measured, alpha):
+    """a[k] = alpha * (a[k-1] + delta[k]) + (1 - alpha) * measured[k] for a whole batch at once.
+
+    Unrolled: a[k] = alpha^k * (a0 + cumsum(u[j] / alpha^j)) with u = alpha * delta + (1 - alpha) * measured.
+    Blocks keep alpha^-k within float range for any alpha; alpha 0 is the accelerometer alone.
+    """
+    if alpha == 0.0:
+        return np.array(measured, dtype=np.float64)
+    u = alpha * delta + (1.0 - alpha) * measured
+    block = max(1, int(math.log(1e6) / -math.log(alpha))) if 0.0 < alpha < 1.0 else len(u)
+    out = np.empty_like(u)
+    for start in range(0, len(u), block):
+        chunk = u[start:start + block]
+        p = alpha ** np.arange(1, len(chunk) + 1)
+        out[start:start + block] = p * (a0 + np.cumsum(chunk / p))
+        a0 = out[start + len(chunk) - 1]
+    return out
+
+class ComplementaryFilter:
+    """Pitch and roll from the gyroscope, pulled towards the accelerometer's gravity direction
+    (weight 1 - alpha per sample); yaw is the integrated gyroscope Z rate (it drifts slowly,
+    nothing observes heading). The first calibration_samples gyro samples, taken with the
+    robot still, estimate the gyro bias; until then angles come from the accelerometer only.
+    alpha must be within [0, 1]: 0 ignores the gyroscope for pitch and roll, 1 the accelerometer.
+    """
+    def __init__(self, alpha=0.98, calibration_samples=0):
+        if not 0.0 <= alpha <= 1.0:
+            raise ValueError('filter_alpha must be within [0, 1] (got %r)' % alpha)
+        self.alpha = alpha
+        self.bias = np.zeros(3)
+        self.pitch = None
+        self.roll = None
+        self.yaw = 0.0
+        self._calibration_samples = calibration_samples
+        self._calib_sum = np.zeros(3)
+        self._calib_count = 0
+
+    @property
+    def calibrated(self):
+        return self._calib_count >= self._calibration_samples
+
+    def update(self, accel, gyro, dt):
+        """Fuse n samples: accel (n, 3) in any unit, gyro (n, 3) in deg/s, dt (s) scalar or (n,).
+        Returns (pitch, roll, yaw) arrays in degrees, one value per sample.
+        """
+        accel = np.asarray(accel, dtype=np.float64)
+        gyro = np.asarray(gyro, dtype=np.float64)
+        ax, ay, az = accel[:, 0], accel[:, 1], accel[:, 2]
+        acc_pitch = np.degrees(np.arctan2(ax, np.hypot(ay, az)))
+        acc_roll = np.degrees(np.arctan2(ay, np.hypot(ax, az)))
+
+        if not self.calibrated:
+            take = gyro[:self._calibration_samples - self._calib_count]
+            self._calib_sum += take.sum(axis=0)
+            self._calib_count += len(take)
+            if self.calibrated:
+                self.bias = self._calib_sum / self._calib_count
+            self.pitch, self.roll = acc_pitch[-1], acc_roll[-1]
+            return acc_pitch, acc_roll, np.full(len(accel), self.yaw)
+
+        if self.pitch is None:
+            self.pitch, self.roll = acc_pitch[0], acc_roll[0]
+        rate = (gyro - self.bias) * np.broadcast_to(np.asarray(dt, dtype=np.float64), len(gyro))[:, None]
+        # body rotation about +Y lowers the accelerometer's pitch, about +X raises its roll
+        pitch = _complementary(self.pitch, -rate[:, 1], acc_pitch, self.alpha)
+        roll = _complementary(self.roll, rate[:, 0], acc_roll, self.alpha)
+        yaw = (self.yaw + np.cumsum(rate[:, 2]) + 180.0) % 360.0 - 180.0
+        self.pitch, self.roll, self.yaw = pitch[-1], roll[-1], yaw[-1]
+        return pitch, roll, yaw
@@ -1,6 +1,10 @@
 """VL53L1X wrapper - hardware-optional (uses adafruit lib if available)."""
 import logging
-from time import sleep
+import struct
+import time
+from collections import namedtuple
+
+from raspi_tank.config import laser as laser_conf
 
 log = logging.getLogger('Laser')
 
@@ -11,36 +15,139 @@ try:
 except Exception:
     HAS_VL53 = False
 
+TIMING_BUDGETS_MS = (15, 20, 33, 50, 100, 200, 500)
+
+# distance in cm (None if unavailable), time.monotonic() when it was collected,
+# and whether it is a new measurement or the previous one repeated
+LaserReading = namedtuple('LaserReading', 'distance timestamp fresh')
+
 class Laser:
-    def __init__(self, i2c_or_bus=None, name='laser'):
+    """One VL53L1X ranging continuously.
+
+    conf (defaults to config.laser['sensors'][name]) sets distance_mode, timing_budget_ms
+    and inter_measurement_ms. read() returns a LaserReading; with read_mode 'data_ready'
+    next_read_time() tells the scheduler when the next measurement will be available, so
+    the sensor is read once per measurement instead of being polled.
+    """
+    def __init__(self, i2c_or_bus=None, name='laser', conf=None):
         self.name = name
+        if conf is None:
+            conf = laser_conf.get('sensors', {}).get(name, {})
+        self.distance_mode = conf.get('distance_mode', 1)
+        self.timing_budget_ms = conf.get('timing_budget_ms', 100)
+        self.inter_measurement_ms = conf.get('inter_measurement_ms', self.timing_budget_ms)
+        if self.timing_budget_ms not in TIMING_BUDGETS_MS:
+            raise ValueError('%s: timing budget %r ms not supported (expected one of %s)'
+                             % (name, self.timing_budget_ms, ', '.join(map(str, TIMING_BUDGETS_MS))))
+        if self.inter_measurement_ms < self.timing_budget_ms:
+            raise ValueError('%s: inter-measurement period (%d ms) shorter than the timing budget (%d ms)'
+                             % (name, self.inter_measurement_ms, self.timing_budget_ms))
+        self.period = self.inter_measurement_ms / 1000.0
+        self.distance = None
+        self.timestamp = None  # when the last fresh measurement was collected
+        self._reading = LaserReading(None, None, False)  # last fresh (or failed) reading
+        self._last_fresh = False  # whether the last read() got a new measurement
+        self._miss_at = None  # last read() that found no new measurement
+        self._ready_at = None  # estimated time the last measurement became ready
+        self.errors = 0  # failed reads so far
+        self._failures = 0  # consecutive failed reads (retry backoff)
+
         global HAS_VL53
         if HAS_VL53:
             # i2c_or_bus expected to be an I2C object (or multiplexer channel)
             self.vl = adafruit_vl53l1x.VL53L1X(i2c_or_bus)
-            self.vl.distance_mode = 1
-            self.vl.timing_budget = 100
+            self.vl.distance_mode = self.distance_mode
+            self.vl.timing_budget = self.timing_budget_ms
+            self._set_inter_measurement(self.inter_measurement_ms)
             self.vl.start_ranging()
-            log.info('%s: VL53L1X started', self.name)
+            log.info('%s: VL53L1X started (mode %d, budget %d ms, period %d ms)', self.name,
+                     self.distance_mode, self.timing_budget_ms, self.inter_measurement_ms)
         else:
             log.warning('%s: adafruit_vl53l1x not available, using stub', self.name)
             self.vl = None
-        self.distance = None
+            self._stub_t0 = time.monotonic()
+            self._stub_measurement = -1
 
-    def getMeasurement(self):
+    def _set_inter_measurement(self, ms):
+        """SYSTEM__INTERMEASUREMENT_PERIOD in oscillator ticks, as in ST's ULD driver
+        (VL53L1X_SetInterMeasurementInMs); the adafruit driver does not expose it.
+        """
+        try:
+            clock_pll = struct.unpack('>H', self.vl._read_register(0x00DE, 2))[0] & 0x3FF
+            self.vl._write_register(0x006C, struct.pack('>I', int(clock_pll * ms * 1.075)))
+        except Exception as e:
+            log.warning('%s: cannot set inter-measurement period: %s', self.name, e)
+
+    @property
+    def rate_hz(self):
+        return 1.0 / self.period
+
+    def read(self):
+        """Collect the latest measurement. Returns a LaserReading; fresh is False when no new
+        measurement was ready (distance and timestamp are then those of the previous one).
+        """
+        now = time.monotonic()
+        reading = self._read(now)
+        self._last_fresh = reading.fresh
+        if not reading.fresh:
+            self._miss_at = now
+        else:
+            # it became ready between the last miss and now; without a recent miss, when the
+            # sensor period says it should have (never later than now)
+            if self._miss_at is not None and now - self._miss_at < self.period:
+                self._ready_at = (self._miss_at + now) / 2.0
+            elif self._ready_at is not None:
+                self._ready_at = min(now, self._ready_at + self.period)
+            else:
+                self._ready_at = now
+            self._miss_at = None
+        return reading
+
+    def _read(self, now):
         if HAS_VL53 and self.vl is not None:
             try:
                 if self.vl.data_ready:
                     self.distance = self.vl.distance
                     self.vl.clear_interrupt()
-                return self.distance
+                    self.timestamp = now
+                    self._reading = LaserReading(self.distance, now, True)
+                    self._failures = 0
+                    return self._reading
             except Exception as e:
-                log.exception('VL53 read error: %s', e)
-                return None
-        # stubbed behavior
+                self.errors += 1
+                self._failures += 1
+                if self.errors == 1 or self.errors % 100 == 0:
+                    log.exception('%s: VL53 read error (%d so far): %s', self.name, self.errors, e)
+                # no distance, but keep the time of the last real measurement so it keeps aging
+                self._reading = LaserReading(None, self._reading.timestamp, False)
+                return self._reading
+            return self._reading._replace(fresh=False)
+        # stubbed behavior: a new random distance once per inter-measurement period,
+        # on a free-running clock like the real sensor's
+        measurement = int((now - self._stub_t0) / self.period)
+        if measurement == self._stub_measurement:
+            return self._reading._replace(fresh=False)
+        self._stub_measurement = measurement
         import random
         self.distance = random.uniform(60, 200)  # cm
-        return self.distance
+        self.timestamp = now
+        self._reading = LaserReading(self.distance, now, True)
+        return self._reading
+
+    def getMeasurement(self):
+        return self.read().distance
+
+    def next_read_time(self, now):
+        """When to read next in data-ready mode: one period after the estimated ready time of
+        the last measurement, plus a small margin; if it was not ready yet, retry in short steps.
+        The ready-time estimate follows the sensor's own clock, so normally one read per measurement.
+        After failed reads the retry delay doubles from 1 ms up to one period.
+        """
+        if self._failures:
+            return now + min(self.period, 0.001 * 2 ** min(self._failures, 16))
+        if self._last_fresh:
+            return self._ready_at + self.period + max(0.0005, self.period * 0.02)
+        return now + max(0.001, self.period * 0.05)
 
     def stop(self):
         if HAS_VL53 and self.vl is not None:
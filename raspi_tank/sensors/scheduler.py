@@ -0,0 +1,178 @@
+"""Rate-aware scheduler for the devices behind the TCA9548A multiplexer."""
+import logging
+import time
+
+from raspi_tank.metrics import REGISTRY
+
+log = logging.getLogger('BusScheduler')
+
+class BusTask:
+    """One periodic read: a device (or register group) on a mux channel."""
+    def __init__(self, name, channel, rate_hz, priority, read, next_due=None):
+        self.name = name
+        self.channel = channel
+        self.rate_hz = rate_hz
+        self.period = 1.0 / rate_hz
+        self.priority = priority
+        self.read = read
+        self.next_due_fn = next_due  # optional next_due(now) -> time of the next read, overrides the rate
+        self.next_due = 0.0
+        self.value = None
+        self.reads = 0
+        self.samples = 0  # new data points read (values with fresh=False are repeats)
+        self.errors = 0
+        self.missed = 0  # whole periods skipped because the bus was busy
+        self.busy_s = 0.0
+        self._win_reads = 0
+        self._win_samples = 0
+        self._win_busy = 0.0
+        self.timer = REGISTRY.histogram('raspitank_i2c_read_seconds', 'Time per I2C read, per device.', device=name)
+
+class BusScheduler:
+    """Runs every task at its own rate on one thread, so one bus is never shared between threads.
+
+    When several reads are due at once, channels are visited in priority order (the
+    highest-priority due read first, the channel already selected on ties) and every
+    due read on a channel is done while it is selected, so the mux switches as little
+    as possible. A read that falls behind skips the missed periods instead of bursting.
+    A task may instead supply next_due(now), e.g. a sensor that knows when its next
+    measurement will be ready.
+    on_tick(values) is called after each batch with the latest value of every task.
+    """
+    def __init__(self, on_tick=None, window_s=2.0):
+        self.tasks = []
+        self.on_tick = on_tick
+        self.window_s = window_s
+        self.values = {}
+        self.switches = 0
+        self._channel = None
+        self._win_start = time.monotonic()
+        self._win_busy = 0.0
+        self._win_switches = 0
+        self._last_window = None
+        self._loop_rate = REGISTRY.loop_rate('raspitank_i2c_loop_hz', 'I2C scheduler passes that ran reads, per second.')
+        self._publish_timer = REGISTRY.histogram('raspitank_i2c_publish_seconds',
+                                                 'Time to publish the sensor snapshot after a batch of reads.')
+        REGISTRY.gauge('raspitank_i2c_utilisation', 'Share of time the I2C bus was busy (last stats window).',
+                       lambda: (self._last_window or {}).get('utilisation'))
+
+    def add(self, name, channel, rate_hz, priority, read, next_due=None):
+        task = BusTask(name, channel, rate_hz, priority, read, next_due)
+        self.tasks.append(task)
+        return task
+
+    def _order(self, due):
+        """Group due tasks by channel; channels by their best priority, the current one first on ties."""
+        groups = {}
+        for task in due:
+            groups.setdefault(task.channel, []).append(task)
+        channels = sorted(groups, key=lambda c: (-max(t.priority for t in groups[c]), c != self._channel))
+        ordered = []
+        for channel in channels:
+            ordered.extend(sorted(groups[channel], key=lambda t: -t.priority))
+        return ordered
+
+    def run_once(self):
+        """Run the reads that are due. Returns the seconds until the next one is due."""
+        now = time.monotonic()
+        due = [t for t in self.tasks if t.next_due <= now]
+        for task in self._order(due):
+            if task.channel != self._channel:
+                self._channel = task.channel
+                self.switches += 1
+                self._win_switches += 1
+            t0 = time.monotonic()
+            try:
+                task.value = self.values[task.name] = task.read()
+                task.reads += 1
+                task._win_reads += 1
+                # values may say how many samples they carry (FIFO bursts) or whether they are new
+                new = getattr(task.value, 'samples', None)
+                if new is None:
+                    new = 1 if getattr(task.value, 'fresh', True) else 0
+                task.samples += new
+                task._win_samples += new
+            except Exception as e:
+                task.errors += 1
+                if task.errors == 1 or task.errors % 100 == 0:
+                    log.exception('%s read error (%d so far): %s', task.name, task.errors, e)
+            t1 = time.monotonic()
+            task.timer.observe(t1 - t0)
+            task.busy_s += t1 - t0
+            task._win_busy += t1 - t0
+            self._win_busy += t1 - t0
+            if task.next_due_fn is not None:
+                task.next_due = task.next_due_fn(t1)
+                continue
+            # next slot on the grid; a slightly late read just runs on the next pass,
+            # one more than a whole period behind skips the missed slots
+            task.next_due += task.period
+            if task.next_due < t1 - task.period:
+                task.missed += int((t1 - task.next_due) / task.period)
+                task.next_due = t1 + task.period
+        if due:
+            self._loop_rate.tick()
+            if self.on_tick is not None:
+                t0 = time.monotonic()
+                self.on_tick(self.values)
+                self._publish_timer.observe(time.monotonic() - t0)
+        now = time.monotonic()
+        if now - self._win_start >= self.window_s:
+            self._roll_window(now)
+        return max(0.0, min(t.next_due for t in self.tasks) - now) if self.tasks else self.window_s
+
+    def run(self, stopped):
+        """Loop until stopped() returns True."""
+        now = time.monotonic()
+        for task in self.tasks:
+            task.next_due = now
+        self._win_start = now
+        log.info('Bus scheduler running: %s', ', '.join(
+            '%s@%gHz/p%d' % (t.name, t.rate_hz, t.priority) for t in self.tasks))
+        while not stopped():
+            delay = self.run_once()
+            if delay > 0:
+                time.sleep(delay)
+
+    def _roll_window(self, now):
+        elapsed = now - self._win_start
+        self._last_window = {
+            'window_s': round(elapsed, 2),
+            'utilisation': round(self._win_busy / elapsed, 3),
+            'mux_switches_hz': round(self._win_switches / elapsed, 1),
+            'achieved_hz': {t.name: round(t._win_reads / elapsed, 1) for t in self.tasks},
+            'samples_hz': {t.name: round(t._win_samples / elapsed, 1) for t in self.tasks},
+            'read_ms': {t.name: round(t._win_busy / t._win_reads * 1000.0, 3) if t._win_reads else None
+                        for t in self.tasks}
+        }
+        for task in self.tasks:
+            task._win_reads = 0
+            task._win_samples = 0
+            task._win_busy = 0.0
+        self._win_busy = 0.0
+        self._win_switches = 0
+        self._win_start = now
+
+    def stats(self):
+        """Achieved rates and bus utilisation over the last completed window, plus running totals."""
+        window = self._last_window or {}
+        achieved = window.get('achieved_hz', {})
+        samples = window.get('samples_hz', {})
+        read_ms = window.get('read_ms', {})
+        return {
+            'window_s': window.get('window_s'),
+            'utilisation': window.get('utilisation'),
+            'mux_switches_hz': window.get('mux_switches_hz'),
+            'mux_switches': self.switches,
+            'devices': {t.name: {
+                'channel': t.channel,
+                'priority': t.priority,
+                'target_hz': t.rate_hz,
+                'achieved_hz': achieved.get(t.name),
+                'samples_hz': samples.get(t.name),
+                'read_ms': read_ms.get(t.name),
+                'reads': t.reads,
+                'errors': t.errors,
+                'missed': t.missed
+            } for t in self.tasks}
+        }
@@ -0,0 +1,44 @@
+"""Immutable sensor snapshot published by the I2C poller and read by everyone else."""
+import math
+import time
+from collections import namedtuple
+
+_FIELDS = (
+    'seq',          # increases by one with every published snapshot
+    'timestamp',    # time.time() of the poll (logs, recordings)
+    'monotonic',    # time.monotonic() of the poll (ages, timeouts)
+    'front',        # laser ranges in cm, None if unavailable
+    'left',
+    'right',
+    'front_at',     # time.monotonic() each range was measured (None before the first one)
+    'left_at',
+    'right_at',
+    'accel',        # (x, y, z) m/s^2
+    'gyro',         # (x, y, z) rad/s
+    'temperature',  # degrees C
+    'pitch',        # degrees, gyro + accelerometer fusion
+    'roll',
+    'yaw'           # degrees, integrated gyro (relative to startup heading)
+)
+
+class SensorSnapshot(namedtuple('SensorSnapshot', _FIELDS)):
+    """One consistent set of readings. Never mutated: the poller builds a new one and swaps
+    the reference, so readers on any thread just take the current object, no lock and no I2C.
+    """
+    __slots__ = ()
+
+    def age(self, now=None):
+        """Seconds since the poll that produced this snapshot."""
+        return (now if now is not None else time.monotonic()) - self.monotonic
+
+    def to_dict(self):
+        return self._asdict()
+
+EMPTY_SNAPSHOT = SensorSnapshot(0, 0.0, 0.0, *([None] * (len(_FIELDS) - 3)))
+
+def pitch_roll(accel):
+    """Pitch and roll in degrees from an accelerometer vector (gravity direction)."""
+    x, y, z = accel
+    pitch = math.degrees(math.atan2(x, math.sqrt(y * y + z * z))) if (y * y + z * z) != 0 else 0.0
+    roll = math.degrees(math.atan2(y, math.sqrt(x * x + z * z))) if (x * x + z * z) != 0 else 0.0
+    return pitch, roll
@@ -1,4 +1,5 @@
 """Streaming package for video and web interface."""
 from .mjpeg_streamer import MJPEGStreamer
+from .broadcaster import JPEGBroadcaster
 
-__all__ = ['MJPEGStreamer']
+__all__ = ['MJPEGStreamer', 'JPEGBroadcaster']
@@ -0,0 +1,369 @@
+"""Single event-loop HTTP server for the dashboard, the MJPEG stream and the REST API.
+
+Alternative to the Flask development server (camera['stream_server'] = 'asyncio'):
+no thread per viewer, every client is a coroutine on one asyncio loop. Viewers
+wait on an asyncio.Event set by the JPEG broadcaster, so an idle viewer costs
+nothing, and backpressure comes from awaiting the transport drain.
+"""
+import asyncio
+import json
+import logging
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs
+
+from raspi_tank.streaming.broadcaster import multipart_part
+from raspi_tank.streaming.dashboard import INDEX_HTML
+from raspi_tank.streaming.telemetry import delta, sse_message, SSE_KEEPALIVE, SSE_RETRY
+from raspi_tank.streaming.clients import stream_metrics
+from raspi_tank.streaming.websocket import ProtocolError, handshake_response, is_upgrade
+from raspi_tank.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from raspi_tank.config import camera as camera_conf
+
+log = logging.getLogger('AsyncServer')
+
+_WRITE, _AGE, _SENT = stream_metrics('asyncio')
+
+MAX_BODY = 64 * 1024
+
+def _arg(args, name, conv):
+    """First value of a query parameter converted with conv, None if missing or invalid."""
+    try:
+        return conv(args[name][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+class AsyncStreamServer:
+    """Serves the MJPEGStreamer routes from a single asyncio loop running in its own thread.
+
+    Motor commands (GPIO writes) and history queries run on a small thread pool so the loop never stalls;
+    everything else, sensor data included (it only reads the poller's snapshot), runs on the loop.
+    """
+    def __init__(self, streamer):
+        self.streamer = streamer
+        self.loop = None
+        self._server = None
+        self._shutdown = None
+        self._frame_event = None  # replaced on every published frame, set to wake viewers
+        self._telemetry_event = None  # same for telemetry changes
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='AsyncAPI')
+        self._stopped = False
+
+    def run(self):
+        """Run the event loop until stop() is called (blocking, call from a thread)."""
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._serve())
+        except Exception as e:
+            log.exception('Async server error: %s', e)
+        finally:
+            # close the connections still open (viewers blocked in drain, keep-alive clients)
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+            self._executor.shutdown(wait=False)
+            log.info('Async server stopped')
+
+    async def _serve(self):
+        self._shutdown = asyncio.Event()
+        self._frame_event = asyncio.Event()
+        self._telemetry_event = asyncio.Event()
+        self.streamer.broadcaster.add_listener(self._on_jpeg)
+        self.streamer.telemetry.add_listener(self._on_telemetry)
+        self._server = await asyncio.start_server(self._handle, self.streamer.host, self.streamer.port)
+        log.info('Async server listening on %s:%d', self.streamer.host, self.streamer.port)
+        try:
+            await self._shutdown.wait()
+        finally:
+            self.streamer.broadcaster.remove_listener(self._on_jpeg)
+            self.streamer.telemetry.remove_listener(self._on_telemetry)
+            self._server.close()
+            await self._server.wait_closed()
+
+    def _on_jpeg(self, seq):
+        # encoder thread -> loop thread
+        try:
+            self.loop.call_soon_threadsafe(self._wake_viewers)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _wake_viewers(self):
+        event, self._frame_event = self._frame_event, asyncio.Event()
+        event.set()
+
+    def _on_telemetry(self, seq):
+        # sampler thread -> loop thread
+        try:
+            self.loop.call_soon_threadsafe(self._wake_telemetry)
+        except RuntimeError:
+            pass
+
+    def _wake_telemetry(self):
+        event, self._telemetry_event = self._telemetry_event, asyncio.Event()
+        event.set()
+
+    async def _handle(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        remote_addr = peer[0] if peer else None
+        try:
+            while not self._stopped:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, args, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if path == '/video_feed' and method == 'GET':
+                    await self._stream_video(writer, args, headers, remote_addr)
+                    break
+                if path == '/api/telemetry' and method == 'GET':
+                    await self._stream_telemetry(writer)
+                    break
+                if path == '/api/control/ws' and method == 'GET':
+                    if is_upgrade(headers):
+                        await self._control_channel(reader, writer, headers, remote_addr)
+                        break
+                    status, content_type, payload = _json(426, {'error': 'WebSocket upgrade required'})
+                    await self._respond(writer, status, content_type, payload, keep_alive, {'Upgrade': 'websocket'})
+                else:
+                    status, content_type, payload = await self._dispatch(method, path, args, body)
+                    await self._respond(writer, status, content_type, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass  # client went away, or server shutdown
+        except ValueError as e:
+            log.debug('Bad request from %s: %s', remote_addr, e)
+            try:
+                await self._respond(writer, 400, 'text/plain', b'Bad Request', False)
+            except ConnectionError:
+                pass
+        except Exception as e:
+            log.exception('Error handling request from %s: %s', remote_addr, e)
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Parse one HTTP/1.1 request. Returns None when the client closed the connection."""
+        line = await reader.readline()
+        if not line:
+            return None
+        parts = line.decode('latin-1').split()
+        if len(parts) != 3:
+            raise ValueError('malformed request line %r' % line[:80])
+        method, target, _ = parts
+        headers = {}
+        while True:
+            header = await reader.readline()
+            if header in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = header.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length') or 0)
+        if length < 0 or length > MAX_BODY:
+            raise ValueError('request body of %d bytes' % length)
+        body = await reader.readexactly(length) if length else b''
+        path, _, query = target.partition('?')
+        return method.upper(), path, parse_qs(query), headers, body
+
+    async def _dispatch(self, method, path, args, body):
+        """Route a plain request. Returns (status, content type, payload bytes)."""
+        streamer = self.streamer
+        try:
+            if path == '/':
+                if method != 'GET':
+                    return _json(405, {'error': 'Method not allowed'})
+                return 200, 'text/html; charset=utf-8', INDEX_HTML.encode('utf-8')
+            if path == '/metrics' and method == 'GET':
+                return 200, METRICS_CONTENT_TYPE, REGISTRY.render().encode('utf-8')
+            if path == '/api/sensors' and method == 'GET':
+                return _json(200, streamer.sensor_data())
+            if path == '/api/pipeline' and method == 'GET':
+                return _json(200, streamer.pipeline_data())
+            if path == '/api/history' and method == 'GET':
+                # reduces up to the whole ring: keep it off the loop
+                payload, status = await self.loop.run_in_executor(
+                    self._executor, streamer.history_data, _arg(args, 'since', float),
+                    _arg(args, 'max_points', int) or 300, _arg(args, 'fields', str))
+                return _json(status, payload)
+            if path == '/api/i2c' and method == 'GET':
+                return _json(200, streamer.bus_data())
+            if path == '/api/time' and method == 'GET':
+                return _json(200, streamer.time_data())
+            if path == '/api/latency':
+                if method == 'GET':
+                    return _json(200, streamer.latency_data())
+                if method != 'POST':
+                    return _json(405, {'success': False, 'error': 'Method not allowed'})
+                try:
+                    data = json.loads(body or b'{}')
+                except ValueError:
+                    data = None
+                payload, status = streamer.report_latency(data)
+                return _json(status, payload)
+            if path == '/api/stream_clients' and method == 'GET':
+                return _json(200, {'clients': streamer.clients.snapshot()})
+            if path == '/api/control':
+                if method != 'POST':
+                    return _json(405, {'success': False, 'error': 'Method not allowed'})
+                try:
+                    command = json.loads(body or b'{}').get('command')
+                except (ValueError, AttributeError):
+                    return _json(400, {'success': False, 'error': 'Invalid JSON'})
+                payload, status = await self.loop.run_in_executor(self._executor, streamer.execute_command, command)
+                return _json(status, payload)
+        except Exception as e:
+            log.exception('API error on %s: %s', path, e)
+            return _json(500, {'error': str(e)})
+        return _json(404, {'error': 'Not found'})
+
+    async def _respond(self, writer, status, content_type, payload, keep_alive=True, headers=None):
+        head = 'HTTP/1.1 %d %s\r\nContent-Type: %s\r\nContent-Length: %d\r\nConnection: %s\r\n%s\r\n' % (
+            status, HTTPStatus(status).phrase, content_type, len(payload), 'keep-alive' if keep_alive else 'close',
+            ''.join('%s: %s\r\n' % item for item in (headers or {}).items()))
+        writer.write(head.encode('latin-1') + payload)
+        await writer.drain()
+
+    async def _stream_video(self, writer, args, headers, remote_addr):
+        """MJPEG stream for one viewer. Same pacing, skipping and adaptation as the Flask generator."""
+        streamer = self.streamer
+        broadcaster = streamer.broadcaster
+        client = streamer.clients.add(remote_addr, headers.get('user-agent'),
+                                      width=_arg(args, 'width', int),
+                                      fps=_arg(args, 'fps', float),
+                                      quality=_arg(args, 'q', int))
+        # small kernel and transport buffers: a slow link makes drain() wait, which drives adaptation
+        sndbuf = camera_conf.get('stream_socket_sndbuf', 65536)
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+            except OSError as e:
+                log.debug('Cannot set send buffer size: %s', e)
+        writer.transport.set_write_buffer_limits(high=sndbuf)
+        log.info('Async viewer %d connected (%s)', client.id, remote_addr)
+
+        seq = 0
+        broadcaster.subscribe(client.width, client.quality)
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: multipart/x-mixed-replace; boundary=frame\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'X-Stream-Client: %d\r\n'
+                         b'Connection: close\r\n\r\n' % client.id)
+            await writer.drain()
+            while not self._stopped and not streamer._stopped:
+                if writer.is_closing():
+                    break  # viewer disconnected (drain() does not raise once the transport is closing)
+                delay = client.next_send_time() - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+                new_seq, frame_bytes, published_at, captured_at = broadcaster.wait_for_jpeg(
+                    seq, client.width, client.quality, timeout=0)
+                if frame_bytes is None:
+                    # no await between the check and taking the event: a publish cannot be missed
+                    try:
+                        await asyncio.wait_for(self._frame_event.wait(), 1.0)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                if seq > 0 and new_seq - seq > 1:
+                    client.on_skipped(new_seq - seq - 1)
+                seq = new_seq
+                frame_age = time.monotonic() - published_at
+                if client.is_stale(frame_age):
+                    continue
+
+                part = multipart_part(frame_bytes, seq, captured_at)
+                t0 = time.monotonic()
+                writer.write(part)
+                await writer.drain()
+                write_s = time.monotonic() - t0
+                _WRITE.observe(write_s)
+                _AGE.observe(frame_age)
+                _SENT.tick()
+                old_quality = client.quality
+                if client.on_sent(len(part), write_s, frame_age, captured_at):
+                    broadcaster.change_quality(client.width, old_quality, client.quality)
+        finally:
+            broadcaster.unsubscribe(client.width, client.quality)
+            streamer.clients.remove(client)
+            log.info('Async viewer %d disconnected (sent %d frames)', client.id, client.frames_sent)
+
+    async def _control_channel(self, reader, writer, headers, remote_addr):
+        """WebSocket control channel. Commands run on the loop: Motor only updates a target
+        and skips redundant pin writes, so a command costs microseconds.
+        """
+        session = self.streamer.control.open(remote_addr)
+        try:
+            writer.write(handshake_response(headers['sec-websocket-key']) + session.hello())
+            await writer.drain()
+            while not self._stopped:
+                try:
+                    data = await asyncio.wait_for(reader.read(4096), session.wait_timeout())
+                except asyncio.TimeoutError:
+                    writer.write(session.tick())
+                    await writer.drain()
+                    continue
+                if not data:
+                    break
+                reply, close = session.on_frames(data)
+                if reply:
+                    writer.write(reply)
+                    await writer.drain()
+                if close:
+                    break
+        except ProtocolError as e:
+            log.debug('Control channel protocol error from %s: %s', remote_addr, e)
+        finally:
+            session.close()
+
+    async def _stream_telemetry(self, writer):
+        """Server-Sent Events: the full state first, then only the keys that changed."""
+        telemetry = self.streamer.telemetry
+        keepalive = camera_conf.get('telemetry_keepalive_s', 15.0)
+        sent = {}
+        seq = 0
+        telemetry.subscribe()
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/event-stream\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'Connection: close\r\n\r\n' + SSE_RETRY)
+            await writer.drain()
+            while not self._stopped and not writer.is_closing():
+                new_seq, state = telemetry.latest()
+                if new_seq == seq:
+                    event = self._telemetry_event
+                    try:
+                        await asyncio.wait_for(event.wait(), keepalive)
+                    except asyncio.TimeoutError:
+                        writer.write(SSE_KEEPALIVE)
+                        await writer.drain()
+                    continue
+                seq = new_seq
+                changes = delta(state, sent)
+                if changes:
+                    writer.write(sse_message(seq, changes))
+                    await writer.drain()
+                    sent = state
+        finally:
+            telemetry.unsubscribe()
+
+    def stop(self):
+        self._stopped = True
+        if self.loop is not None and self._shutdown is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._shutdown.set)
+            except RuntimeError:
+                pass
+
+def _json(status, data):
+    return status, 'application/json', json.dumps(data).encode('utf-8')
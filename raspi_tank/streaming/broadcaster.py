@@ -0,0 +1,244 @@
+"""Encode-once JPEG broadcaster: a single encoder thread shared by all MJPEG viewers."""
+import logging
+import threading
+import time
+import cv2
+import numpy as np
+
+from raspi_tank.streaming.encoders import create_encoder, is_i420, i420_planes
+from raspi_tank.metrics import REGISTRY
+from raspi_tank.config import camera as camera_conf
+
+log = logging.getLogger('Broadcaster')
+
+_HELP = 'Broadcaster sub-steps per stream variant: resize to the variant width, JPEG encode.'
+_RESIZE = REGISTRY.histogram('raspitank_broadcast_seconds', _HELP, step='resize')
+_ENCODE = REGISTRY.histogram('raspitank_broadcast_seconds', _HELP, step='encode')
+
+def multipart_part(jpeg, seq, captured_at):
+    """One multipart/x-mixed-replace part. Besides the JPEG it carries the camera sequence number
+    and the wall-clock capture time, so a viewer can measure capture-to-display latency.
+    """
+    head = 'Content-Type: image/jpeg\r\nContent-Length: %d\r\nX-Frame-Seq: %d\r\n' % (len(jpeg), seq)
+    if captured_at is not None:
+        head += 'X-Capture-Timestamp: %.6f\r\n' % captured_at
+    return b'--frame\r\n' + head.encode('ascii') + b'\r\n' + jpeg + b'\r\n'
+
+def scale_frame(frame, width):
+    """Resize a BGR or I420 frame to the given width, keeping the aspect ratio."""
+    if is_i420(frame):
+        # the U and V planes are (h/2, width/2), stored as h/4 full-width rows each:
+        # width must be even and h a multiple of 4
+        y, u, v = i420_planes(frame)
+        width = max(2, width // 2 * 2)
+        h = max(4, y.shape[0] * width // y.shape[1] // 4 * 4)
+        out = np.empty((h * 3 // 2, width), np.uint8)
+        cv2.resize(y, (width, h), dst=out[:h], interpolation=cv2.INTER_AREA)
+        q = h // 4
+        for plane, rows in ((u, out[h:h + q]), (v, out[h + q:h + 2 * q])):
+            rows.reshape(h // 2, width // 2)[...] = cv2.resize(plane, (width // 2, h // 2), interpolation=cv2.INTER_AREA)
+        return out
+    h = frame.shape[0] * width // frame.shape[1]
+    return cv2.resize(frame, (width, h), interpolation=cv2.INTER_AREA)
+
+class _Variant:
+    """One (width, quality) rendition of the stream and the viewers watching it."""
+    def __init__(self, width, quality):
+        self.width = width
+        self.quality = quality
+        self.viewers = 0
+        self.jpeg = None
+        self.seq = 0
+        self.encoded = 0
+        self.idle_since = time.monotonic()
+
+class JPEGBroadcaster:
+    """Encodes each annotated frame once per stream variant and fans the bytes out to every viewer.
+
+    The encoder thread only runs while at least one viewer is subscribed and wakes
+    on the camera's new-frame notification, so duplicate frames are never encoded.
+    Viewers subscribe to a variant: an output width (None = native) and a JPEG quality.
+    For each new frame every width in use is resized once and every (width, quality)
+    in use is encoded once, however many viewers share it. Variants nobody watches are
+    evicted after camera['stream_variant_linger_s'].
+    Viewers block in wait_for_jpeg() until a JPEG newer than the one they sent is available.
+    """
+    def __init__(self, camera_worker, quality=None):
+        self.camera_worker = camera_worker
+        self.quality = quality if quality is not None else camera_conf.get('jpeg_quality', 85)
+        self.encoder = create_encoder(camera_conf.get('jpeg_backend', 'opencv'), self.quality,
+                                      camera_conf.get('jpeg_subsampling', '420'))
+        self.linger_s = camera_conf.get('stream_variant_linger_s', 5.0)
+        self._cond = threading.Condition()
+        self._variants = {}  # (width, quality) -> _Variant
+        self._seq = 0  # camera sequence number of the current JPEGs
+        self._published_at = 0.0  # monotonic time the current JPEGs became available
+        self._captured_at = None  # wall-clock time the current frame was captured
+        self._stopped = False
+        self._thread = None
+        self._listeners = []  # called from the encoder thread after each publish
+        self.encoded_count = 0
+        self.resized_count = 0
+        self.evicted_count = 0
+        self.skipped_frames = 0  # camera frames published while the encoder was busy
+
+    def start(self):
+        self._thread = threading.Thread(name='JPEGEncoder', target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def add_listener(self, callback):
+        """Call callback(seq) from the encoder thread whenever new JPEGs are published.
+        Lets event-loop servers wake their viewers without blocking in wait_for_jpeg().
+        """
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def subscribe(self, width=None, quality=None):
+        with self._cond:
+            self._acquire_variant(width, quality if quality is not None else self.quality)
+            self._cond.notify_all()
+            log.info('Viewer connected (%d active)', self.viewer_count())
+
+    def unsubscribe(self, width=None, quality=None):
+        with self._cond:
+            self._release_variant(width, quality if quality is not None else self.quality)
+            log.info('Viewer disconnected (%d active)', self.viewer_count())
+
+    def change_quality(self, width, old, new):
+        """Move one viewer from quality old to new; the next frame is encoded at new as well."""
+        if old == new:
+            return
+        with self._cond:
+            self._release_variant(width, old)
+            self._acquire_variant(width, new)
+
+    def _acquire_variant(self, width, quality):
+        variant = self._variants.get((width, quality))
+        if variant is None:
+            variant = self._variants[(width, quality)] = _Variant(width, quality)
+            log.info('Stream variant %sx q%d created', width or 'native', quality)
+        variant.viewers += 1
+
+    def _release_variant(self, width, quality):
+        variant = self._variants.get((width, quality))
+        if variant is not None:
+            variant.viewers = max(0, variant.viewers - 1)
+            if variant.viewers == 0:
+                variant.idle_since = time.monotonic()
+
+    def _evict_idle(self, now):
+        for key, variant in list(self._variants.items()):
+            if variant.viewers == 0 and now - variant.idle_since > self.linger_s:
+                del self._variants[key]
+                self.evicted_count += 1
+                log.info('Stream variant %sx q%d evicted', variant.width or 'native', variant.quality)
+
+    def viewer_count(self):
+        return sum(v.viewers for v in self._variants.values())
+
+    def stats(self):
+        with self._cond:
+            variants = [{
+                'width': v.width,
+                'quality': v.quality,
+                'viewers': v.viewers,
+                'encoded': v.encoded,
+                'bytes': len(v.jpeg) if v.jpeg else 0
+            } for v in self._variants.values()]
+        return {
+            'encoded': self.encoded_count,
+            'resized': self.resized_count,
+            'evicted': self.evicted_count,
+            'skipped': self.skipped_frames,
+            'viewers': sum(v['viewers'] for v in variants),
+            'variants': variants,
+            'seq': self._seq
+        }
+
+    def wait_for_jpeg(self, last_seq, width=None, quality=None, timeout=1.0):
+        """Block until a JPEG of this width newer than last_seq exists.
+        Returns (seq, bytes, published_at, captured_at) or (last_seq, None, None, None) on timeout. If the requested
+        quality has not been encoded for this frame yet (viewer just changed it), the closest one is returned.
+        """
+        if quality is None:
+            quality = self.quality
+
+        def candidates():
+            return [v for v in self._variants.values()
+                    if v.width == width and v.jpeg is not None and v.seq == self._seq]
+
+        with self._cond:
+            self._cond.wait_for(lambda: self._stopped or (self._seq > last_seq and candidates()), timeout)
+            found = candidates() if self._seq > last_seq else None
+            if not found:
+                return last_seq, None, None, None
+            variant = min(found, key=lambda v: abs(v.quality - quality))
+            return self._seq, variant.jpeg, self._published_at, self._captured_at
+
+    def _run(self):
+        log.info('JPEG encoder started (%s, quality=%d)', self.encoder.name, self.quality)
+        while not self._stopped:
+            try:
+                # idle while nobody is watching
+                with self._cond:
+                    self._cond.wait_for(lambda: self._stopped or self.viewer_count() > 0, timeout=self.linger_s)
+                    self._evict_idle(time.monotonic())
+                    active = [v for v in self._variants.values() if v.viewers > 0]
+                if self._stopped:
+                    break
+                if not active:
+                    continue
+
+                seq, view = self.camera_worker.wait_for_frame(self._seq, timeout=0.5)
+                if view is None:
+                    continue  # no new frame yet: nothing to encode
+
+                # one resize per width and one encode per (width, quality) in use;
+                # the native width is encoded straight from the pinned camera slot, no copy
+                jpegs = {}
+                captured_at = view.captured_at
+                with view:
+                    scaled = {}
+                    for variant in active:
+                        frame = view.array
+                        if variant.width is not None and variant.width < frame.shape[1]:
+                            frame = scaled.get(variant.width)
+                            if frame is None:
+                                t0 = time.perf_counter()
+                                frame = scaled[variant.width] = scale_frame(view.array, variant.width)
+                                _RESIZE.observe(time.perf_counter() - t0)
+                                self.resized_count += 1
+                        t0 = time.perf_counter()
+                        jpegs[variant] = self.encoder.encode(frame, variant.quality)
+                        _ENCODE.observe(time.perf_counter() - t0)
+
+                if self._seq > 0:
+                    self.skipped_frames += max(0, seq - self._seq - 1)
+                with self._cond:
+                    for variant, jpeg in jpegs.items():
+                        variant.jpeg = jpeg
+                        variant.seq = seq
+                        variant.encoded += 1
+                    self._seq = seq
+                    self._published_at = time.monotonic()
+                    self._captured_at = captured_at
+                    self._cond.notify_all()
+                    listeners = list(self._listeners)
+                self.encoded_count += len(jpegs)
+                for callback in listeners:
+                    callback(seq)
+            except Exception as e:
+                log.exception('Error in JPEG encoder: %s', e)
+                time.sleep(0.1)
+        log.info('JPEG encoder stopped (encoded %d frames total)', self.encoded_count)
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
@@ -0,0 +1,245 @@
+"""Per-client state for /video_feed: pacing, adaptive JPEG quality/fps and send statistics."""
+import collections
+import itertools
+import logging
+import math
+import threading
+import time
+
+from raspi_tank.metrics import REGISTRY
+from raspi_tank.config import camera as camera_conf
+
+log = logging.getLogger('StreamClients')
+
+def stream_metrics(server):
+    """(write time histogram, frame age histogram, sent frame rate) shared by every viewer of a server
+    (one thread per viewer with Flask, hence the locked variants).
+    """
+    return (REGISTRY.histogram('raspitank_stream_write_seconds', 'Time to write one MJPEG part to a viewer socket.',
+                               shared=True, server=server),
+            REGISTRY.histogram('raspitank_stream_frame_age_seconds', 'Age of each frame when sent (since encoded).',
+                               shared=True, server=server),
+            REGISTRY.loop_rate('raspitank_stream_frames_per_second', 'Frames sent per second, all viewers.',
+                               shared=True, server=server))
+
+_GLASS_TO_GLASS = REGISTRY.histogram(
+    'raspitank_glass_to_glass_seconds', 'Capture-to-display latency reported by dashboard viewers.',
+    buckets=camera_conf.get('latency_buckets_s', (0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0)),
+    shared=True)  # reports arrive on any request thread
+
+# latency reports outside this range (ms) come from a bad clock offset estimate, not from the pipeline
+LATENCY_RANGE_MS = (0.0, 60000.0)
+
+class LatencyWindow:
+    """The last N latency samples (ms) of one viewer, summarised as percentiles on demand."""
+    PERCENTILES = (50, 90, 95, 99)
+
+    def __init__(self, size=None):
+        self._samples = collections.deque(maxlen=size or camera_conf.get('latency_window', 300))
+        self.total = 0
+
+    def add(self, ms):
+        self._samples.append(ms)
+        self.total += 1
+
+    def summary(self):
+        """{'count', 'p50', 'p90', 'p95', 'p99', 'max'} in ms (nearest rank), or {'count': 0}."""
+        return latency_summary(list(self._samples))
+
+    def samples(self):
+        return list(self._samples)
+
+def latency_summary(samples):
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    n = len(ordered)
+    out = {'count': n}
+    for p in LatencyWindow.PERCENTILES:
+        out['p%d' % p] = round(ordered[max(0, math.ceil(p / 100.0 * n) - 1)], 1)
+    out['max'] = round(ordered[-1], 1)
+    return out
+
+class StreamClient:
+    """One MJPEG viewer.
+
+    The streamer reports every frame it writes (size, time blocked in the socket write,
+    frame age). A write that eats a large share of the frame budget means the link
+    cannot keep up: quality is lowered first, then frame rate. When writes are cheap
+    again, frame rate is restored first, then quality. Everything stays within the
+    camera['stream_*'] bounds and frames are skipped, never queued.
+    A client may ask for a smaller width and cap its fps and quality (query parameters);
+    the caps become its upper bounds, adaptation still backs off below them.
+    Latency is tracked twice: capture-to-send, measured here for every frame written, and
+    capture-to-display, which only the viewer can see and reports back (see on_latency()).
+    """
+    def __init__(self, client_id, remote_addr=None, user_agent=None, width=None, fps=None, quality=None):
+        self.id = client_id
+        self.remote_addr = remote_addr
+        self.user_agent = user_agent
+        self.q_min = camera_conf.get('stream_quality_min', 40)
+        self.q_max = camera_conf.get('jpeg_quality', 85)
+        self.q_step = camera_conf.get('stream_quality_step', 10)
+        self.fps_min = camera_conf.get('stream_fps_min', 5)
+        self.fps_max = camera_conf.get('stream_fps_max', camera_conf.get('framerate', 30))
+        if quality is not None:
+            self.q_max = max(self.q_min, min(95, quality))
+        if fps is not None:
+            self.fps_max = max(self.fps_min, min(self.fps_max, fps))
+        self.width = _variant_width(width)
+        self.max_frame_age = camera_conf.get('stream_max_frame_age_s', 0.5)
+        self.quality = self.q_max
+        self.fps = float(self.fps_max)
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.frames_skipped = 0  # newer frame available before this one could be sent
+        self.frames_stale = 0  # dropped because they were older than max_frame_age
+        self.bytes_sent = 0
+        self.send_ms = 0.0  # smoothed time blocked writing one frame
+        self.frame_age_ms = 0.0  # smoothed encode-to-send delay
+        self.throughput_kbps = 0.0  # smoothed kB/s while writing
+        self.capture_to_send = LatencyWindow()
+        self.glass_to_glass = LatencyWindow()
+        self.latency_rejected = 0
+        self._last_send = 0.0
+        self._last_change = 0.0
+
+    def next_send_time(self):
+        return self._last_send + 1.0 / self.fps
+
+    def is_stale(self, frame_age):
+        if frame_age > self.max_frame_age:
+            self.frames_stale += 1
+            return True
+        return False
+
+    def on_skipped(self, count):
+        self.frames_skipped += count
+
+    def on_sent(self, nbytes, send_s, frame_age, captured_at=None):
+        """Record a written frame and adapt quality/fps. Returns True if the quality changed."""
+        now = time.monotonic()
+        if captured_at is not None:
+            self.capture_to_send.add((time.time() - captured_at) * 1000.0)
+        self._last_send = now
+        self.frames_sent += 1
+        self.bytes_sent += nbytes
+        a = 0.3
+        self.send_ms = (1 - a) * self.send_ms + a * send_s * 1000.0
+        self.frame_age_ms = (1 - a) * self.frame_age_ms + a * frame_age * 1000.0
+        if send_s > 0.002:
+            # only writes that actually blocked tell us the link rate
+            kbps = nbytes / send_s / 1024.0
+            self.throughput_kbps = kbps if self.throughput_kbps == 0.0 else (1 - a) * self.throughput_kbps + a * kbps
+        return self._adapt(now)
+
+    def on_latency(self, samples):
+        """Capture-to-display latencies (ms) measured by the viewer. Returns how many were accepted."""
+        accepted = 0
+        lo, hi = LATENCY_RANGE_MS
+        for ms in samples:
+            if isinstance(ms, bool) or not isinstance(ms, (int, float)) or not lo <= ms <= hi:
+                self.latency_rejected += 1
+                continue
+            self.glass_to_glass.add(float(ms))
+            _GLASS_TO_GLASS.observe(ms / 1000.0)
+            accepted += 1
+        return accepted
+
+    def latency(self):
+        return {
+            'capture_to_send_ms': self.capture_to_send.summary(),
+            'glass_to_glass_ms': self.glass_to_glass.summary(),
+            'rejected': self.latency_rejected
+        }
+
+    def _adapt(self, now):
+        budget_ms = 1000.0 / self.fps
+        old_quality = self.quality
+        if self.send_ms > 0.5 * budget_ms or self.frame_age_ms > self.max_frame_age * 1000.0:
+            # congested: back off quickly
+            if now - self._last_change < 0.5:
+                return False
+            if self.quality - self.q_step >= self.q_min:
+                self.quality -= self.q_step
+            elif self.fps > self.fps_min:
+                self.fps = max(float(self.fps_min), self.fps * 0.75)
+            else:
+                return False
+        elif self.send_ms < 0.15 * budget_ms:
+            # plenty of headroom: recover slowly
+            if now - self._last_change < 2.0:
+                return False
+            if self.fps < self.fps_max:
+                self.fps = min(float(self.fps_max), self.fps * 1.25 + 1)
+            elif self.quality + self.q_step <= self.q_max:
+                self.quality += self.q_step
+            else:
+                return False
+        else:
+            return False
+        self._last_change = now
+        log.debug('Client %d adapted to quality=%d fps=%.1f (send %.1f ms)', self.id, self.quality, self.fps, self.send_ms)
+        return self.quality != old_quality
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'remote_addr': self.remote_addr,
+            'user_agent': self.user_agent,
+            'width': self.width,
+            'connected_s': round(time.time() - self.connected_at, 1),
+            'quality': self.quality,
+            'fps': round(self.fps, 1),
+            'frames_sent': self.frames_sent,
+            'frames_skipped': self.frames_skipped,
+            'frames_stale': self.frames_stale,
+            'bytes_sent': self.bytes_sent,
+            'send_ms': round(self.send_ms, 2),
+            'frame_age_ms': round(self.frame_age_ms, 2),
+            'throughput_kbps': round(self.throughput_kbps, 1),
+            'latency': self.latency()
+        }
+
+def _variant_width(width):
+    """Snap a requested width to a multiple of 16 (more sharing, codec friendly); None = native."""
+    if width is None:
+        return None
+    native = camera_conf['resolution'][0] if camera_conf.get('resolution') else None
+    width = max(camera_conf.get('stream_min_width', 160), int(width) // 16 * 16)
+    if native is not None and width >= native:
+        return None
+    return width
+
+class ClientRegistry:
+    """Thread-safe set of connected stream clients."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._ids = itertools.count(1)
+
+    def add(self, remote_addr=None, user_agent=None, width=None, fps=None, quality=None):
+        with self._lock:
+            client = StreamClient(next(self._ids), remote_addr, user_agent, width, fps, quality)
+            self._clients[client.id] = client
+        return client
+
+    def remove(self, client):
+        with self._lock:
+            self._clients.pop(client.id, None)
+
+    def get(self, client_id):
+        with self._lock:
+            return self._clients.get(client_id)
+
+    def clients(self):
+        with self._lock:
+            return list(self._clients.values())
+
+    def __len__(self):
+        return len(self._clients)
+
+    def snapshot(self):
+        with self._lock:
+            clients = list(self._clients.values())
+        return [c.to_dict() for c in clients]
@@ -0,0 +1,233 @@
+"""Low-latency control channel: compact, sequence-numbered drive commands over a WebSocket
+(/api/control/ws), with a dead-man heartbeat.
+
+Client -> server, one binary message per command (little endian, 13 bytes):
+    kind u8 (DRIVE, STOP, HEARTBEAT), seq u32 (increasing per connection),
+    client clock u32 (ms, any origin), left i16, right i16 (track speed x 1000)
+Server -> client:
+    HELLO   kind u8, heartbeat interval ms u16, dead-man window ms u16, speed u16, turn speed u16 (x 1000)
+    ACK     kind u8, seq u32, status u8, left i16, right i16 (the motor's target speeds as the ACK
+            is sent; a command still queued in the MotorArbiter shows in the next ACK)
+    DEADMAN kind u8, last accepted seq u32 (the tank was stopped: heartbeats stopped arriving)
+
+The client resends its current command every heartbeat interval (a HEARTBEAT while stopped).
+Commands with a seq not above the last accepted one are discarded as out of order; commands
+queued longer than control['max_command_delay_s'] are discarded as stale. The delay is the
+server-minus-client clock difference above its recent minimum, so the two clocks never need to
+agree. STOP is always applied; drive commands get LOCKED while a safety stop's lockout
+holds (see MotorArbiter). If a moving tank hears nothing acceptable for
+control['heartbeat_timeout_s'], or the connection drops, it is stopped.
+"""
+import logging
+import struct
+import threading
+import time
+
+from raspi_tank.streaming import websocket as ws
+from raspi_tank.metrics import REGISTRY
+from raspi_tank.config import control as control_conf, motor as motor_conf
+
+log = logging.getLogger('Control')
+
+COMMAND = struct.Struct('<BIIhh')
+DRIVE, STOP, HEARTBEAT = 1, 2, 3
+
+HELLO = struct.Struct('<BHHHH')
+ACK = struct.Struct('<BIBhh')
+DEADMAN = struct.Struct('<BI')
+MSG_HELLO, MSG_ACK, MSG_DEADMAN = 0x80, 0x81, 0x82
+
+APPLIED, STALE, OUT_OF_ORDER, UNAVAILABLE, INVALID, LOCKED = range(6)
+STATUS_NAMES = ('applied', 'stale', 'out_of_order', 'unavailable', 'invalid', 'locked')
+# as recorded by the flight recorder, which stores HTTP-like statuses
+_HTTP_STATUS = (200, 408, 409, 503, 400, 423)
+
+_DELAY = REGISTRY.histogram('raspitank_control_delay_seconds',
+                            'Control channel command delay above the best recent delay (queueing, retransmits).',
+                            shared=True)  # one thread per session with Flask
+
+class _DelayBaseline:
+    """Windowed minimum of (server clock - client clock), in ms. Two alternating windows
+    let clock drift age out instead of accumulating into the measured delay.
+    """
+    def __init__(self, window_s):
+        self.window_s = window_s
+        self._prev = None
+        self._cur = None
+        self._started = None
+
+    def delay(self, offset_ms, now):
+        if self._started is None or now - self._started > self.window_s:
+            self._prev, self._cur, self._started = self._cur, None, now
+        self._cur = offset_ms if self._cur is None else min(self._cur, offset_ms)
+        base = self._cur if self._prev is None else min(self._prev, self._cur)
+        return offset_ms - base
+
+class ControlSession:
+    """One connected controller. Transport-free: servers feed it decoded WebSocket frames
+    (on_frames) and call tick() when nothing arrived within wait_timeout().
+    """
+    def __init__(self, channel, remote_addr=None):
+        self.channel = channel
+        self.remote_addr = remote_addr
+        self.last_seq = 0
+        self.last_heard = time.monotonic()
+        self.moving = False
+        self.decoder = ws.FrameDecoder(max_size=1024)
+        self._baseline = _DelayBaseline(control_conf.get('delay_window_s', 5.0))
+
+    def hello(self):
+        ch = self.channel
+        return ws.encode_frame(ws.BINARY, HELLO.pack(
+            MSG_HELLO, int(ch.heartbeat_interval * 1000), int(ch.heartbeat_timeout * 1000),
+            int(motor_conf.get('speed', 1.0) * 1000), int(motor_conf.get('turn_speed', 1.0) * 1000)))
+
+    def wait_timeout(self, now=None):
+        """Seconds to wait for data before tick() must run (the dead-man deadline while moving)."""
+        if not self.moving:
+            return self.channel.heartbeat_timeout
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.last_heard + self.channel.heartbeat_timeout - now)
+
+    def on_frames(self, data):
+        """Handle received bytes. Returns (bytes to send back, True if the connection must close)."""
+        out = []
+        for opcode, payload in self.decoder.feed(data):
+            if opcode == ws.BINARY:
+                out.append(ws.encode_frame(ws.BINARY, self.on_message(payload)))
+            elif opcode == ws.PING:
+                out.append(ws.encode_frame(ws.PONG, payload))
+            elif opcode == ws.CLOSE:
+                out.append(ws.close_frame())
+                return b''.join(out), True
+            elif opcode == ws.TEXT:
+                out.append(ws.encode_frame(ws.BINARY, ACK.pack(MSG_ACK, 0, INVALID, 0, 0)))
+                self.channel.count(INVALID)
+        return b''.join(out) + self.tick(), False
+
+    def on_message(self, data, now=None):
+        """Handle one command message. Returns the ACK payload."""
+        now = time.monotonic() if now is None else now
+        ch = self.channel
+        if len(data) != COMMAND.size:
+            return self._ack(0, INVALID)
+        kind, seq, sent_ms, left, right = COMMAND.unpack(data)
+        if kind not in (DRIVE, STOP, HEARTBEAT):
+            return self._ack(seq, INVALID)
+        if kind == STOP:
+            # stopping is always safe: never discarded, whatever its seq or age
+            self.last_seq = max(self.last_seq, seq)
+            self.last_heard = now
+            self.moving = False
+            return self._ack(seq, ch.execute(0, 0, seq, stop=True))
+        if seq <= self.last_seq:
+            return self._ack(seq, OUT_OF_ORDER, kind == DRIVE)
+        self.last_seq = seq
+        delay_ms = self._baseline.delay(now * 1000.0 - sent_ms, now)
+        if delay_ms > ch.max_delay * 1000.0:
+            return self._ack(seq, STALE, kind == DRIVE)
+        _DELAY.observe(delay_ms / 1000.0)
+        self.last_heard = now
+        if kind == HEARTBEAT:
+            return self._ack(seq, APPLIED)
+        status = ch.execute(left / 1000.0, right / 1000.0, seq)
+        self.moving = status == APPLIED and (left != 0 or right != 0)
+        return self._ack(seq, status)
+
+    def _ack(self, seq, status, record=False):
+        ch = self.channel
+        ch.count(status)
+        if record:
+            ch.record(status, None, None, seq)
+        left, right = ch.speeds()
+        return ACK.pack(MSG_ACK, seq, status, int(left * 1000), int(right * 1000))
+
+    def tick(self, now=None):
+        """Enforce the dead-man window. Returns a DEADMAN frame if the tank was just stopped, else b''."""
+        now = time.monotonic() if now is None else now
+        if not self.moving or now - self.last_heard < self.channel.heartbeat_timeout:
+            return b''
+        self.moving = False
+        log.warning('No heartbeat from %s for %.0f ms - stopping motors',
+                    self.remote_addr, (now - self.last_heard) * 1000)
+        self.channel.deadman_stop()
+        return ws.encode_frame(ws.BINARY, DEADMAN.pack(MSG_DEADMAN, self.last_seq))
+
+    def close(self):
+        """Connection gone: a moving tank is stopped, as if heartbeats had stopped."""
+        if self.moving:
+            self.moving = False
+            log.warning('Control connection from %s lost while moving - stopping motors', self.remote_addr)
+            self.channel.deadman_stop()
+        self.channel.closed(self)
+
+class ControlChannel:
+    """State shared by every control session: the motor, the recorder and the counters."""
+    def __init__(self, motor, recorder=None):
+        self.motor = motor
+        self.recorder = recorder
+        self.heartbeat_interval = control_conf.get('heartbeat_interval_s', 0.1)
+        self.heartbeat_timeout = control_conf.get('heartbeat_timeout_s', 0.35)
+        self.max_delay = control_conf.get('max_command_delay_s', 0.2)
+        self._lock = threading.Lock()
+        self._sessions = set()
+        self._target = (0.0, 0.0)
+        self.counts = dict.fromkeys(STATUS_NAMES, 0)
+        self.deadman_stops = 0
+
+    def open(self, remote_addr=None):
+        session = ControlSession(self, remote_addr)
+        with self._lock:
+            self._sessions.add(session)
+        log.info('Control channel opened by %s (%d open)', remote_addr, len(self._sessions))
+        return session
+
+    def closed(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+        log.info('Control channel from %s closed', session.remote_addr)
+
+    def count(self, status):
+        self.counts[STATUS_NAMES[status]] += 1
+
+    def speeds(self):
+        """The speeds the motor is heading to, whoever set them (this channel, POST /api/control,
+        a watchdog stop), so ACKs never report a command that did not run.
+        """
+        if self.motor is None:
+            return 0.0, 0.0
+        return self.motor.target()
+
+    def execute(self, left, right, seq, stop=False):
+        """Apply a drive (or stop) command to the motor. Returns APPLIED, UNAVAILABLE or LOCKED."""
+        if self.motor is None:
+            return UNAVAILABLE
+        if stop:
+            left = right = 0.0
+        # also record a repeated command once something else (a safety stop, POST) changed the motor
+        changed = (left, right) != self._target or self.motor.target() != self._target
+        if stop:
+            self.motor.stop()
+        elif not self.motor.drive(left, right):
+            self.record(LOCKED, left, right, seq)
+            return LOCKED
+        self._target = (left, right)
+        if changed:
+            self.record(APPLIED, left, right, seq, 'stop' if stop else 'drive')
+        return APPLIED
+
+    def record(self, status, left, right, seq, command='drive'):
+        if self.recorder is not None:
+            self.recorder.record_command(command, _HTTP_STATUS[status], left, right, seq)
+
+    def deadman_stop(self):
+        self.deadman_stops += 1
+        self._target = (0.0, 0.0)
+        if self.motor is not None:
+            self.motor.stop()
+        if self.recorder is not None:
+            self.recorder.record_stop('heartbeat', None, None)
+
+    def stats(self):
+        return dict(self.counts, sessions=len(self._sessions), deadman_stops=self.deadman_stops,
+                    target={'left': self._target[0], 'right': self._target[1]})
@@ -0,0 +1,866 @@
+"""Dashboard page served at / by both the Flask and the asyncio server."""
+
+INDEX_HTML = '''<!DOCTYPE html>
+<html>
+<head>
+    <title>RaspiTank Control Center</title>
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <style>
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+        body {
+            font-family: 'Segoe UI', Arial, sans-serif;
+            background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%);
+            color: white;
+            padding: 20px;
+            min-height: 100vh;
+        }
+        .container {
+            max-width: 1400px;
+            margin: 0 auto;
+        }
+        h1 {
+            text-align: center;
+            color: #4CAF50;
+            margin-bottom: 20px;
+            font-size: 2.5em;
+            text-shadow: 2px 2px 4px rgba(0,0,0,0.5);
+        }
+        .main-grid {
+            display: grid;
+            grid-template-columns: 1fr 350px;
+            gap: 20px;
+            margin-bottom: 20px;
+        }
+        @media (max-width: 1024px) {
+            .main-grid {
+                grid-template-columns: 1fr;
+            }
+        }
+        .video-container {
+            background: #000000;
+            border-radius: 12px;
+            padding: 15px;
+            box-shadow: 0 8px 16px rgba(0,0,0,0.3);
+        }
+        .video-container img {
+            width: 100%;
+            border-radius: 8px;
+            display: block;
+            background: #000000;
+        }
+        .video-frame {
+            position: relative;
+        }
+        .latency-overlay {
+            position: absolute;
+            top: 10px;
+            right: 10px;
+            background: rgba(0,0,0,0.6);
+            color: #4CAF50;
+            font-family: monospace;
+            font-size: 0.9em;
+            padding: 4px 8px;
+            border-radius: 6px;
+            pointer-events: none;
+        }
+        .latency-overlay.latency-high {
+            color: #f44336;
+        }
+        .sidebar {
+            display: flex;
+            flex-direction: column;
+            gap: 20px;
+        }
+        .panel {
+            background: #2a2a3e;
+            border-radius: 12px;
+            padding: 20px;
+            box-shadow: 0 8px 16px rgba(0,0,0,0.3);
+        }
+        .panel h2 {
+            color: #4CAF50;
+            margin-bottom: 15px;
+            font-size: 1.4em;
+            border-bottom: 2px solid #4CAF50;
+            padding-bottom: 8px;
+        }
+        .sensor-grid {
+            display: grid;
+            gap: 12px;
+        }
+        .sensor-item {
+            background: #1a1a2e;
+            padding: 12px;
+            border-radius: 8px;
+            border-left: 4px solid #4CAF50;
+        }
+        .sensor-label {
+            color: #888;
+            font-size: 0.85em;
+            margin-bottom: 4px;
+        }
+        .sensor-value {
+            font-size: 1.5em;
+            font-weight: bold;
+            color: #4CAF50;
+        }
+        .sensor-unit {
+            font-size: 0.9em;
+            color: #aaa;
+            margin-left: 4px;
+        }
+        .warning {
+            border-left-color: #ff9800 !important;
+        }
+        .warning .sensor-value {
+            color: #ff9800;
+        }
+        .danger {
+            border-left-color: #f44336 !important;
+        }
+        .danger .sensor-value {
+            color: #f44336;
+        }
+        .controls {
+            display: flex;
+            flex-direction: column;
+            align-items: center;
+            gap: 15px;
+        }
+        .control-pad {
+            display: grid;
+            grid-template-columns: repeat(3, 80px);
+            grid-template-rows: repeat(3, 80px);
+            gap: 8px;
+            margin: 10px 0;
+        }
+        .control-btn {
+            background: linear-gradient(145deg, #4CAF50, #388E3C);
+            border: none;
+            border-radius: 12px;
+            color: white;
+            font-size: 1.5em;
+            cursor: pointer;
+            transition: all 0.1s;
+            box-shadow: 0 4px 8px rgba(0,0,0,0.3);
+            user-select: none;
+        }
+        .control-btn:hover {
+            background: linear-gradient(145deg, #66BB6A, #4CAF50);
+            transform: translateY(-2px);
+            box-shadow: 0 6px 12px rgba(0,0,0,0.4);
+        }
+        .control-btn:active {
+            transform: translateY(0);
+            box-shadow: 0 2px 4px rgba(0,0,0,0.3);
+        }
+        .control-btn:disabled {
+            background: #555;
+            cursor: not-allowed;
+            opacity: 0.5;
+        }
+        .btn-up { grid-column: 2; grid-row: 1; }
+        .btn-left { grid-column: 1; grid-row: 2; }
+        .btn-stop { 
+            grid-column: 2; 
+            grid-row: 2;
+            background: linear-gradient(145deg, #f44336, #c62828);
+            font-size: 1.2em;
+        }
+        .btn-stop:hover {
+            background: linear-gradient(145deg, #e57373, #f44336);
+        }
+        .btn-right { grid-column: 3; grid-row: 2; }
+        .btn-down { grid-column: 2; grid-row: 3; }
+        .status-indicator {
+            display: flex;
+            align-items: center;
+            gap: 8px;
+            padding: 10px;
+            background: #1a1a2e;
+            border-radius: 8px;
+            margin-bottom: 10px;
+        }
+        .status-dot {
+            width: 12px;
+            height: 12px;
+            border-radius: 50%;
+            background: #4CAF50;
+            animation: pulse 2s infinite;
+        }
+        @keyframes pulse {
+            0%, 100% { opacity: 1; }
+            50% { opacity: 0.5; }
+        }
+        .status-offline {
+            background: #f44336;
+        }
+        .keyboard-hint {
+            text-align: center;
+            color: #888;
+            font-size: 0.85em;
+            margin-top: 10px;
+        }
+        .control-status {
+            text-align: center;
+            color: #888;
+            font-family: monospace;
+            font-size: 0.8em;
+            margin-top: 6px;
+        }
+        .history-panel {
+            background: #2a2a3e;
+            border-radius: 12px;
+            padding: 15px;
+            margin-bottom: 20px;
+            box-shadow: 0 8px 16px rgba(0,0,0,0.3);
+        }
+        .history-header {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            margin-bottom: 10px;
+        }
+        .history-header h2 {
+            color: #4CAF50;
+            font-size: 1.2em;
+        }
+        .history-range button {
+            background: #1a1a2e;
+            color: #ccc;
+            border: 1px solid #444;
+            border-radius: 6px;
+            padding: 4px 10px;
+            cursor: pointer;
+        }
+        .history-range button.active {
+            border-color: #4CAF50;
+            color: #4CAF50;
+        }
+        #history-chart {
+            width: 100%;
+            height: 220px;
+            display: block;
+        }
+        .info-bar {
+            background: #2a2a3e;
+            border-radius: 12px;
+            padding: 15px;
+            text-align: center;
+            box-shadow: 0 8px 16px rgba(0,0,0,0.3);
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>🤖 RaspiTank Control Center</h1>
+        
+        <div class="main-grid">
+            <div class="video-container">
+                <div class="video-frame">
+                    <img id="video" alt="Video Stream">
+                    <div class="latency-overlay" id="latency-overlay">latency --</div>
+                </div>
+            </div>
+            
+            <div class="sidebar">
+                <div class="panel">
+                    <h2>📡 Sensors</h2>
+                    <div class="status-indicator">
+                        <div class="status-dot" id="status-dot"></div>
+                        <span id="status-text">Connecting...</span>
+                    </div>
+                    <div class="sensor-grid" id="sensor-data">
+                        <div class="sensor-item">
+                            <div class="sensor-label">Front Distance</div>
+                            <div class="sensor-value" id="front-dist">--<span class="sensor-unit">cm</span></div>
+                        </div>
+                        <div class="sensor-item">
+                            <div class="sensor-label">Left Distance</div>
+                            <div class="sensor-value" id="left-dist">--<span class="sensor-unit">cm</span></div>
+                        </div>
+                        <div class="sensor-item">
+                            <div class="sensor-label">Right Distance</div>
+                            <div class="sensor-value" id="right-dist">--<span class="sensor-unit">cm</span></div>
+                        </div>
+                        <div class="sensor-item">
+                            <div class="sensor-label">Temperature</div>
+                            <div class="sensor-value" id="temp">--<span class="sensor-unit">°C</span></div>
+                        </div>
+                        <div class="sensor-item">
+                            <div class="sensor-label">Pitch / Roll</div>
+                            <div class="sensor-value" style="font-size: 1.2em;" id="orientation">-- / --<span class="sensor-unit">°</span></div>
+                        </div>
+                    </div>
+                </div>
+                
+                <div class="panel">
+                    <h2>🎮 Controls</h2>
+                    <div class="controls">
+                        <div class="control-pad">
+                            <button class="control-btn btn-up" id="btn-forward" title="Forward (↑)">▲</button>
+                            <button class="control-btn btn-left" id="btn-left" title="Left (←)">◄</button>
+                            <button class="control-btn btn-stop" id="btn-stop" title="Stop (Space)">⏹</button>
+                            <button class="control-btn btn-right" id="btn-right" title="Right (→)">►</button>
+                            <button class="control-btn btn-down" id="btn-backward" title="Backward (↓)">▼</button>
+                        </div>
+                        <div class="keyboard-hint">
+                            💡 Use arrow keys or W/A/S/D<br>Space to stop
+                        </div>
+                        <div class="control-status" id="control-status">control: connecting...</div>
+                    </div>
+                </div>
+            </div>
+        </div>
+        
+        <div class="history-panel">
+            <div class="history-header">
+                <h2>📈 Distance History</h2>
+                <div class="history-range">
+                    <button data-seconds="10">10 s</button>
+                    <button data-seconds="60" class="active">1 min</button>
+                    <button data-seconds="300">5 min</button>
+                </div>
+            </div>
+            <canvas id="history-chart"></canvas>
+        </div>
+
+        <div class="info-bar">
+            <span id="qr-info">No QR code detected</span>
+        </div>
+    </div>
+
+    <script>
+        // Sensor telemetry, pushed by the server (Server-Sent Events).
+        // Messages use short keys and carry only the fields that changed.
+        const sensors = {};
+
+        function showStatus(online, text) {
+            const statusDot = document.getElementById('status-dot');
+            statusDot.classList.toggle('status-offline', !online);
+            document.getElementById('status-text').textContent = text;
+        }
+
+        function renderSensors(data) {
+            // Update distance sensors
+            updateSensorValue('front-dist', data.f, 40);
+            updateSensorValue('left-dist', data.l, 30);
+            updateSensorValue('right-dist', data.r, 30);
+
+            // Update IMU data
+            document.getElementById('temp').innerHTML =
+                (data.t ?? '--') + '<span class="sensor-unit">°C</span>';
+            document.getElementById('orientation').innerHTML =
+                `${data.p ?? '--'} / ${data.ro ?? '--'}<span class="sensor-unit">°</span>`;
+
+            // Update QR info
+            if (data.qr) {
+                document.getElementById('qr-info').textContent = '📱 QR: ' + data.qr;
+            } else {
+                document.getElementById('qr-info').textContent = 'No QR code detected';
+            }
+        }
+
+        function connectTelemetry() {
+            const source = new EventSource('/api/telemetry');
+            source.onopen = () => showStatus(true, 'Connected');
+            source.onmessage = (e) => {
+                Object.assign(sensors, JSON.parse(e.data));
+                renderSensors(sensors);
+            };
+            // EventSource reconnects by itself; the server resends the full state
+            source.onerror = () => showStatus(false, 'Connection Error');
+        }
+
+        function updateSensorValue(elementId, value, warningThreshold) {
+            const element = document.getElementById(elementId);
+            const parent = element.closest('.sensor-item');
+            
+            if (value === null || value === undefined) {
+                element.innerHTML = '--<span class="sensor-unit">cm</span>';
+                parent.classList.remove('warning', 'danger');
+                return;
+            }
+            
+            const numValue = parseFloat(value);
+            element.innerHTML = numValue.toFixed(1) + '<span class="sensor-unit">cm</span>';
+            
+            parent.classList.remove('warning', 'danger');
+            if (numValue < warningThreshold * 0.5) {
+                parent.classList.add('danger');
+            } else if (numValue < warningThreshold) {
+                parent.classList.add('warning');
+            }
+        }
+        
+        // Motor control: a WebSocket channel (/api/control/ws) carrying 13-byte, sequence-numbered
+        // commands. The current command is resent every heartbeat interval, so a lost message or keyup
+        // is repaired at once and the tank stops by itself when the page goes quiet.
+        // Without the channel, commands fall back to POST /api/control.
+        const DRIVE = 1, STOP = 2, HEARTBEAT = 3;
+        const control = {ws: null, seq: 0, command: 'stop', speed: 1.0, turn: 1.0, timer: null,
+                         sent: new Map(), rtt: null, discarded: 0, note: null};
+
+        function trackSpeeds(command) {
+            switch (command) {
+                case 'forward': return [control.speed, control.speed];
+                case 'backward': return [-control.speed, -control.speed];
+                case 'left': return [control.turn, -control.turn];
+                case 'right': return [-control.turn, control.turn];
+                default: return [0, 0];
+            }
+        }
+
+        function sendControl(kind) {
+            const ws = control.ws;
+            if (!ws || ws.readyState !== WebSocket.OPEN) return false;
+            const [left, right] = trackSpeeds(control.command);
+            const msg = new DataView(new ArrayBuffer(13));
+            const seq = ++control.seq;
+            msg.setUint8(0, kind);
+            msg.setUint32(1, seq, true);
+            msg.setUint32(5, Math.floor(performance.now()) % 4294967296, true);
+            msg.setInt16(9, Math.round(left * 1000), true);
+            msg.setInt16(11, Math.round(right * 1000), true);
+            control.sent.set(seq, performance.now());
+            ws.send(msg.buffer);
+            return true;
+        }
+
+        function sendHeartbeat() {
+            sendControl(control.command === 'stop' ? HEARTBEAT : DRIVE);
+        }
+
+        function renderControlStatus() {
+            let text = 'control: HTTP';
+            if (control.ws) {
+                text = `control: WebSocket · RTT ${control.rtt === null ? '--' : control.rtt.toFixed(0)} ms` +
+                       ` · discarded ${control.discarded}`;
+            }
+            document.getElementById('control-status').textContent = control.note ? `${text} · ${control.note}` : text;
+        }
+
+        function connectControl() {
+            const ws = new WebSocket(`${location.protocol === 'https:' ? 'wss' : 'ws'}://${location.host}/api/control/ws`);
+            ws.binaryType = 'arraybuffer';
+            ws.onopen = () => {
+                control.ws = ws;
+                control.seq = 0;
+                control.sent.clear();
+            };
+            ws.onmessage = (e) => {
+                const msg = new DataView(e.data);
+                const kind = msg.getUint8(0);
+                if (kind === 0x80) {
+                    // hello: heartbeat interval, dead-man window, track speeds
+                    control.speed = msg.getUint16(5, true) / 1000;
+                    control.turn = msg.getUint16(7, true) / 1000;
+                    clearInterval(control.timer);
+                    control.timer = setInterval(sendHeartbeat, msg.getUint16(1, true));
+                    sendHeartbeat();
+                } else if (kind === 0x81) {
+                    const seq = msg.getUint32(1, true), status = msg.getUint8(5);
+                    if (control.sent.has(seq)) control.rtt = performance.now() - control.sent.get(seq);
+                    for (const s of control.sent.keys()) {
+                        if (s > seq) break;
+                        control.sent.delete(s);
+                    }
+                    if (status === 1 || status === 2) control.discarded++;
+                    if (status === 3) control.note = 'motor unavailable';
+                    if (status === 5) control.note = 'locked: safety stop';
+                    renderControlStatus();
+                } else if (kind === 0x82) {
+                    // the server stopped the tank: wait for a new key press before moving again
+                    control.command = 'stop';
+                    control.note = 'stopped: heartbeat lost';
+                    renderControlStatus();
+                }
+            };
+            ws.onclose = () => {
+                if (control.ws === ws) control.ws = null;
+                clearInterval(control.timer);
+                // the server stops the tank when the channel drops; do not resume on reconnect
+                control.command = 'stop';
+                activeKeys.clear();
+                control.note = 'reconnecting...';
+                renderControlStatus();
+                setTimeout(connectControl, 1000);
+            };
+        }
+
+        function sendCommand(command) {
+            control.command = command;
+            control.note = null;
+            if (sendControl(command === 'stop' ? STOP : DRIVE)) return;
+            fetch('/api/control', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({command: command})
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (!data.success) {
+                    console.error('Command failed:', data.error);
+                }
+            })
+            .catch(err => console.error('Control error:', err));
+        }
+        
+        // Button event listeners
+        document.getElementById('btn-forward').addEventListener('click', () => sendCommand('forward'));
+        document.getElementById('btn-backward').addEventListener('click', () => sendCommand('backward'));
+        document.getElementById('btn-left').addEventListener('click', () => sendCommand('left'));
+        document.getElementById('btn-right').addEventListener('click', () => sendCommand('right'));
+        document.getElementById('btn-stop').addEventListener('click', () => sendCommand('stop'));
+        
+        // Keyboard controls
+        const keyMap = {
+            'ArrowUp': 'forward',
+            'ArrowDown': 'backward',
+            'ArrowLeft': 'left',
+            'ArrowRight': 'right',
+            'w': 'forward',
+            'W': 'forward',
+            's': 'backward',
+            'S': 'backward',
+            'a': 'left',
+            'A': 'left',
+            'd': 'right',
+            'D': 'right',
+            ' ': 'stop'
+        };
+        
+        let activeKeys = new Set();
+
+        // a keyup lost with the focus must not leave the tank driving
+        window.addEventListener('blur', () => {
+            if (activeKeys.size) {
+                activeKeys.clear();
+                sendCommand('stop');
+            }
+        });
+        
+        document.addEventListener('keydown', (e) => {
+            if (keyMap[e.key] && !activeKeys.has(e.key)) {
+                e.preventDefault();
+                activeKeys.add(e.key);
+                sendCommand(keyMap[e.key]);
+                
+                // Visual feedback
+                const btnMap = {
+                    'forward': 'btn-forward',
+                    'backward': 'btn-backward',
+                    'left': 'btn-left',
+                    'right': 'btn-right',
+                    'stop': 'btn-stop'
+                };
+                const btn = document.getElementById(btnMap[keyMap[e.key]]);
+                if (btn) btn.style.transform = 'scale(0.95)';
+            }
+        });
+        
+        document.addEventListener('keyup', (e) => {
+            if (keyMap[e.key]) {
+                e.preventDefault();
+                activeKeys.delete(e.key);
+                sendCommand('stop');
+                
+                // Reset visual feedback
+                const btnMap = {
+                    'forward': 'btn-forward',
+                    'backward': 'btn-backward',
+                    'left': 'btn-left',
+                    'right': 'btn-right',
+                    'stop': 'btn-stop'
+                };
+                const btn = document.getElementById(btnMap[keyMap[e.key]]);
+                if (btn) btn.style.transform = '';
+            }
+        });
+        
+        // Distance history chart: min/max band and mean line per sensor, from /api/history
+        const historySeries = [
+            {field: 'front', color: '#4CAF50'},
+            {field: 'left', color: '#2196F3'},
+            {field: 'right', color: '#FF9800'}
+        ];
+        const chart = document.getElementById('history-chart');
+        let historySeconds = 60;
+        let historyData = null;
+        let hoverX = null;
+
+        function loadHistory() {
+            const points = Math.min(600, chart.clientWidth || 300);
+            fetch(`/api/history?since=-${historySeconds}&max_points=${points}&fields=front,left,right`)
+                .then(response => response.json())
+                .then(data => {
+                    if (!data.error) {
+                        historyData = data;
+                        drawHistory();
+                    }
+                })
+                .catch(err => console.error('History update failed:', err));
+        }
+
+        function drawHistory() {
+            const dpr = window.devicePixelRatio || 1;
+            const w = chart.clientWidth, h = chart.clientHeight;
+            chart.width = w * dpr;
+            chart.height = h * dpr;
+            const ctx = chart.getContext('2d');
+            ctx.scale(dpr, dpr);
+            ctx.clearRect(0, 0, w, h);
+            if (!historyData || historyData.t.length === 0) return;
+
+            const t = historyData.t;
+            const tMax = Date.now() / 1000, tMin = tMax - historySeconds;
+            let vMax = 50;
+            historySeries.forEach(s => historyData.fields[s.field].max.forEach(v => { if (v !== null && v > vMax) vMax = v; }));
+            const x = tv => (tv - tMin) / (tMax - tMin) * w;
+            const y = v => h - 4 - v / vMax * (h - 8);
+
+            // obstacle threshold
+            ctx.strokeStyle = 'rgba(244, 67, 54, 0.6)';
+            ctx.setLineDash([4, 4]);
+            ctx.beginPath();
+            ctx.moveTo(0, y(40));
+            ctx.lineTo(w, y(40));
+            ctx.stroke();
+            ctx.setLineDash([]);
+
+            historySeries.forEach(s => {
+                const f = historyData.fields[s.field];
+                // min/max band
+                ctx.fillStyle = s.color + '33';
+                ctx.beginPath();
+                let started = false;
+                for (let i = 0; i < t.length; i++) {
+                    if (f.max[i] === null) continue;
+                    started ? ctx.lineTo(x(t[i]), y(f.max[i])) : ctx.moveTo(x(t[i]), y(f.max[i]));
+                    started = true;
+                }
+                for (let i = t.length - 1; i >= 0; i--) {
+                    if (f.min[i] !== null) ctx.lineTo(x(t[i]), y(f.min[i]));
+                }
+                ctx.fill();
+                // mean line
+                ctx.strokeStyle = s.color;
+                ctx.lineWidth = 1.5;
+                ctx.beginPath();
+                started = false;
+                for (let i = 0; i < t.length; i++) {
+                    if (f.mean[i] === null) { started = false; continue; }
+                    started ? ctx.lineTo(x(t[i]), y(f.mean[i])) : ctx.moveTo(x(t[i]), y(f.mean[i]));
+                    started = true;
+                }
+                ctx.stroke();
+            });
+
+            ctx.fillStyle = '#888';
+            ctx.font = '11px sans-serif';
+            ctx.fillText(vMax.toFixed(0) + ' cm', 4, 12);
+            ctx.fillText('-' + historySeconds + ' s', 4, h - 6);
+
+            // hover: values of the nearest bucket
+            if (hoverX !== null) {
+                const tv = tMin + hoverX / w * (tMax - tMin);
+                let best = 0;
+                for (let i = 1; i < t.length; i++) {
+                    if (Math.abs(t[i] - tv) < Math.abs(t[best] - tv)) best = i;
+                }
+                const bx = x(t[best]);
+                ctx.strokeStyle = '#aaa';
+                ctx.beginPath();
+                ctx.moveTo(bx, 0);
+                ctx.lineTo(bx, h);
+                ctx.stroke();
+                const label = historySeries.map(s => {
+                    const v = historyData.fields[s.field].mean[best];
+                    return s.field + ' ' + (v === null ? '--' : v.toFixed(1));
+                }).join('  ') + '  (' + (t[best] - tMax).toFixed(1) + ' s)';
+                ctx.fillStyle = '#fff';
+                ctx.fillText(label, Math.min(bx + 6, w - ctx.measureText(label).width - 4), 24);
+            }
+        }
+
+        chart.addEventListener('mousemove', e => {
+            hoverX = e.offsetX;
+            drawHistory();
+        });
+        chart.addEventListener('mouseleave', () => {
+            hoverX = null;
+            drawHistory();
+        });
+        document.querySelectorAll('.history-range button').forEach(btn => {
+            btn.addEventListener('click', () => {
+                document.querySelectorAll('.history-range button').forEach(b => b.classList.remove('active'));
+                btn.classList.add('active');
+                historySeconds = parseInt(btn.dataset.seconds);
+                loadHistory();
+            });
+        });
+
+        // Video: read the MJPEG stream ourselves to see each part's X-Capture-Timestamp header,
+        // then measure capture-to-display latency (server clock offset estimated via /api/time).
+        const video = document.getElementById('video');
+        const latencyOverlay = document.getElementById('latency-overlay');
+        const latency = {client: null, offset: null, window: [], pending: []};
+        const LATENCY_WINDOW = 200;
+
+        async function syncClock() {
+            // keep the ping with the shortest round trip: its midpoint is the best offset estimate
+            let best = null;
+            for (let i = 0; i < 5; i++) {
+                try {
+                    const t0 = performance.timeOrigin + performance.now();
+                    const data = await (await fetch('/api/time', {cache: 'no-store'})).json();
+                    const t1 = performance.timeOrigin + performance.now();
+                    if (best === null || t1 - t0 < best.rtt) {
+                        best = {rtt: t1 - t0, offset: (t0 + t1) / 2 - data.time * 1000};
+                    }
+                } catch (err) {
+                    console.error('Clock sync failed:', err);
+                }
+            }
+            if (best !== null) latency.offset = best.offset;
+        }
+
+        function percentile(sorted, p) {
+            return sorted[Math.max(0, Math.ceil(p / 100 * sorted.length) - 1)];
+        }
+
+        function onFrameDisplayed(capturedAt) {
+            if (latency.offset === null || !capturedAt) return;
+            const ms = performance.timeOrigin + performance.now() - latency.offset - capturedAt * 1000;
+            latency.window.push(ms);
+            if (latency.window.length > LATENCY_WINDOW) latency.window.shift();
+            latency.pending.push(Math.round(ms * 10) / 10);
+        }
+
+        function renderLatency() {
+            if (!latency.window.length) return;
+            const sorted = latency.window.slice().sort((a, b) => a - b);
+            const p50 = percentile(sorted, 50), p95 = percentile(sorted, 95);
+            latencyOverlay.textContent = `latency p50 ${p50.toFixed(0)} ms · p95 ${p95.toFixed(0)} ms`;
+            latencyOverlay.classList.toggle('latency-high', p95 > 300);
+        }
+
+        function reportLatency() {
+            if (latency.client === null || !latency.pending.length) return;
+            const samples = latency.pending;
+            latency.pending = [];
+            fetch('/api/latency', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({client: latency.client, samples: samples})
+            }).catch(err => console.error('Latency report failed:', err));
+        }
+
+        function indexOf(buf, len, pattern, from) {
+            outer: for (let i = from; i <= len - pattern.length; i++) {
+                for (let j = 0; j < pattern.length; j++) {
+                    if (buf[i + j] !== pattern[j]) continue outer;
+                }
+                return i;
+            }
+            return -1;
+        }
+
+        const HEADER_END = new TextEncoder().encode('\\r\\n\\r\\n');
+
+        async function playStream() {
+            const response = await fetch('/video_feed', {cache: 'no-store'});
+            latency.client = parseInt(response.headers.get('X-Stream-Client'));
+            const reader = response.body.getReader();
+            let buf = new Uint8Array(256 * 1024), len = 0;
+            let part = null;  // headers of the part whose body we are waiting for
+            let next = null, showing = false;
+
+            function show() {
+                // one frame decoding at a time; newer frames replace the one waiting
+                if (showing || next === null) return;
+                const frame = next;
+                next = null;
+                showing = true;
+                const url = URL.createObjectURL(frame.blob);
+                video.onload = () => requestAnimationFrame(() => {
+                    onFrameDisplayed(frame.capturedAt);
+                    URL.revokeObjectURL(url);
+                    showing = false;
+                    show();
+                });
+                video.onerror = () => {
+                    URL.revokeObjectURL(url);
+                    showing = false;
+                    show();
+                };
+                video.src = url;
+            }
+
+            while (true) {
+                const {value, done} = await reader.read();
+                if (done) break;
+                if (len + value.length > buf.length) {
+                    const grown = new Uint8Array(Math.max(buf.length * 2, len + value.length));
+                    grown.set(buf.subarray(0, len));
+                    buf = grown;
+                }
+                buf.set(value, len);
+                len += value.length;
+                let pos = 0;
+                while (true) {
+                    if (part === null) {
+                        const end = indexOf(buf, len, HEADER_END, pos);
+                        if (end < 0) break;
+                        const headers = {};
+                        new TextDecoder().decode(buf.subarray(pos, end)).split('\\r\\n').forEach(line => {
+                            const i = line.indexOf(':');
+                            if (i > 0) headers[line.slice(0, i).trim().toLowerCase()] = line.slice(i + 1).trim();
+                        });
+                        part = {start: end + HEADER_END.length, length: parseInt(headers['content-length']),
+                                capturedAt: parseFloat(headers['x-capture-timestamp'])};
+                        if (isNaN(part.length)) throw new Error('MJPEG part without Content-Length');
+                    }
+                    if (len < part.start + part.length) break;
+                    next = {blob: new Blob([buf.slice(part.start, part.start + part.length)], {type: 'image/jpeg'}),
+                            capturedAt: part.capturedAt};
+                    pos = part.start + part.length;
+                    part = null;
+                }
+                if (part !== null) {
+                    part.start -= pos;
+                }
+                buf.copyWithin(0, pos, len);
+                len -= pos;
+                show();
+            }
+        }
+
+        function connectVideo() {
+            if (!window.ReadableStream || !('body' in Response.prototype)) {
+                video.src = '/video_feed';  // old browser: plain MJPEG, no latency measurement
+                latencyOverlay.textContent = 'latency n/a';
+                return;
+            }
+            playStream().catch(err => console.error('Video stream error:', err))
+                .finally(() => setTimeout(connectVideo, 1000));
+        }
+
+        // Start receiving sensor telemetry
+        connectTelemetry();
+        connectControl();
+        syncClock();
+        setInterval(syncClock, 30000);
+        connectVideo();
+        setInterval(renderLatency, 500);
+        setInterval(reportLatency, 2000);
+        loadHistory();
+        setInterval(loadHistory, 1000);
+    </script>
+</body>
+</html>
+'''
@@ -0,0 +1,135 @@
+"""Pluggable JPEG encoder backends (OpenCV, libjpeg-turbo via PyTurboJPEG or simplejpeg).
+
+Every backend accepts either a BGR frame (h, w, 3) or a planar I420/YUV420 frame
+(h * 3 // 2, w) as produced by the camera when camera['pixel_format'] is 'YUV420'.
+The libjpeg-turbo backends encode I420 frames directly, without any colour conversion.
+"""
+import logging
+import cv2
+
+log = logging.getLogger('Encoder')
+
+try:
+    import simplejpeg
+    HAS_SIMPLEJPEG = True
+except Exception:
+    HAS_SIMPLEJPEG = False
+
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_444, TJSAMP_422, TJSAMP_420
+    HAS_TURBOJPEG = True
+except Exception:
+    HAS_TURBOJPEG = False
+
+SUBSAMPLINGS = ('420', '422', '444')
+
+def is_i420(frame):
+    """Planar YUV420 frames are 2-D: the Y plane followed by the quarter-size U and V planes."""
+    return frame.ndim == 2
+
+def i420_planes(frame):
+    """Split an I420 frame into (Y, U, V) views, no copy."""
+    h = frame.shape[0] * 2 // 3
+    w = frame.shape[1]
+    q = h // 4
+    y = frame[:h]
+    u = frame[h:h + q].reshape(h // 2, w // 2)
+    v = frame[h + q:h + 2 * q].reshape(h // 2, w // 2)
+    return y, u, v
+
+class JPEGEncoder:
+    """Base class: encode(frame, quality=None) -> JPEG bytes."""
+    name = 'base'
+
+    def __init__(self, quality=85, subsampling='420'):
+        if subsampling not in SUBSAMPLINGS:
+            raise ValueError('Unknown chroma subsampling %r (expected one of %s)' % (subsampling, ', '.join(SUBSAMPLINGS)))
+        self.quality = quality
+        self.subsampling = subsampling
+
+    def encode(self, frame, quality=None):
+        raise NotImplementedError
+
+class OpenCVEncoder(JPEGEncoder):
+    """cv2.imencode. I420 frames are converted to BGR first (fallback only)."""
+    name = 'opencv'
+
+    _SAMPLING = {
+        '420': getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_420', 0x221111),
+        '422': getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_422', 0x211111),
+        '444': getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR_444', 0x111111)
+    }
+
+    def __init__(self, quality=85, subsampling='420'):
+        super().__init__(quality, subsampling)
+        self._sampling_param = getattr(cv2, 'IMWRITE_JPEG_SAMPLING_FACTOR', None)
+        if self._sampling_param is None and subsampling != '420':
+            log.warning('This OpenCV build cannot set JPEG chroma subsampling, using its default')
+
+    def encode(self, frame, quality=None):
+        if is_i420(frame):
+            frame = cv2.cvtColor(frame, cv2.COLOR_YUV2BGR_I420)
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality if quality is not None else self.quality]
+        if self._sampling_param is not None:
+            params += [self._sampling_param, self._SAMPLING[self.subsampling]]
+        ret, buffer = cv2.imencode('.jpg', frame, params)
+        if not ret:
+            raise RuntimeError('cv2.imencode failed')
+        return buffer.tobytes()
+
+class TurboJPEGEncoder(JPEGEncoder):
+    """libjpeg-turbo through PyTurboJPEG. I420 frames are encoded straight from the YUV buffer."""
+    name = 'turbojpeg'
+
+    def __init__(self, quality=85, subsampling='420', lib_path=None):
+        super().__init__(quality, subsampling)
+        self._jpeg = TurboJPEG(lib_path) if lib_path else TurboJPEG()
+        self._subsample = {'420': TJSAMP_420, '422': TJSAMP_422, '444': TJSAMP_444}[subsampling]
+
+    def encode(self, frame, quality=None):
+        q = quality if quality is not None else self.quality
+        if is_i420(frame):
+            h = frame.shape[0] * 2 // 3
+            return self._jpeg.encode_from_yuv(frame, h, frame.shape[1], quality=q,
+                                              jpeg_subsample=TJSAMP_420, align=1)
+        return self._jpeg.encode(frame, quality=q, pixel_format=TJPF_BGR, jpeg_subsample=self._subsample)
+
+class SimpleJPEGEncoder(JPEGEncoder):
+    """libjpeg-turbo through simplejpeg. I420 frames are encoded straight from the Y/U/V planes."""
+    name = 'simplejpeg'
+
+    def encode(self, frame, quality=None):
+        q = quality if quality is not None else self.quality
+        if is_i420(frame):
+            y, u, v = i420_planes(frame)
+            return simplejpeg.encode_jpeg_yuv_planes(y, u, v, quality=q)
+        return simplejpeg.encode_jpeg(frame, quality=q, colorspace='BGR', colorsubsampling=self.subsampling)
+
+BACKENDS = {
+    'opencv': OpenCVEncoder,
+    'turbojpeg': TurboJPEGEncoder,
+    'simplejpeg': SimpleJPEGEncoder
+}
+
+def available_backends():
+    names = ['opencv']
+    if HAS_TURBOJPEG:
+        try:
+            TurboJPEG()  # needs the native libturbojpeg too
+            names.append('turbojpeg')
+        except Exception:
+            pass
+    if HAS_SIMPLEJPEG:
+        names.append('simplejpeg')
+    return names
+
+def create_encoder(backend='opencv', quality=85, subsampling='420'):
+    """Build the configured encoder, falling back to OpenCV if the backend library is missing."""
+    if backend not in BACKENDS:
+        raise ValueError('Unknown JPEG backend %r (expected one of %s)' % (backend, ', '.join(BACKENDS)))
+    if backend != 'opencv' and backend not in available_backends():
+        log.warning('JPEG backend %s not available, falling back to opencv', backend)
+        backend = 'opencv'
+    encoder = BACKENDS[backend](quality, subsampling)
+    log.info('JPEG encoder: %s (quality=%d, subsampling=%s)', backend, quality, subsampling)
+    return encoder
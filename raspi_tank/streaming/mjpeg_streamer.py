@@ -1,566 +1,408 @@
 """MJPEG streaming via Flask for browser viewing without X11."""
 import logging
-import cv2
-from flask import Flask, Response, render_template_string, jsonify, request
+import socket
+import time
+from flask import Flask, Response, jsonify, request
 import threading
 import json
 
+from raspi_tank.streaming.broadcaster import JPEGBroadcaster, multipart_part
+from raspi_tank.streaming.clients import ClientRegistry, latency_summary, stream_metrics
+from raspi_tank.streaming.control import ControlChannel
+from raspi_tank.streaming.websocket import ProtocolError, handshake_response, is_upgrade
+from raspi_tank.streaming.dashboard import INDEX_HTML
+from raspi_tank.streaming.telemetry import TelemetryHub, delta, sse_message, SSE_KEEPALIVE, SSE_RETRY
+from raspi_tank.streaming.async_server import AsyncStreamServer
+from raspi_tank.sensors.history import FIELDS as HISTORY_FIELDS
+from raspi_tank.metrics import REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from raspi_tank.config import camera as camera_conf
+
 log = logging.getLogger('Streamer')
 
+_WRITE, _AGE, _SENT = stream_metrics('flask')
+
 class MJPEGStreamer:
-    def __init__(self, camera_worker, sensors=None, motor=None, host='0.0.0.0', port=5000):
+    def __init__(self, camera_worker, sensors=None, motor=None, host='0.0.0.0', port=5000, recorder=None):
         self.camera_worker = camera_worker
         self.sensors = sensors
         self.motor = motor
+        self.recorder = recorder  # optional FlightRecorder, gets every /api/control command
         self.host = host
         self.port = port
+        self.broadcaster = JPEGBroadcaster(camera_worker)
+        self.clients = ClientRegistry()
+        self.telemetry = TelemetryHub(self.sensor_data)
+        self.control = ControlChannel(motor, recorder)
         self.app = Flask(__name__)
         self._setup_routes()
+        self.async_server = None
         self._stopped = False
 
     def _setup_routes(self):
         @self.app.route('/')
         def index():
-            return render_template_string('''
-<!DOCTYPE html>
-<html>
-<head>
-    <title>RaspiTank Control Center</title>
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        body {
-            font-family: 'Segoe UI', Arial, sans-serif;
-            background: linear-gradient(135deg, #1a1a2e 0%, #16213e 100%);
-            color: white;
-            padding: 20px;
-            min-height: 100vh;
-        }
-        .container {
-            max-width: 1400px;
-            margin: 0 auto;
-        }
-        h1 {
-            text-align: center;
-            color: #4CAF50;
-            margin-bottom: 20px;
-            font-size: 2.5em;
-            text-shadow: 2px 2px 4px rgba(0,0,0,0.5);
-        }
-        .main-grid {
-            display: grid;
-            grid-template-columns: 1fr 350px;
-            gap: 20px;
-            margin-bottom: 20px;
-        }
-        @media (max-width: 1024px) {
-            .main-grid {
-                grid-template-columns: 1fr;
-            }
-        }
-        .video-container {
-            background: #000000;
-            border-radius: 12px;
-            padding: 15px;
-            box-shadow: 0 8px 16px rgba(0,0,0,0.3);
-        }
-        .video-container img {
-            width: 100%;
-            border-radius: 8px;
-            display: block;
-            background: #000000;
-        }
-        .sidebar {
-            display: flex;
-            flex-direction: column;
-            gap: 20px;
-        }
-        .panel {
-            background: #2a2a3e;
-            border-radius: 12px;
-            padding: 20px;
-            box-shadow: 0 8px 16px rgba(0,0,0,0.3);
-        }
-        .panel h2 {
-            color: #4CAF50;
-            margin-bottom: 15px;
-            font-size: 1.4em;
-            border-bottom: 2px solid #4CAF50;
-            padding-bottom: 8px;
-        }
-        .sensor-grid {
-            display: grid;
-            gap: 12px;
-        }
-        .sensor-item {
-            background: #1a1a2e;
-            padding: 12px;
-            border-radius: 8px;
-            border-left: 4px solid #4CAF50;
-        }
-        .sensor-label {
-            color: #888;
-            font-size: 0.85em;
-            margin-bottom: 4px;
-        }
-        .sensor-value {
-            font-size: 1.5em;
-            font-weight: bold;
-            color: #4CAF50;
-        }
-        .sensor-unit {
-            font-size: 0.9em;
-            color: #aaa;
-            margin-left: 4px;
-        }
-        .warning {
-            border-left-color: #ff9800 !important;
-        }
-        .warning .sensor-value {
-            color: #ff9800;
-        }
-        .danger {
-            border-left-color: #f44336 !important;
-        }
-        .danger .sensor-value {
-            color: #f44336;
-        }
-        .controls {
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            gap: 15px;
-        }
-        .control-pad {
-            display: grid;
-            grid-template-columns: repeat(3, 80px);
-            grid-template-rows: repeat(3, 80px);
-            gap: 8px;
-            margin: 10px 0;
-        }
-        .control-btn {
-            background: linear-gradient(145deg, #4CAF50, #388E3C);
-            border: none;
-            border-radius: 12px;
-            color: white;
-            font-size: 1.5em;
-            cursor: pointer;
-            transition: all 0.1s;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.3);
-            user-select: none;
-        }
-        .control-btn:hover {
-            background: linear-gradient(145deg, #66BB6A, #4CAF50);
-            transform: translateY(-2px);
-            box-shadow: 0 6px 12px rgba(0,0,0,0.4);
-        }
-        .control-btn:active {
-            transform: translateY(0);
-            box-shadow: 0 2px 4px rgba(0,0,0,0.3);
-        }
-        .control-btn:disabled {
-            background: #555;
-            cursor: not-allowed;
-            opacity: 0.5;
-        }
-        .btn-up { grid-column: 2; grid-row: 1; }
-        .btn-left { grid-column: 1; grid-row: 2; }
-        .btn-stop { 
-            grid-column: 2; 
-            grid-row: 2;
-            background: linear-gradient(145deg, #f44336, #c62828);
-            font-size: 1.2em;
-        }
-        .btn-stop:hover {
-            background: linear-gradient(145deg, #e57373, #f44336);
-        }
-        .btn-right { grid-column: 3; grid-row: 2; }
-        .btn-down { grid-column: 2; grid-row: 3; }
-        .status-indicator {
-            display: flex;
-            align-items: center;
-            gap: 8px;
-            padding: 10px;
-            background: #1a1a2e;
-            border-radius: 8px;
-            margin-bottom: 10px;
-        }
-        .status-dot {
-            width: 12px;
-            height: 12px;
-            border-radius: 50%;
-            background: #4CAF50;
-            animation: pulse 2s infinite;
-        }
-        @keyframes pulse {
-            0%, 100% { opacity: 1; }
-            50% { opacity: 0.5; }
-        }
-        .status-offline {
-            background: #f44336;
-        }
-        .keyboard-hint {
-            text-align: center;
-            color: #888;
-            font-size: 0.85em;
-            margin-top: 10px;
-        }
-        .info-bar {
-            background: #2a2a3e;
-            border-radius: 12px;
-            padding: 15px;
-            text-align: center;
-            box-shadow: 0 8px 16px rgba(0,0,0,0.3);
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <h1>🤖 RaspiTank Control Center</h1>
-        
-        <div class="main-grid">
-            <div class="video-container">
-                <img src="{{ url_for('video_feed') }}" alt="Video Stream">
-            </div>
-            
-            <div class="sidebar">
-                <div class="panel">
-                    <h2>📡 Sensors</h2>
-                    <div class="status-indicator">
-                        <div class="status-dot" id="status-dot"></div>
-                        <span id="status-text">Connecting...</span>
-                    </div>
-                    <div class="sensor-grid" id="sensor-data">
-                        <div class="sensor-item">
-                            <div class="sensor-label">Front Distance</div>
-                            <div class="sensor-value" id="front-dist">--<span class="sensor-unit">cm</span></div>
-                        </div>
-                        <div class="sensor-item">
-                            <div class="sensor-label">Left Distance</div>
-                            <div class="sensor-value" id="left-dist">--<span class="sensor-unit">cm</span></div>
-                        </div>
-                        <div class="sensor-item">
-                            <div class="sensor-label">Right Distance</div>
-                            <div class="sensor-value" id="right-dist">--<span class="sensor-unit">cm</span></div>
-                        </div>
-                        <div class="sensor-item">
-                            <div class="sensor-label">Temperature</div>
-                            <div class="sensor-value" id="temp">--<span class="sensor-unit">°C</span></div>
-                        </div>
-                        <div class="sensor-item">
-                            <div class="sensor-label">Pitch / Roll</div>
-                            <div class="sensor-value" style="font-size: 1.2em;" id="orientation">-- / --<span class="sensor-unit">°</span></div>
-                        </div>
-                    </div>
-                </div>
-                
-                <div class="panel">
-                    <h2>🎮 Controls</h2>
-                    <div class="controls">
-                        <div class="control-pad">
-                            <button class="control-btn btn-up" id="btn-forward" title="Forward (↑)">▲</button>
-                            <button class="control-btn btn-left" id="btn-left" title="Left (←)">◄</button>
-                            <button class="control-btn btn-stop" id="btn-stop" title="Stop (Space)">⏹</button>
-                            <button class="control-btn btn-right" id="btn-right" title="Right (→)">►</button>
-                            <button class="control-btn btn-down" id="btn-backward" title="Backward (↓)">▼</button>
-                        </div>
-                        <div class="keyboard-hint">
-                            💡 Use arrow keys or W/A/S/D<br>Space to stop
-                        </div>
-                    </div>
-                </div>
-            </div>
-        </div>
-        
-        <div class="info-bar">
-            <span id="qr-info">No QR code detected</span>
-        </div>
-    </div>
-
-    <script>
-        // Sensor data polling
-        function updateSensors() {
-            fetch('/api/sensors')
-                .then(response => response.json())
-                .then(data => {
-                    const statusDot = document.getElementById('status-dot');
-                    const statusText = document.getElementById('status-text');
-                    
-                    if (data.error) {
-                        statusDot.classList.add('status-offline');
-                        statusText.textContent = 'Sensors Offline';
-                        return;
-                    }
-                    
-                    statusDot.classList.remove('status-offline');
-                    statusText.textContent = 'Connected';
-                    
-                    // Update distance sensors
-                    updateSensorValue('front-dist', data.front_distance, 40);
-                    updateSensorValue('left-dist', data.left_distance, 30);
-                    updateSensorValue('right-dist', data.right_distance, 30);
-                    
-                    // Update IMU data
-                    document.getElementById('temp').innerHTML = 
-                        (data.temperature || '--') + '<span class="sensor-unit">°C</span>';
-                    document.getElementById('orientation').innerHTML = 
-                        `${data.pitch || '--'} / ${data.roll || '--'}<span class="sensor-unit">°</span>`;
-                    
-                    // Update QR info
-                    if (data.qr_data) {
-                        document.getElementById('qr-info').textContent = '📱 QR: ' + data.qr_data;
-                    } else {
-                        document.getElementById('qr-info').textContent = 'No QR code detected';
-                    }
-                })
-                .catch(err => {
-                    console.error('Sensor update failed:', err);
-                    document.getElementById('status-dot').classList.add('status-offline');
-                    document.getElementById('status-text').textContent = 'Connection Error';
-                });
-        }
-        
-        function updateSensorValue(elementId, value, warningThreshold) {
-            const element = document.getElementById(elementId);
-            const parent = element.closest('.sensor-item');
-            
-            if (value === null || value === undefined) {
-                element.innerHTML = '--<span class="sensor-unit">cm</span>';
-                parent.classList.remove('warning', 'danger');
-                return;
-            }
-            
-            const numValue = parseFloat(value);
-            element.innerHTML = numValue.toFixed(1) + '<span class="sensor-unit">cm</span>';
-            
-            parent.classList.remove('warning', 'danger');
-            if (numValue < warningThreshold * 0.5) {
-                parent.classList.add('danger');
-            } else if (numValue < warningThreshold) {
-                parent.classList.add('warning');
-            }
-        }
-        
-        // Motor control
-        function sendCommand(command) {
-            fetch('/api/control', {
-                method: 'POST',
-                headers: {'Content-Type': 'application/json'},
-                body: JSON.stringify({command: command})
-            })
-            .then(response => response.json())
-            .then(data => {
-                if (!data.success) {
-                    console.error('Command failed:', data.error);
-                }
-            })
-            .catch(err => console.error('Control error:', err));
-        }
-        
-        // Button event listeners
-        document.getElementById('btn-forward').addEventListener('click', () => sendCommand('forward'));
-        document.getElementById('btn-backward').addEventListener('click', () => sendCommand('backward'));
-        document.getElementById('btn-left').addEventListener('click', () => sendCommand('left'));
-        document.getElementById('btn-right').addEventListener('click', () => sendCommand('right'));
-        document.getElementById('btn-stop').addEventListener('click', () => sendCommand('stop'));
-        
-        // Keyboard controls
-        const keyMap = {
-            'ArrowUp': 'forward',
-            'ArrowDown': 'backward',
-            'ArrowLeft': 'left',
-            'ArrowRight': 'right',
-            'w': 'forward',
-            'W': 'forward',
-            's': 'backward',
-            'S': 'backward',
-            'a': 'left',
-            'A': 'left',
-            'd': 'right',
-            'D': 'right',
-            ' ': 'stop'
-        };
-        
-        let activeKeys = new Set();
-        
-        document.addEventListener('keydown', (e) => {
-            if (keyMap[e.key] && !activeKeys.has(e.key)) {
-                e.preventDefault();
-                activeKeys.add(e.key);
-                sendCommand(keyMap[e.key]);
-                
-                // Visual feedback
-                const btnMap = {
-                    'forward': 'btn-forward',
-                    'backward': 'btn-backward',
-                    'left': 'btn-left',
-                    'right': 'btn-right',
-                    'stop': 'btn-stop'
-                };
-                const btn = document.getElementById(btnMap[keyMap[e.key]]);
-                if (btn) btn.style.transform = 'scale(0.95)';
-            }
-        });
-        
-        document.addEventListener('keyup', (e) => {
-            if (keyMap[e.key]) {
-                e.preventDefault();
-                activeKeys.delete(e.key);
-                sendCommand('stop');
-                
-                // Reset visual feedback
-                const btnMap = {
-                    'forward': 'btn-forward',
-                    'backward': 'btn-backward',
-                    'left': 'btn-left',
-                    'right': 'btn-right',
-                    'stop': 'btn-stop'
-                };
-                const btn = document.getElementById(btnMap[keyMap[e.key]]);
-                if (btn) btn.style.transform = '';
-            }
-        });
-        
-        // Start polling sensors
-        updateSensors();
-        setInterval(updateSensors, 500);  // Update every 500ms
-    </script>
-</body>
-</html>
-            ''')
+            return Response(INDEX_HTML, mimetype='text/html')
 
         @self.app.route('/video_feed')
         def video_feed():
-            return Response(self._generate_frames(),
-                          mimetype='multipart/x-mixed-replace; boundary=frame')
+            """MJPEG stream. Optional query parameters: width (px), fps and q (JPEG quality),
+            e.g. /video_feed?width=320&fps=10&q=60. Clients asking for the same variant share
+            one resize and one encode per frame.
+            """
+            client = self.clients.add(request.remote_addr, request.headers.get('User-Agent'),
+                                      width=request.args.get('width', type=int),
+                                      fps=request.args.get('fps', type=float),
+                                      quality=request.args.get('q', type=int))
+            # a small kernel send buffer makes a slow link block our writes (and adapt)
+            # within a frame or two, instead of hiding seconds of video in the socket
+            sock = request.environ.get('werkzeug.socket')
+            if sock is not None:
+                try:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, camera_conf.get('stream_socket_sndbuf', 65536))
+                except OSError as e:
+                    log.debug('Cannot set send buffer size: %s', e)
+            # the dashboard reports its measured latency under this id (POST /api/latency)
+            return Response(self._generate_frames(client),
+                          mimetype='multipart/x-mixed-replace; boundary=frame',
+                          headers={'X-Stream-Client': str(client.id), 'Cache-Control': 'no-cache'})
+
+        @self.app.route('/metrics')
+        def metrics():
+            """Stage timers, histograms and loop rates in Prometheus text format."""
+            return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
+        # werkzeug matches upgrade requests only against websocket rules; the plain rule answers 426
+        @self.app.route('/api/control/ws', websocket=True)
+        @self.app.route('/api/control/ws')
+        def api_control_ws():
+            """WebSocket control channel: sequence-numbered drive commands with a dead-man heartbeat."""
+            headers = {k.lower(): v for k, v in request.headers.items()}
+            sock = request.environ.get('werkzeug.socket')
+            if sock is None or not is_upgrade(headers):
+                return jsonify({'error': 'WebSocket upgrade required'}), 426, {'Upgrade': 'websocket'}
+            self._run_control_socket(sock, headers['sec-websocket-key'], request.remote_addr)
+            return _SocketTakenOver()
+
+        @self.app.route('/api/stream_clients')
+        def api_stream_clients():
+            """Return the adaptive quality/fps state and send statistics of every video client."""
+            return jsonify({'clients': self.clients.snapshot()})
         
+        @self.app.route('/api/time')
+        def api_time():
+            """Server wall-clock time, for viewers estimating their clock offset."""
+            return jsonify(self.time_data())
+
+        @self.app.route('/api/latency', methods=['GET', 'POST'])
+        def api_latency():
+            """GET: capture-to-send and capture-to-display latency percentiles per video client.
+            POST {"client": id, "samples": [ms, ...]}: latencies measured by a viewer.
+            """
+            if request.method == 'POST':
+                payload, status = self.report_latency(request.get_json(silent=True))
+                return jsonify(payload), status
+            return jsonify(self.latency_data())
+
+        @self.app.route('/api/telemetry')
+        def api_telemetry():
+            """Server-Sent Events stream of sensor changes (compact keys, changed fields only)."""
+            return Response(self._generate_telemetry(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
         @self.app.route('/api/sensors')
         def api_sensors():
             """Return sensor data as JSON."""
             try:
-                data = {
-                    'front_distance': None,
-                    'left_distance': None,
-                    'right_distance': None,
-                    'temperature': None,
-                    'pitch': None,
-                    'roll': None,
-                    'yaw': None,
-                    'qr_data': None
-                }
-                
-                if self.sensors:
-                    try:
-                        data['front_distance'] = self.sensors.front.distance
-                        data['left_distance'] = self.sensors.left.distance
-                        data['right_distance'] = self.sensors.right.distance
-                        data['temperature'] = round(self.sensors.mpu.getTemperature(), 1)
-                        
-                        yaw, pitch, roll = self.sensors.mpu.getYawPitchRoll()
-                        data['pitch'] = round(pitch, 1)
-                        data['roll'] = round(roll, 1)
-                        data['yaw'] = round(yaw, 1)
-                    except Exception as e:
-                        log.debug('Error reading sensors: %s', e)
-                
-                # Try to get QR data from camera processor
-                if self.camera_worker and hasattr(self.camera_worker, 'processor'):
-                    try:
-                        if hasattr(self.camera_worker.processor, 'last_qr_data'):
-                            data['qr_data'] = self.camera_worker.processor.last_qr_data
-                    except Exception:
-                        pass
-                
-                return jsonify(data)
+                return jsonify(self.sensor_data())
             except Exception as e:
                 log.exception('Sensor API error: %s', e)
                 return jsonify({'error': str(e)}), 500
-        
+
+        @self.app.route('/api/pipeline')
+        def api_pipeline():
+            """Return per-stage rates, queue depths and drop counts of the video pipeline."""
+            try:
+                return jsonify(self.pipeline_data())
+            except Exception as e:
+                log.exception('Pipeline API error: %s', e)
+                return jsonify({'error': str(e)}), 500
+
+        @self.app.route('/api/i2c')
+        def api_i2c():
+            """Return target vs achieved sensor read rates and I2C bus utilisation."""
+            return jsonify(self.bus_data())
+
+        @self.app.route('/api/history')
+        def api_history():
+            """Return downsampled sensor history: ?since=<epoch s, or negative = last N s>&max_points=&fields="""
+            try:
+                payload, status = self.history_data(request.args.get('since', type=float),
+                                                    request.args.get('max_points', 300, type=int),
+                                                    request.args.get('fields'))
+                return jsonify(payload), status
+            except Exception as e:
+                log.exception('History API error: %s', e)
+                return jsonify({'error': str(e)}), 500
+
         @self.app.route('/api/control', methods=['POST'])
         def api_control():
             """Handle motor control commands."""
             try:
-                command = request.json.get('command')
-                if not command:
-                    return jsonify({'success': False, 'error': 'No command specified'}), 400
-                
-                if not self.motor:
-                    return jsonify({'success': False, 'error': 'Motor not available'}), 503
-                
-                # Execute motor command
-                if command == 'forward':
-                    self.motor.move_forward()
-                elif command == 'backward':
-                    self.motor.move_backward()
-                elif command == 'left':
-                    self.motor.move_left()
-                elif command == 'right':
-                    self.motor.move_right()
-                elif command == 'stop':
-                    self.motor.stop()
-                else:
-                    return jsonify({'success': False, 'error': 'Invalid command'}), 400
-                
-                log.info('Motor command executed: %s', command)
-                return jsonify({'success': True, 'command': command})
+                payload, status = self.execute_command(request.json.get('command'))
+                return jsonify(payload), status
             except Exception as e:
                 log.exception('Control API error: %s', e)
                 return jsonify({'success': False, 'error': str(e)}), 500
 
-    def _generate_frames(self):
-        """Generator that yields MJPEG frames."""
-        import time
-        log.info('Frame generator started')
-        frame_count = 0
-        null_count = 0
-        
-        while not self._stopped:
+    def sensor_data(self):
+        """Sensor values and the last QR code, as served by /api/sensors. Cheap: reads only snapshots."""
+        data = {
+            'front_distance': None,
+            'left_distance': None,
+            'right_distance': None,
+            'temperature': None,
+            'pitch': None,
+            'roll': None,
+            'yaw': None,
+            'qr_data': None
+        }
+
+        # the poller's latest snapshot: no I2C access from web threads
+        snap = self.sensors.snapshot() if self.sensors else None
+        if snap is not None and snap.seq > 0:
+            data['front_distance'] = snap.front
+            data['left_distance'] = snap.left
+            data['right_distance'] = snap.right
+            data['temperature'] = _round(snap.temperature)
+            data['pitch'] = _round(snap.pitch)
+            data['roll'] = _round(snap.roll)
+            data['yaw'] = _round(snap.yaw)
+
+        # Try to get QR data from camera processor
+        if self.camera_worker and hasattr(self.camera_worker, 'processor'):
             try:
-                frame = self.camera_worker.get_latest_annotated_frame()
-                if frame is None:
-                    null_count += 1
-                    if null_count % 20 == 1:  # Log every 20 null frames
-                        log.warning('Camera frame is None (count: %d)', null_count)
-                    time.sleep(0.05)  # Wait for camera to produce frames
+                if hasattr(self.camera_worker.processor, 'last_qr_data'):
+                    data['qr_data'] = self.camera_worker.processor.last_qr_data
+            except Exception:
+                pass
+        return data
+
+    def pipeline_data(self):
+        """Video pipeline statistics, as served by /api/pipeline."""
+        data = {}
+        if hasattr(self.camera_worker, 'pipeline_stats'):
+            data = self.camera_worker.pipeline_stats()
+        data['encode'] = self.broadcaster.stats()
+        data['telemetry'] = self.telemetry.stats()
+        if self.recorder is not None:
+            data['recorder'] = self.recorder.stats()
+        data['control'] = self.control.stats()
+        if self.motor is not None:
+            data['motor'] = self.motor.stats()
+        return data
+
+    def bus_data(self):
+        """I2C scheduler statistics, as served by /api/i2c."""
+        if self.sensors is None or not hasattr(self.sensors, 'bus_stats'):
+            return {}
+        return self.sensors.bus_stats()
+
+    def history_data(self, since=None, max_points=300, fields=None):
+        """Min/max/mean-downsampled sensor history, as served by /api/history. Returns (payload, status)."""
+        history = getattr(self.sensors, 'history', None)
+        if history is None:
+            return {'error': 'No sensor history'}, 404
+        names = HISTORY_FIELDS
+        if fields:
+            names = tuple(f for f in fields.split(',') if f)
+            unknown = [f for f in names if f not in HISTORY_FIELDS]
+            if unknown:
+                return {'error': 'Unknown field(s): %s' % ', '.join(unknown)}, 400
+        max_points = max(1, min(max_points or 300, 5000))
+        return history.query(since, max_points, names), 200
+
+    def time_data(self):
+        """As served by /api/time."""
+        return {'time': time.time()}
+
+    def latency_data(self):
+        """Per-client latency percentiles and the same over every connected client, as served by GET /api/latency."""
+        clients = self.clients.clients()
+        return {
+            'clients': [dict(c.latency(), id=c.id, remote_addr=c.remote_addr) for c in clients],
+            'overall': {
+                'capture_to_send_ms': latency_summary([ms for c in clients for ms in c.capture_to_send.samples()]),
+                'glass_to_glass_ms': latency_summary([ms for c in clients for ms in c.glass_to_glass.samples()])
+            }
+        }
+
+    def report_latency(self, data):
+        """Store latency samples sent by a viewer (POST /api/latency). Returns (response dict, HTTP status)."""
+        if not isinstance(data, dict) or not isinstance(data.get('samples'), list):
+            return {'success': False, 'error': 'Expected {"client": id, "samples": [ms, ...]}'}, 400
+        client = self.clients.get(data.get('client'))
+        if client is None:
+            return {'success': False, 'error': 'Unknown stream client'}, 404
+        accepted = client.on_latency(data['samples'][:1000])
+        return {'success': True, 'accepted': accepted}, 200
+
+    def execute_command(self, command):
+        """Run a motor command. Returns (response dict, HTTP status)."""
+        response, status = self._execute_command(command)
+        if self.recorder is not None:
+            self.recorder.record_command(command, status)
+        return response, status
+
+    def _execute_command(self, command):
+        if not command:
+            return {'success': False, 'error': 'No command specified'}, 400
+
+        if not self.motor:
+            return {'success': False, 'error': 'Motor not available'}, 503
+
+        # Execute motor command
+        if command == 'forward':
+            accepted = self.motor.move_forward()
+        elif command == 'backward':
+            accepted = self.motor.move_backward()
+        elif command == 'left':
+            accepted = self.motor.move_left()
+        elif command == 'right':
+            accepted = self.motor.move_right()
+        elif command == 'stop':
+            accepted = self.motor.stop()
+        else:
+            return {'success': False, 'error': 'Invalid command'}, 400
+
+        if not accepted:
+            return {'success': False, 'error': 'Locked out after a safety stop'}, 423
+
+        log.info('Motor command executed: %s', command)
+        return {'success': True, 'command': command}, 200
+
+    def _generate_frames(self, client):
+        """Generator that yields MJPEG frames from the shared JPEG broadcaster.
+        Paced at the client's frame rate; frames that go stale or are overtaken are skipped, never queued.
+        """
+        log.info('Frame generator started for client %d (%s)', client.id, client.remote_addr)
+        null_count = 0
+        seq = 0
+
+        self.broadcaster.subscribe(client.width, client.quality)
+        try:
+            while not self._stopped:
+                try:
+                    delay = client.next_send_time() - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                    new_seq, frame_bytes, published_at, captured_at = self.broadcaster.wait_for_jpeg(
+                        seq, client.width, client.quality, timeout=1.0)
+                    if frame_bytes is None:
+                        null_count += 1
+                        if null_count % 5 == 1:  # Log every 5 empty waits
+                            log.warning('No encoded frame available (count: %d)', null_count)
+                        continue
+
+                    # Reset null count when we get a frame
+                    if null_count > 0:
+                        log.info('Camera resumed after %d empty waits', null_count)
+                        null_count = 0
+
+                    if seq > 0 and new_seq - seq > 1:
+                        client.on_skipped(new_seq - seq - 1)
+                    seq = new_seq
+                    frame_age = time.monotonic() - published_at
+                    if client.is_stale(frame_age):
+                        continue
+
+                    part = multipart_part(frame_bytes, seq, captured_at)
+                    t0 = time.monotonic()
+                    yield part  # returns once the server has written the part to the socket
+                    write_s = time.monotonic() - t0
+                    _WRITE.observe(write_s)
+                    _AGE.observe(frame_age)
+                    _SENT.tick()
+                    old_quality = client.quality
+                    if client.on_sent(len(part), write_s, frame_age, captured_at):
+                        self.broadcaster.change_quality(client.width, old_quality, client.quality)
+
+                    if client.frames_sent == 1:
+                        log.info('First frame generated successfully!')
+                    elif client.frames_sent % 100 == 0:
+                        log.debug('Generated %d frames', client.frames_sent)
+                except Exception as e:
+                    log.exception('Error in frame generator: %s', e)
+                    time.sleep(0.1)
+        finally:
+            self.broadcaster.unsubscribe(client.width, client.quality)
+            self.clients.remove(client)
+
+        log.info('Frame generator stopped (generated %d frames total)', client.frames_sent)
+
+    def _run_control_socket(self, sock, key, remote_addr):
+        """Serve one control channel on the raw request socket (blocks this request's thread)."""
+        session = self.control.open(remote_addr)
+        try:
+            sock.sendall(handshake_response(key) + session.hello())
+            while not self._stopped:
+                sock.settimeout(max(0.001, session.wait_timeout()))  # 0 would make the socket non-blocking
+                try:
+                    data = sock.recv(4096)
+                except socket.timeout:
+                    sock.sendall(session.tick())
                     continue
-                
-                # Reset null count when we get a frame
-                if null_count > 0:
-                    log.info('Camera resumed after %d null frames', null_count)
-                    null_count = 0
-                
-                # Encode frame as JPEG
-                ret, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                if not ret:
-                    log.error('Failed to encode frame as JPEG')
-                    time.sleep(0.05)
+                if not data:
+                    break
+                reply, close = session.on_frames(data)
+                if reply:
+                    sock.sendall(reply)
+                if close:
+                    break
+        except ProtocolError as e:
+            log.debug('Control channel protocol error from %s: %s', remote_addr, e)
+        except OSError:
+            pass  # connection dropped
+        finally:
+            session.close()
+
+    def _generate_telemetry(self):
+        """SSE generator: the full state first, then only the keys that changed since the last message."""
+        keepalive = camera_conf.get('telemetry_keepalive_s', 15.0)
+        sent = {}
+        seq = 0
+        self.telemetry.subscribe()
+        try:
+            yield SSE_RETRY
+            last_write = time.monotonic()
+            while not self._stopped:
+                seq, state = self.telemetry.wait_for_update(seq, timeout=1.0)
+                if state is None:
+                    # a comment now and then: detects closed connections and keeps proxies from timing out
+                    if time.monotonic() - last_write > keepalive:
+                        yield SSE_KEEPALIVE
+                        last_write = time.monotonic()
                     continue
-                
-                frame_bytes = buffer.tobytes()
-                frame_count += 1
-                
-                if frame_count == 1:
-                    log.info('First frame generated successfully!')
-                elif frame_count % 100 == 0:
-                    log.debug('Generated %d frames', frame_count)
-                
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-                time.sleep(0.033)  # ~30 fps
-            except Exception as e:
-                log.exception('Error in frame generator: %s', e)
-                time.sleep(0.1)
-        
-        log.info('Frame generator stopped (generated %d frames total)', frame_count)
+                changes = delta(state, sent)
+                if changes:
+                    yield sse_message(seq, changes)
+                    sent = state
+                    last_write = time.monotonic()
+        finally:
+            self.telemetry.unsubscribe()
 
     def start(self):
-        """Start Flask server in a separate thread."""
+        """Start the web server in a separate thread: Flask (thread per client) or,
+        with camera['stream_server'] = 'asyncio', a single event loop for every client.
+        """
         log.info('Starting MJPEG streamer on http://%s:%d', self.host, self.port)
-        thread = threading.Thread(target=self._run_flask, daemon=True)
+        self.broadcaster.start()
+        self.telemetry.start()
+        if camera_conf.get('stream_server', 'flask') == 'asyncio':
+            self.async_server = AsyncStreamServer(self)
+            thread = threading.Thread(name='AsyncServer', target=self.async_server.run, daemon=True)
+        else:
+            thread = threading.Thread(target=self._run_flask, daemon=True)
         thread.start()
         return thread
 
@@ -573,4 +415,18 @@ class MJPEGStreamer:
 
     def stop(self):
         self._stopped = True
+        if self.async_server is not None:
+            self.async_server.stop()
+        self.broadcaster.stop()
+        self.telemetry.stop()
         log.info('MJPEG streamer stopped')
+
+class _SocketTakenOver(Response):
+    """Returned by views that used the raw socket themselves (WebSocket). The werkzeug server
+    treats the ConnectionError as a dropped connection and writes nothing more to it.
+    """
+    def __call__(self, environ, start_response):
+        raise ConnectionError('socket taken over by the view')
+
+def _round(value):
+    return round(value, 1) if value is not None else None
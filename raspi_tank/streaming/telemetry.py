@@ -0,0 +1,144 @@
+"""Push telemetry: one sampler shared by every dashboard, streamed as Server-Sent Events."""
+import json
+import logging
+import threading
+import time
+
+from raspi_tank.config import camera as camera_conf
+
+log = logging.getLogger('Telemetry')
+
+# /api/sensors field -> short key used on the wire
+KEYS = {
+    'front_distance': 'f',
+    'left_distance': 'l',
+    'right_distance': 'r',
+    'temperature': 't',
+    'pitch': 'p',
+    'roll': 'ro',
+    'yaw': 'y',
+    'qr_data': 'qr'
+}
+
+def compact(data):
+    """Short keys and one decimal: small messages, and sensor noise below 0.1 is not a change."""
+    out = {}
+    for name, key in KEYS.items():
+        value = data.get(name)
+        if isinstance(value, float):
+            value = round(value, 1)
+        out[key] = value
+    return out
+
+def sse_message(seq, payload):
+    return ('id: %d\ndata: %s\n\n' % (seq, json.dumps(payload, separators=(',', ':')))).encode('utf-8')
+
+SSE_KEEPALIVE = b': keepalive\n\n'
+SSE_RETRY = b'retry: 2000\n\n'  # browser reconnect delay (ms)
+
+_MISSING = object()
+
+class TelemetryHub:
+    """Samples source() at most camera['telemetry_max_hz'] times per second while anyone
+    is subscribed, and publishes a new version only when a value actually changed.
+
+    Viewers never read sensors themselves: they wait in wait_for_update() (or get a
+    listener callback) and send the keys that differ from what they sent last.
+    """
+    def __init__(self, source, max_hz=None):
+        self.source = source
+        self.max_hz = max_hz or camera_conf.get('telemetry_max_hz', 20)
+        self._cond = threading.Condition()
+        self._state = {}
+        self._seq = 0
+        self._subscribers = 0
+        self._listeners = []
+        self._stopped = False
+        self._thread = None
+        self.samples = 0
+        self.published = 0
+
+    def start(self):
+        self._thread = threading.Thread(name='Telemetry', target=self._run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+            self._cond.notify_all()
+
+    def unsubscribe(self):
+        with self._cond:
+            self._subscribers = max(0, self._subscribers - 1)
+
+    def add_listener(self, callback):
+        """Call callback(seq) from the sampler thread after each published change."""
+        with self._cond:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def latest(self):
+        with self._cond:
+            return self._seq, self._state
+
+    def wait_for_update(self, last_seq, timeout=1.0):
+        """Block until a version newer than last_seq exists. Returns (seq, state); state is
+        None on timeout. The state dict is replaced, never mutated, so it can be read freely.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._stopped or self._seq > last_seq, timeout)
+            if self._seq > last_seq:
+                return self._seq, self._state
+            return last_seq, None
+
+    def stats(self):
+        return {
+            'max_hz': self.max_hz,
+            'subscribers': self._subscribers,
+            'samples': self.samples,
+            'published': self.published,
+            'seq': self._seq
+        }
+
+    def _run(self):
+        period = 1.0 / self.max_hz
+        log.info('Telemetry sampler started (max %.0f Hz)', self.max_hz)
+        while not self._stopped:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or self._subscribers > 0)
+            if self._stopped:
+                break
+            t0 = time.monotonic()
+            try:
+                state = compact(self.source())
+                self.samples += 1
+                listeners = ()
+                with self._cond:
+                    if state != self._state:
+                        self._state = state
+                        self._seq += 1
+                        self.published += 1
+                        self._cond.notify_all()
+                        listeners = list(self._listeners)
+                for callback in listeners:
+                    callback(self._seq)
+            except Exception as e:
+                log.exception('Telemetry sampling error: %s', e)
+            delay = period - (time.monotonic() - t0)
+            if delay > 0:
+                time.sleep(delay)
+        log.info('Telemetry sampler stopped')
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+def delta(state, sent):
+    """Keys of state whose value differs from the last state sent to this viewer."""
+    return {k: v for k, v in state.items() if sent.get(k, _MISSING) != v}
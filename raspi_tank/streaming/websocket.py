@@ -0,0 +1,113 @@
+"""Minimal RFC 6455 WebSocket server side: handshake, frame encoding and an incremental decoder.
+
+Transport-free, so the Flask server (on the raw werkzeug socket) and the asyncio server
+share it: feed whatever bytes arrived to FrameDecoder and send encode_frame() output.
+"""
+import base64
+import hashlib
+import struct
+
+CONTINUATION, TEXT, BINARY, CLOSE, PING, PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+class ProtocolError(Exception):
+    pass
+
+def is_upgrade(headers):
+    """True if the (case-insensitive) request headers ask for a WebSocket upgrade."""
+    return ('websocket' in headers.get('upgrade', '').lower() and
+            'upgrade' in headers.get('connection', '').lower() and bool(headers.get('sec-websocket-key')))
+
+def handshake_response(key):
+    """The 101 response accepting a client's Sec-WebSocket-Key."""
+    accept = base64.b64encode(hashlib.sha1(key.strip().encode('ascii') + _GUID).digest())
+    return (b'HTTP/1.1 101 Switching Protocols\r\n'
+            b'Upgrade: websocket\r\n'
+            b'Connection: Upgrade\r\n'
+            b'Sec-WebSocket-Accept: ' + accept + b'\r\n\r\n')
+
+def encode_frame(opcode, payload=b''):
+    """One unmasked, unfragmented server frame."""
+    n = len(payload)
+    if n < 126:
+        head = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 65536:
+        head = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return head + payload
+
+def close_frame(code=1000):
+    return encode_frame(CLOSE, struct.pack('!H', code))
+
+class FrameDecoder:
+    """Turns received bytes into (opcode, payload) messages, reassembling fragments.
+    Client frames must be masked; messages larger than max_size raise ProtocolError.
+    """
+    def __init__(self, max_size=65536):
+        self.max_size = max_size
+        self._buf = bytearray()
+        self._fragments = None  # (opcode, [payloads]) of a fragmented message
+
+    def feed(self, data):
+        """Messages completed by data, in order."""
+        self._buf += data
+        messages = []
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                return messages
+            fin, opcode, payload = frame
+            if opcode >= CLOSE:
+                if not fin or len(payload) > 125:
+                    raise ProtocolError('bad control frame')
+                messages.append((opcode, payload))  # may arrive between fragments
+            elif opcode == CONTINUATION:
+                if self._fragments is None:
+                    raise ProtocolError('continuation without a first fragment')
+                self._fragments[1].append(payload)
+                if sum(len(p) for p in self._fragments[1]) > self.max_size:
+                    raise ProtocolError('message too large')
+                if fin:
+                    messages.append((self._fragments[0], b''.join(self._fragments[1])))
+                    self._fragments = None
+            elif self._fragments is not None:
+                raise ProtocolError('new message inside a fragmented one')
+            elif fin:
+                messages.append((opcode, payload))
+            else:
+                self._fragments = (opcode, [payload])
+
+    def _next_frame(self):
+        buf = self._buf
+        if len(buf) < 2:
+            return None
+        b0, b1 = buf[0], buf[1]
+        if b0 & 0x70:
+            raise ProtocolError('reserved bits set')
+        if not b1 & 0x80:
+            raise ProtocolError('client frame not masked')
+        n = b1 & 0x7F
+        pos = 2
+        if n == 126:
+            if len(buf) < 4:
+                return None
+            n = struct.unpack_from('!H', buf, 2)[0]
+            pos = 4
+        elif n == 127:
+            if len(buf) < 10:
+                return None
+            n = struct.unpack_from('!Q', buf, 2)[0]
+            pos = 10
+        if n > self.max_size:
+            raise ProtocolError('frame of %d bytes' % n)
+        if len(buf) < pos + 4 + n:
+            return None
+        mask = bytes(buf[pos:pos + 4])
+        data = bytes(buf[pos + 4:pos + 4 + n])
+        del buf[:pos + 4 + n]
+        # unmask with one big-int XOR instead of a per-byte loop
+        repeated = (mask * (n // 4 + 1))[:n]
+        payload = (int.from_bytes(data, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(n, 'big') if n else b''
+        return bool(b0 & 0x80), b0 & 0x0F, payload
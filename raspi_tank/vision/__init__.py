@@ -1,4 +1,6 @@
 from .camera import CameraWorker
 from .processor import FrameProcessor
+from .frame_buffer import FrameRing, FrameView
+from .pipeline import FrameQueue, PipelineStage
 
-__all__ = ['CameraWorker','FrameProcessor']
+__all__ = ['CameraWorker','FrameProcessor','FrameRing','FrameView','FrameQueue','PipelineStage']
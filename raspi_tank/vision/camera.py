@@ -1,95 +1,120 @@
-"""Camera worker: capture frames, analyze with FrameProcessor, display via cv2.imshow (X11).
+"""Camera worker: capture frames, analyze with FrameProcessor in a separate stage, display via cv2.imshow (X11).
 Accepts an I2C multiplexer instance to read sensor distances for overlay and safety decisions.
 """
+import collections
 import logging
 import time
 import cv2
 import threading
 
 from raspi_tank.vision.processor import FrameProcessor
+from raspi_tank.vision.frame_buffer import FrameRing
+from raspi_tank.vision.pipeline import FrameQueue, PipelineStage
+from raspi_tank.vision.offload import ProcessAnalyzer
+from raspi_tank.metrics import REGISTRY
 from raspi_tank.config import camera as camera_conf
 
 log = logging.getLogger('Camera')
 
+# a captured frame travelling through the pipeline: ring slot index, slot array, capture order and
+# wall-clock capture time (time.time() right after the read, comparable with the viewers' clocks)
+CapturedFrame = collections.namedtuple('CapturedFrame', ['index', 'slot', 'capture_seq', 'captured_at'])
+
+_CAPTURE_HELP = 'Capture sub-steps: reading a frame from the camera, converting it into the slot.'
+_CAPTURE_READ = REGISTRY.histogram('raspitank_capture_seconds', _CAPTURE_HELP, step='read')
+_CAPTURE_CONVERT = REGISTRY.histogram('raspitank_capture_seconds', _CAPTURE_HELP, step='convert')
+
 class CameraWorker:
-    def __init__(self, sensors=None):
+    def __init__(self, sensors=None, recorder=None, replay=None):
         self.sensors = sensors
+        self.recorder = recorder  # optional FlightRecorder, gets the metadata of every published frame
         self._stopped = False
         self.processor = FrameProcessor()
-        self.frame = None
-        self.annotated_frame = None
+        self.frame_count = 0
+        self.capture_count = 0
+        self._last_published_capture = 0
+        queue_size = camera_conf.get('pipeline_queue_size', 2)
+        workers = camera_conf.get('analysis_workers', 0)
+        # preallocated slots: capture writes in place, readers pin slots instead of copying.
+        # Frames waiting in the analyze queue (or in worker processes) hold a slot too, so size the ring for them.
+        # With worker processes the slots live in shared memory so frames are never pickled.
+        self.frames = FrameRing(max(camera_conf.get('frame_slots', 3), queue_size + 3 + workers * 2),
+                                shared=workers > 0)
+        self.frame_seq = 0  # incremented every time a new annotated frame is published
         self._frame_lock = threading.Lock()
+        self._frame_cond = threading.Condition(self._frame_lock)
 
-        # try picamera2 first, fallback to cv2.VideoCapture
-        try:
-            from picamera2 import Picamera2
-            self._use_picamera = True
-            self.camera = Picamera2()
-            
-            # Configure camera for video mode
-            config = self.camera.create_video_configuration(
-                main={"size": camera_conf['resolution'], "format": "RGB888"}
-            )
-            self.camera.configure(config)
-            self.camera.start()
-            log.info('Using Picamera2')
-        except Exception as e:
-            log.warning(f'Picamera2 not available: {e}')
+        self._yuv = camera_conf.get('pixel_format', 'BGR') == 'YUV420'
+        self._scratch = None
+
+        self.replay = replay  # optional ReplayFrames, replaces the camera
+        if replay is not None:
             self._use_picamera = False
-            self.cap = cv2.VideoCapture(0)
-            if camera_conf['resolution']:
-                w, h = camera_conf['resolution']
-                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
-                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
-            log.info('Using cv2.VideoCapture')
+            log.info('Replaying recorded frames instead of the camera')
+        else:
+            # try picamera2 first, fallback to cv2.VideoCapture
+            try:
+                from picamera2 import Picamera2
+                self._use_picamera = True
+                self.camera = Picamera2()
+            
+                # Configure camera for video mode (YUV420 skips colour conversion end to end)
+                fmt = 'YUV420' if self._yuv else 'RGB888'
+                config = self.camera.create_video_configuration(
+                    main={"size": camera_conf['resolution'], "format": fmt}
+                )
+                self.camera.configure(config)
+                self.camera.start()
+                log.info('Using Picamera2')
+            except Exception as e:
+                log.warning(f'Picamera2 not available: {e}')
+                self._use_picamera = False
+                self.cap = cv2.VideoCapture(0)
+                if camera_conf['resolution']:
+                    w, h = camera_conf['resolution']
+                    self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, w)
+                    self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, h)
+                log.info('Using cv2.VideoCapture')
+        self._capture_shape = None
+
+        # capture -> [queue] -> analyze/publish; encoding happens downstream in the streamer
+        self._analyze_queue = FrameQueue('analyze', queue_size,
+                                         camera_conf.get('pipeline_overflow', 'drop_oldest'),
+                                         on_drop=self._drop_item)
+        if replay is not None:
+            capture = self._capture_replay
+        else:
+            capture = self._capture_picamera if self._use_picamera else self._capture_cv2
+        self._capture_stage = PipelineStage('CaptureStage', capture, outbox=self._analyze_queue)
+        self._offload = None
+        if workers > 0:
+            # analyze stage only dispatches; results come back on the offload collector thread
+            self._offload = ProcessAnalyzer(workers, self._on_offload_result, max_attached=self.frames.size())
+            self._tracking_lock = threading.Lock()  # self.processor holds the QR tracking state for the workers
+            self._analyze_stage = PipelineStage('AnalyzeStage', self._submit_analysis, inbox=self._analyze_queue)
+        else:
+            self._analyze_stage = PipelineStage('AnalyzeStage', self._analyze, inbox=self._analyze_queue)
 
     def start(self):
+        """Run the capture stage in the calling thread; analysis runs in its own stage thread."""
         log.info('CameraWorker started')
-        frame_count = 0
         if self._use_picamera:
             log.info('Using Picamera2 for frame capture')
-            while not self._stopped:
-                try:
-                    # Capture frame from picamera2
-                    frame = self.camera.capture_array()
-                    # Convert RGB to BGR for OpenCV compatibility
-                    self.frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-                    annotated, results = self.processor.analyze(self.frame, self.sensors)
-                    with self._frame_lock:
-                        self.annotated_frame = annotated.copy()
-                    
-                    frame_count += 1
-                    if frame_count == 1:
-                        log.info('First camera frame captured successfully!')
-                    elif frame_count % 100 == 0:
-                        log.debug('Camera captured %d frames', frame_count)
-                    
-                    if camera_conf.get('show_window', False):
-                        cv2.imshow('RaspiTank', annotated)
-                        if cv2.waitKey(1) & 0xFF == ord('q'):
-                            break
-                except Exception as e:
-                    log.exception('Error capturing/processing frame: %s', e)
-                    time.sleep(0.1)
-        else:
-            while not self._stopped:
-                ret, frame = self.cap.read()
-                if not ret:
-                    time.sleep(0.1)
-                    continue
-                self.frame = frame
-                annotated, results = self.processor.analyze(frame, self.sensors)
-                with self._frame_lock:
-                    self.annotated_frame = annotated.copy()
-                if camera_conf.get('show_window', True):
-                    cv2.imshow('RaspiTank', annotated)
-                    if cv2.waitKey(1) & 0xFF == ord('q'):
-                        break
-                # small sleep so loop is not CPU bound
-                time.sleep(0.01)
+        if self._offload is not None:
+            self._offload.start()
+        self._analyze_stage.start()
+        # capture keeps the sensor's native rate, the analyze queue absorbs the difference
+        self._capture_stage.run()
+        self._analyze_stage.stop()
+        self._analyze_stage.join(2.0)
+        if self._offload is not None:
+            self._offload.stop()
+            self.frames.close()
         # cleanup
         try:
-            if self._use_picamera:
+            if self.replay is not None:
+                self.replay.close()
+            elif self._use_picamera:
                 self.camera.stop()
                 self.camera.close()
             else:
@@ -99,13 +124,224 @@ class CameraWorker:
             pass
         log.info('CameraWorker stopped')
 
+    def _capture_picamera(self):
+        """Capture stage (Picamera2). Returns (slot index, slot) or None when the frame is dropped."""
+        t0 = time.perf_counter()
+        frame = self.camera.capture_array()
+        t1 = time.perf_counter()
+        captured_at = time.time()
+        _CAPTURE_READ.observe(t1 - t0)
+        index, slot = self.frames.acquire_write(frame.shape)
+        if index is None:
+            return None  # every slot pinned by readers: drop this frame, never wait
+        try:
+            if self._yuv:
+                slot[...] = frame  # already planar I420: no colour conversion
+            else:
+                # Convert RGB to BGR for OpenCV compatibility, straight into the slot
+                cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=slot)
+        except Exception:
+            self.frames.abort(index)
+            raise
+        _CAPTURE_CONVERT.observe(time.perf_counter() - t1)
+        self.capture_count += 1
+        return CapturedFrame(index, slot, self.capture_count, captured_at)
+
+    def _capture_replay(self):
+        """Capture stage (replay). Frames are paced on the replay clock; as fast as possible, each
+        frame waits for the previous one to be published, so none is dropped and each is analyzed
+        with the sensor samples recorded up to its own time.
+        """
+        clock = self.replay.clock
+        if not clock.realtime:
+            self._wait_published(self.capture_count)
+        t0 = time.perf_counter()
+        frame, t = self.replay.read()
+        _CAPTURE_READ.observe(time.perf_counter() - t0)
+        captured_at = time.time()
+        if frame is None:
+            self._wait_published(self.capture_count)
+            log.info('Replay finished (%d frames)', self.capture_count)
+            self.stop()
+            return None
+        clock.start()
+        if clock.realtime:
+            clock.wait_until(t, lambda: self._stopped)
+        else:
+            clock.advance(t)
+        index, slot = self.frames.acquire_write(self._slot_shape(frame.shape))
+        if index is None:
+            return None  # every slot pinned by readers: drop this frame, as the camera would
+        t0 = time.perf_counter()
+        if self._yuv:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=slot)
+        else:
+            slot[...] = frame
+        _CAPTURE_CONVERT.observe(time.perf_counter() - t0)
+        self.capture_count += 1
+        return CapturedFrame(index, slot, self.capture_count, captured_at)
+
+    def _wait_published(self, capture_seq, timeout=1.0):
+        """Wait until the frame with this capture sequence number (or a later one) is published."""
+        with self._frame_cond:
+            self._frame_cond.wait_for(lambda: self._stopped or self._last_published_capture >= capture_seq, timeout)
+
+    def _capture_cv2(self):
+        """Capture stage (cv2.VideoCapture). Returns (slot index, slot) or None when no frame is produced."""
+        if self._capture_shape is None:
+            # probe frame tells us the real capture size
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.1)
+                return None
+            self._capture_shape = frame.shape
+            if self._yuv:
+                self._scratch = frame
+        index, slot = self.frames.acquire_write(self._slot_shape(self._capture_shape))
+        if index is None:
+            self.cap.grab()  # every slot pinned by readers: drop this frame, never wait
+            return None
+        # BGR frames are read straight into the slot; in YUV420 mode the webcam's BGR
+        # frame goes through a scratch buffer and is converted into the slot
+        target = self._scratch if self._yuv else slot
+        t0 = time.perf_counter()
+        ret, frame = self.cap.read(target)
+        _CAPTURE_READ.observe(time.perf_counter() - t0)
+        captured_at = time.time()
+        if not ret:
+            self.frames.abort(index)
+            time.sleep(0.1)
+            return None
+        if frame is not target:
+            # capture size changed: reallocate slots on the next frame
+            self.frames.abort(index)
+            self._capture_shape = None
+            return None
+        if self._yuv:
+            t0 = time.perf_counter()
+            cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420, dst=slot)
+            _CAPTURE_CONVERT.observe(time.perf_counter() - t0)
+        self.capture_count += 1
+        return CapturedFrame(index, slot, self.capture_count, captured_at)
+
+    def _slot_shape(self, shape):
+        h, w = shape[:2]
+        return (h * 3 // 2, w) if self._yuv else shape
+
+    def _sensor_snapshot(self):
+        return self.sensors.snapshot() if self.sensors is not None else None
+
+    def _analyze(self, item):
+        """Analyze stage: annotate the slot in place, publish it and optionally show it."""
+        try:
+            annotated, results = self.processor.analyze(item.slot, self._sensor_snapshot())
+        except Exception:
+            self.frames.abort(item.index)
+            raise
+        self._finish(item)
+        return item.index
+
+    def _submit_analysis(self, item):
+        """Analyze stage (offload mode): hand the shared slot to a worker process."""
+        with self._tracking_lock:
+            state = self.processor.job_state()
+        if not self._offload.submit(item, self.frames.slot_name(item.index), item.slot.shape,
+                                    item.slot.dtype, self._sensor_snapshot(), state):
+            self.frames.abort(item.index)  # workers saturated: drop this frame
+            return None
+        return item.index
+
+    def _on_offload_result(self, item, results, error):
+        """Collector thread: publish a frame annotated by a worker process."""
+        if error is not None or item.capture_seq <= self._last_published_capture:
+            # failed, or overtaken by a newer frame from another worker
+            self.frames.abort(item.index)
+            return
+        with self._tracking_lock:
+            self.processor.merge_tracking_state(results['tracking'])
+        self._finish(item)
+
+    def _finish(self, item):
+        """Publish an annotated frame, log progress and optionally show it."""
+        self._last_published_capture = item.capture_seq
+        self._publish(item.index, item.captured_at)
+        if self.recorder is not None:
+            self.recorder.record_frame(self.frame_seq, item.capture_seq, item.slot.shape)
+
+        self.frame_count += 1
+        if self.frame_count == 1:
+            log.info('First camera frame captured successfully!')
+        elif self.frame_count % 100 == 0:
+            log.debug('Camera analyzed %d frames', self.frame_count)
+
+        if camera_conf.get('show_window', False):
+            frame = item.slot
+            if frame.ndim == 2:
+                frame = frame[:frame.shape[0] * 2 // 3]  # show the Y plane of I420 frames
+            cv2.imshow('RaspiTank', frame)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                self.stop()
+
+    def _drop_item(self, item):
+        # frame evicted from a stage queue: give its slot back
+        self.frames.abort(item.index)
+
+    def pipeline_stats(self):
+        """Per-stage rates, queue depths and drop counts."""
+        stats = {
+            'capture': self._capture_stage.stats(),
+            'analyze': dict(self._analyze_stage.stats(), queue=self._analyze_queue.stats()),
+            'frame_ring': {'slots': self.frames.size(), 'dropped': self.frames.dropped},
+            'frame_seq': self.frame_seq
+        }
+        if self._offload is not None:
+            stats['offload'] = self._offload.stats()
+        return stats
+
+    def _publish(self, index, captured_at=None):
+        """Publish an annotated slot, bump the sequence number and wake waiting consumers."""
+        with self._frame_cond:
+            self.frame_seq += 1
+            self.frames.publish(index, self.frame_seq, captured_at)
+            self._frame_cond.notify_all()
+
     def read(self):
-        return self.frame
+        """A private copy of the latest annotated frame, or None (see get_latest_annotated_frame).
+        Ring slots are rewritten by the capture stage, so they are never handed out unpinned;
+        use acquire_latest_frame() to read one without copying.
+        """
+        return self.get_latest_annotated_frame()
+
+    def acquire_latest_frame(self):
+        """Pin the latest annotated frame without copying. Returns a read-only FrameView (release it!) or None."""
+        return self.frames.acquire_latest()
 
     def get_latest_annotated_frame(self):
-        """Return the latest annotated frame for streaming (thread-safe)."""
-        with self._frame_lock:
-            return self.annotated_frame.copy() if self.annotated_frame is not None else None
+        """Return a private copy of the latest annotated frame (thread-safe).
+        Prefer acquire_latest_frame()/wait_for_frame() on hot paths: they do not copy.
+        """
+        view = self.frames.acquire_latest()
+        if view is None:
+            return None
+        with view:
+            return view.array.copy()
+
+    def wait_for_frame(self, last_seq, timeout=1.0):
+        """Block until a frame newer than last_seq is published.
+        Returns (seq, FrameView) or (last_seq, None) on timeout/stop. The caller must release the view.
+        """
+        with self._frame_cond:
+            self._frame_cond.wait_for(lambda: self._stopped or self.frame_seq > last_seq, timeout)
+            if self.frame_seq <= last_seq:
+                return last_seq, None
+        view = self.frames.acquire_latest()
+        if view is None:
+            return last_seq, None
+        return view.seq, view
 
     def stop(self):
-        self._stopped = True
+        with self._frame_cond:
+            self._stopped = True
+            self._frame_cond.notify_all()
+        self._capture_stage.stop()
+        self._analyze_stage.stop()
@@ -0,0 +1,148 @@
+"""Copy-free frame handoff: a small ring of preallocated frame slots with reference-counted readers."""
+import logging
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+log = logging.getLogger('FrameRing')
+
+class FrameView:
+    """Read-only view of a published frame slot.
+
+    The slot stays pinned (never reused by the writer) until release() is called,
+    so the view can be encoded or displayed without copying. Use as a context manager.
+    """
+    def __init__(self, ring, index, seq, captured_at=None):
+        self._ring = ring
+        self._index = index
+        self.seq = seq
+        self.captured_at = captured_at  # wall-clock time (time.time()) the frame was read from the camera
+        self.array = ring._slots[index].view()
+        self.array.flags.writeable = False
+
+    def release(self):
+        if self._ring is not None:
+            self._ring._release(self._index)
+            self._ring = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+    def __del__(self):
+        # safety net for readers that forget to release
+        self.release()
+
+class FrameRing:
+    """Preallocated frame slots shared by one writer and any number of readers.
+
+    The writer grabs a free slot with acquire_write(), fills it in place and publish()es it.
+    A slot is free when it is not the latest frame, not being written and has no readers.
+    acquire_write() never blocks: if every slot is pinned it returns None and the frame is dropped.
+    Readers get FrameView objects that pin a slot without copying it.
+    With shared=True every slot lives in a multiprocessing.shared_memory block, so worker
+    processes can attach to it by name (see slot_name()) and work on the frame in place.
+    """
+    def __init__(self, slots=3, shared=False):
+        if slots < 3:
+            raise ValueError('FrameRing needs at least 3 slots (latest, writing, spare)')
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._slots = [None] * slots
+        self._shm = [None] * slots
+        self._refs = [0] * slots
+        self._seqs = [0] * slots
+        self._stamps = [None] * slots
+        self._writing = [False] * slots
+        self._latest = None
+        self.dropped = 0
+
+    def acquire_write(self, shape, dtype=np.uint8):
+        """Reserve a free slot for writing. Returns (index, writable array) or (None, None) if all slots are pinned."""
+        with self._lock:
+            for i in range(len(self._slots)):
+                if i == self._latest or self._writing[i] or self._refs[i] > 0:
+                    continue
+                self._writing[i] = True
+                break
+            else:
+                self.dropped += 1
+                return None, None
+        slot = self._slots[i]
+        if slot is None or slot.shape != tuple(shape) or slot.dtype != dtype:
+            # allocated once per slot (or on resolution change), then reused forever
+            slot = self._allocate(i, shape, np.dtype(dtype))
+            log.debug('Allocated frame slot %d %s%s', i, shape, ' (shared)' if self.shared else '')
+        return i, slot
+
+    def _allocate(self, index, shape, dtype):
+        if not self.shared:
+            slot = np.empty(shape, dtype)
+        else:
+            self._free_shm(index)
+            shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+            self._shm[index] = shm
+            slot = np.ndarray(shape, dtype, buffer=shm.buf)
+        self._slots[index] = slot
+        return slot
+
+    def _free_shm(self, index):
+        shm = self._shm[index]
+        if shm is None:
+            return
+        self._shm[index] = None
+        try:
+            shm.unlink()
+            shm.close()
+        except BufferError:
+            pass  # an old view still exports the buffer; the mapping goes away with it
+        except Exception as e:
+            log.warning('Error releasing shared frame slot %d: %s', index, e)
+
+    def slot_name(self, index):
+        """Shared-memory block name of a slot (shared rings only)."""
+        return self._shm[index].name
+
+    def close(self):
+        """Release shared-memory blocks. The ring must not be used afterwards."""
+        if self.shared:
+            self._slots = [None] * len(self._slots)
+            for i in range(len(self._shm)):
+                self._free_shm(i)
+
+    def publish(self, index, seq, captured_at=None):
+        """Make a written slot the latest frame, optionally stamped with its capture time."""
+        with self._lock:
+            self._writing[index] = False
+            self._seqs[index] = seq
+            self._stamps[index] = captured_at
+            self._latest = index
+
+    def abort(self, index):
+        """Give back a slot reserved with acquire_write() without publishing it."""
+        with self._lock:
+            self._writing[index] = False
+
+    def acquire_latest(self):
+        """Pin the latest published slot. Returns a FrameView or None if nothing was published yet."""
+        with self._lock:
+            if self._latest is None:
+                return None
+            index = self._latest
+            self._refs[index] += 1
+            seq = self._seqs[index]
+            captured_at = self._stamps[index]
+        return FrameView(self, index, seq, captured_at)
+
+    def size(self):
+        return len(self._slots)
+
+    def latest_seq(self):
+        with self._lock:
+            return self._seqs[self._latest] if self._latest is not None else 0
+
+    def _release(self, index):
+        with self._lock:
+            self._refs[index] -= 1
@@ -0,0 +1,174 @@
+"""Process-pool offload of FrameProcessor.analyze: frames travel through shared-memory slots, never pickled."""
+import collections
+import logging
+import multiprocessing
+import queue
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+log = logging.getLogger('Offload')
+
+def _attach(name):
+    """Map a block created by the owner without registering it with the resource tracker.
+    Spawned workers share the owner's tracker, which keeps a set of names: a worker's
+    register/unregister would drop the owner's entry (KeyError when the owner unlinks, and no
+    cleanup of leaked blocks if the owner crashes).
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python >= 3.13
+    except TypeError:
+        pass
+    # before 3.13 attaching registers the block too: skip that call while mapping it
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+def _close(shm):
+    try:
+        shm.close()
+    except Exception:
+        pass
+
+def _worker_main(tasks, results, max_attached):
+    """Worker process: analyze frames in place in their shared-memory slot.
+    The QR tracking state arrives with each frame and goes back with its results, so every
+    worker continues from the latest published frame instead of from the frames it saw.
+    """
+    from raspi_tank.vision.processor import FrameProcessor
+    processor = FrameProcessor()
+    attached = collections.OrderedDict()  # slot name -> mapping, least recently used first
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        task_id, name, shape, dtype, snapshot, state = task
+        try:
+            shm = attached.pop(name, None)
+            if shm is None:
+                shm = _attach(name)
+                # slots reallocated by the owner (new resolution) are never used again
+                while len(attached) >= max_attached:
+                    _close(attached.popitem(last=False)[1])
+            attached[name] = shm
+            frame = np.ndarray(shape, dtype, buffer=shm.buf)
+            if state is not None:
+                processor.set_tracking_state(state)
+            _, res = processor.analyze(frame, snapshot)
+            del frame
+            res['tracking'] = processor.tracking_state()
+            results.put((task_id, res, None))
+        except Exception as e:
+            results.put((task_id, None, repr(e)))
+    for shm in attached.values():
+        _close(shm)
+
+class ProcessAnalyzer:
+    """Runs FrameProcessor.analyze in worker processes, asynchronously.
+
+    submit() hands a shared-memory slot to the pool and returns immediately (it only waits
+    while max_in_flight frames are already being processed). Results and the in-place
+    overlay come back on a collector thread, which calls on_result(item, results, error).
+    Results can complete out of order when more than one worker is used. Each worker keeps
+    at most max_attached slot mappings (the ring size), closing the least recently used.
+    """
+    def __init__(self, workers, on_result, max_in_flight=None, max_attached=8):
+        self.workers = workers
+        self.max_attached = max_attached
+        self.on_result = on_result
+        self._ctx = multiprocessing.get_context('spawn')  # never fork a process with camera/Flask threads
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._credits = threading.Semaphore(max_in_flight or workers * 2)
+        self._pending = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._procs = []
+        self._collector = None
+        self._stopped = False
+        self.completed = 0
+        self.errors = 0
+
+    def start(self):
+        for i in range(self.workers):
+            p = self._ctx.Process(name='AnalyzeWorker-%d' % i, target=_worker_main,
+                                  args=(self._tasks, self._results, self.max_attached), daemon=True)
+            p.start()
+            self._procs.append(p)
+        self._collector = threading.Thread(name='AnalyzeCollector', target=self._collect, daemon=True)
+        self._collector.start()
+        log.info('Started %d analysis worker processes', self.workers)
+
+    def submit(self, item, name, shape, dtype, snapshot=None, state=None, timeout=0.5):
+        """Queue a frame for analysis with the SensorSnapshot to overlay (a small picklable tuple)
+        and the FrameProcessor tracking state to continue from. Returns False if no worker
+        freed up within timeout.
+        """
+        if self._stopped or not self._credits.acquire(timeout=timeout):
+            return False
+        with self._lock:
+            task_id = self._next_id
+            self._next_id += 1
+            self._pending[task_id] = item
+        self._tasks.put((task_id, name, tuple(shape), np.dtype(dtype).str, snapshot, state))
+        return True
+
+    def _collect(self):
+        while not self._stopped:
+            try:
+                task_id, res, error = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                item = self._pending.pop(task_id, None)
+            self._credits.release()
+            if error is not None:
+                self.errors += 1
+                log.error('Analysis worker error: %s', error)
+            else:
+                self.completed += 1
+            if item is None:
+                continue
+            try:
+                self.on_result(item, res, error)
+            except Exception as e:
+                log.exception('Error handling analysis result: %s', e)
+
+    def in_flight(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'in_flight': len(self._pending),
+            'completed': self.completed,
+            'errors': self.errors
+        }
+
+    def stop(self):
+        self._stopped = True
+        for _ in self._procs:
+            try:
+                self._tasks.put(None)
+            except Exception:
+                pass
+        for p in self._procs:
+            p.join(2.0)
+            if p.is_alive():
+                p.terminate()
+        # hand slots of unfinished frames back to the owner
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for item in pending:
+            try:
+                self.on_result(item, None, 'stopped')
+            except Exception:
+                pass
+        log.info('Analysis workers stopped')
@@ -0,0 +1,164 @@
+"""Staged frame pipeline: one thread per stage, bounded queues with an overflow policy in between."""
+import collections
+import logging
+import threading
+import time
+
+from raspi_tank.metrics import REGISTRY
+
+log = logging.getLogger('Pipeline')
+
+OVERFLOW_POLICIES = ('drop_oldest', 'latest_only', 'drop_newest')
+
+class FrameQueue:
+    """Bounded hand-off queue between two stages. put() never blocks the producer.
+
+    Overflow policies:
+    - drop_oldest: evict the oldest queued item to make room for the new one
+    - latest_only: keep only the newest item (any queued item is evicted)
+    - drop_newest: reject the incoming item, keep what is queued
+    Evicted or rejected items are passed to on_drop so their resources can be returned.
+    """
+    def __init__(self, name, maxsize=2, policy='drop_oldest', on_drop=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError('Unknown overflow policy %r (expected one of %s)' % (policy, ', '.join(OVERFLOW_POLICIES)))
+        self.name = name
+        self.maxsize = 1 if policy == 'latest_only' else max(1, maxsize)
+        self.policy = policy
+        self._on_drop = on_drop
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.put_count = 0
+        self.dropped = 0
+        REGISTRY.gauge('raspitank_queue_depth', 'Items waiting in each pipeline queue.', self.depth, queue=name)
+
+    def put(self, item):
+        evicted = []
+        with self._cond:
+            self.put_count += 1
+            if self._closed:
+                evicted.append(item)
+                item = None
+            elif len(self._items) >= self.maxsize:
+                if self.policy == 'drop_newest':
+                    evicted.append(item)
+                    item = None
+                else:
+                    while len(self._items) >= self.maxsize:
+                        evicted.append(self._items.popleft())
+            if item is not None:
+                self._items.append(item)
+                self._cond.notify()
+            self.dropped += len(evicted)
+        if self._on_drop is not None:
+            for old in evicted:
+                self._on_drop(old)
+
+    def get(self, timeout=0.5):
+        """Return the next item, or None on timeout/close."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._closed or self._items, timeout)
+            if self._items:
+                return self._items.popleft()
+            return None
+
+    def close(self):
+        """Wake consumers and hand any queued item back to on_drop."""
+        with self._cond:
+            self._closed = True
+            leftover = list(self._items)
+            self._items.clear()
+            self._cond.notify_all()
+        if self._on_drop is not None:
+            for old in leftover:
+                self._on_drop(old)
+
+    def depth(self):
+        return len(self._items)
+
+    def stats(self):
+        return {
+            'depth': len(self._items),
+            'maxsize': self.maxsize,
+            'policy': self.policy,
+            'put': self.put_count,
+            'dropped': self.dropped
+        }
+
+class PipelineStage:
+    """A thread that takes items from inbox, runs fn(item) and puts the result into outbox.
+
+    With no inbox the stage is a source: fn() is called in a loop and produces items.
+    fn may return None to produce nothing for that round.
+    """
+    def __init__(self, name, fn, inbox=None, outbox=None):
+        self.name = name
+        self.fn = fn
+        self.inbox = inbox
+        self.outbox = outbox
+        self._stopped = False
+        self._thread = None
+        self.processed = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.rate = 0.0  # items/s, exponentially smoothed
+        self._last_out = None
+        self._timer = REGISTRY.histogram('raspitank_stage_seconds', 'Time per item in each pipeline stage.', stage=name)
+        REGISTRY.gauge('raspitank_stage_rate_hz', 'Items per second out of each pipeline stage.',
+                       lambda: self.rate, stage=name)
+
+    def start(self):
+        self._thread = threading.Thread(name=self.name, target=self.run, daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def run(self):
+        log.info('Stage %s started', self.name)
+        while not self._stopped:
+            if self.inbox is not None:
+                item = self.inbox.get()
+                if item is None:
+                    continue
+                args = (item,)
+            else:
+                args = ()
+            t0 = time.perf_counter()
+            try:
+                out = self.fn(*args)
+            except Exception as e:
+                self.errors += 1
+                log.exception('Stage %s error: %s', self.name, e)
+                time.sleep(0.1)
+                continue
+            t1 = time.perf_counter()
+            self.busy_s += t1 - t0
+            if out is None:
+                continue
+            self._timer.observe(t1 - t0)
+            self.processed += 1
+            if self._last_out is not None:
+                dt = t1 - self._last_out
+                if dt > 0:
+                    self.rate = 1.0 / dt if self.rate == 0.0 else 0.9 * self.rate + 0.1 / dt
+            self._last_out = t1
+            if self.outbox is not None:
+                self.outbox.put(out)
+        log.info('Stage %s stopped (%d items)', self.name, self.processed)
+
+    def stop(self):
+        self._stopped = True
+        if self.inbox is not None:
+            self.inbox.close()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            'processed': self.processed,
+            'errors': self.errors,
+            'rate_fps': round(self.rate, 1),
+            'busy_s': round(self.busy_s, 3)
+        }
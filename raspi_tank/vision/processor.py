@@ -1,53 +1,158 @@
 """Frame processing: obstacle overlay and QR decoding using OpenCV."""
 import logging
+import time
 import cv2
 import numpy as np
 
+from raspi_tank.config import vision as vision_conf, laser as laser_conf
+from raspi_tank.metrics import REGISTRY
+
 log = logging.getLogger('Processor')
 
+_STEPS = {step: REGISTRY.histogram('raspitank_analyze_seconds', 'FrameProcessor.analyze sub-steps.', step=step)
+          for step in ('grayscale', 'qr', 'overlay', 'canny', 'thumbnail')}
+
+def _ink(canvas, bgr):
+    """Overlay colour for the canvas: BGR on colour frames, white on a Y (luma) plane."""
+    return bgr if canvas.ndim == 3 else 255
+
 class FrameProcessor:
     def __init__(self):
         self.qr_detector = cv2.QRCodeDetector()
         self.last_qr_data = None
+        self.last_qr_time = 0.0
+        self.qr_mode = vision_conf.get('qr_mode', 'fast')
+        self._frame_index = 0
+        self._qr_points = None  # last corners (full-res coords) while a code is tracked
+        self._qr_misses = 0
 
-    def analyze(self, frame, sensors=None):
-        """Analyze a frame. Returns annotated frame and a dict with analysis results."""
+    def analyze(self, frame, snapshot=None):
+        """Analyze a frame. Returns annotated frame and a dict with analysis results.
+        snapshot is the current SensorSnapshot (or None), used for the obstacle overlay.
+        Accepts BGR frames or planar YUV420 (I420) frames; on I420 the Y plane is used as the
+        grayscale image and overlays are drawn on it (luma only, in white).
+        """
         results = {'qr_data': None, 'obstacle': False}
+        clock = time.perf_counter
+        t0 = clock()
 
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if frame.ndim == 2:
+            # I420: the Y plane already is the grayscale image, no conversion needed
+            gray = frame[:frame.shape[0] * 2 // 3]
+            canvas = gray
+        else:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            canvas = frame
+        t1 = clock()
+        _STEPS['grayscale'].observe(t1 - t0)
 
         # QR detection
-        data, points, _ = self.qr_detector.detectAndDecode(frame)
+        if self.qr_mode == 'full':
+            data, points, _ = self.qr_detector.detectAndDecode(canvas)
+        else:
+            data, points = self._detect_qr_fast(gray)
+        t2 = clock()
+        _STEPS['qr'].observe(t2 - t1)
+        now = time.monotonic()
         if data:
             results['qr_data'] = data
             self.last_qr_data = data
-            if points is not None:
-                pts = points.astype(int).reshape((-1,2))
-                cv2.polylines(frame, [pts], isClosed=True, color=(0,255,0), thickness=2)
-                cv2.putText(frame, data, tuple(pts[0]), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,255,0), 2)
-        else:
-            # Clear last QR data after 2 seconds (approximate)
-            pass
-
-        # Simple obstacle visual indicator using sensors front distance if provided
-        if sensors is not None:
-            try:
-                front = sensors.front.distance
-                if front is not None:
-                    cv2.putText(frame, f'Front: {front:.1f} cm', (10,30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0,200,200), 2)
-                    if front < 40:
-                        results['obstacle'] = True
-                        cv2.putText(frame, 'OBSTACLE!', (10,60), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0,0,255), 3)
-            except Exception:
-                pass
+            self.last_qr_time = now
+        elif self.last_qr_data is not None and now - self.last_qr_time > vision_conf.get('qr_ttl_s', 2.0):
+            # Clear last QR data once it is older than the TTL
+            self.last_qr_data = None
+        if points is not None and self.last_qr_data:
+            pts = points.astype(int).reshape((-1,2))
+            cv2.polylines(canvas, [pts], isClosed=True, color=_ink(canvas, (0,255,0)), thickness=2)
+            cv2.putText(canvas, self.last_qr_data, tuple(pts[0]), cv2.FONT_HERSHEY_SIMPLEX, 0.6, _ink(canvas, (0,255,0)), 2)
+
+        # Simple obstacle visual indicator using the snapshot's front distance if provided
+        front = snapshot.front if snapshot is not None else None
+        if front is not None:
+            cv2.putText(canvas, f'Front: {front:.1f} cm', (10,30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, _ink(canvas, (0,200,200)), 2)
+            if front < laser_conf['front_threshold_cm']:
+                results['obstacle'] = True
+                cv2.putText(canvas, 'OBSTACLE!', (10,60), cv2.FONT_HERSHEY_SIMPLEX, 1.0, _ink(canvas, (0,0,255)), 3)
+
+        t3 = clock()
+        _STEPS['overlay'].observe(t3 - t2)
 
         # Additional visual processing: edges
         edges = cv2.Canny(gray, 50, 150)
+        t4 = clock()
+        _STEPS['canny'].observe(t4 - t3)
         # blend edges on top-left corner as a small thumbnail
-        h, w = frame.shape[:2]
+        h, w = canvas.shape[:2]
         th, tw = int(h*0.25), int(w*0.25)
         small_edges = cv2.resize(edges, (tw, th))
-        small_edges_col = cv2.cvtColor(small_edges, cv2.COLOR_GRAY2BGR)
-        frame[0:th, 0:tw] = small_edges_col
+        if canvas.ndim == 2:
+            canvas[0:th, 0:tw] = small_edges
+        else:
+            canvas[0:th, 0:tw] = cv2.cvtColor(small_edges, cv2.COLOR_GRAY2BGR)
+        _STEPS['thumbnail'].observe(clock() - t4)
 
         return frame, results
+
+    def tracking_state(self):
+        """QR tracking state (last code and its time, frame counter, tracked corners, misses),
+        so analysis can continue in another process.
+        """
+        return (self.last_qr_data, self.last_qr_time, self._frame_index, self._qr_points, self._qr_misses)
+
+    def set_tracking_state(self, state):
+        (self.last_qr_data, self.last_qr_time, self._frame_index,
+         self._qr_points, self._qr_misses) = state
+
+    def job_state(self):
+        """tracking_state() to send with a frame analyzed elsewhere. Counts that frame, as
+        analyze() would, so frames in flight at the same time keep the decimation.
+        """
+        state = self.tracking_state()
+        self._frame_index += 1
+        return state
+
+    def merge_tracking_state(self, state):
+        """Adopt the state a job returned. The frame counter is kept, since it already counts
+        the frames still in flight, unless the job lost the code (which restarts the search).
+        """
+        data, at, _, points, misses = state
+        if points is None and self._qr_points is not None:
+            self._frame_index = 0
+        self.last_qr_data, self.last_qr_time, self._qr_points, self._qr_misses = data, at, points, misses
+
+    def _detect_qr_fast(self, gray):
+        """QR search on the grayscale image: padded ROI around the last corners while a code
+        is tracked, otherwise a downscaled full-frame search every N frames.
+        Returns (data, points) with points in full-resolution coordinates; data is '' when
+        nothing was decoded this frame, points is None when no code is tracked.
+        """
+        self._frame_index += 1
+        if self._qr_points is not None:
+            h, w = gray.shape[:2]
+            x0, y0 = self._qr_points.min(axis=0)
+            x1, y1 = self._qr_points.max(axis=0)
+            pad = max(x1 - x0, y1 - y0) * vision_conf.get('qr_roi_padding', 0.5)
+            x0, y0 = max(0, int(x0 - pad)), max(0, int(y0 - pad))
+            x1, y1 = min(w, int(x1 + pad) + 1), min(h, int(y1 + pad) + 1)
+            data, points, _ = self.qr_detector.detectAndDecode(gray[y0:y1, x0:x1])
+            if points is not None:
+                self._qr_points = points.reshape((-1, 2)) + (x0, y0)
+                self._qr_misses = 0
+                return data, self._qr_points
+            self._qr_misses += 1
+            if self._qr_misses <= vision_conf.get('qr_roi_max_misses', 2):
+                return '', self._qr_points
+            # code lost: fall back to the decimated full-frame search
+            self._qr_points = None
+            self._frame_index = 0
+
+        if (self._frame_index - 1) % max(1, vision_conf.get('qr_every_n_frames', 3)) != 0:
+            return '', None
+        scale = vision_conf.get('qr_downscale', 0.5)
+        small = gray if scale >= 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        data, points, _ = self.qr_detector.detectAndDecode(small)
+        if points is None:
+            return '', None
+        self._qr_points = points.reshape((-1, 2)) / min(scale, 1.0)
+        self._qr_misses = 0
+        return data, self._qr_points